@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from bybit_api import BybitAPI
+from metrics import REGISTRY
+from config import BYBIT_API_KEY, BYBIT_API_SECRET, BYBIT_ACCOUNTS, TRADE_MAX_OPEN_POSITIONS
+
+ORDER_SECONDS = REGISTRY.histogram("accounts_order_seconds", "Размещение ордера на одном аккаунте, с", ("account",))
+ORDERS = REGISTRY.counter("accounts_orders_total", "Ордеров по аккаунтам и результату", ("account", "result"))
+
+# Результат по аккаунту: order_id при успехе, иначе error; rejected — ордер не отправлялся (лимит, проверка)
+AccountResult = namedtuple("AccountResult", ["account", "order_id", "qty", "error", "rejected"])
+# Проверенный ордер одного аккаунта, готовый к отправке: validation — результат OrderValidator
+PreparedOrder = namedtuple("PreparedOrder", ["profile", "symbol", "validation"])
+
+class AccountProfile:
+    """Аккаунт Bybit (основной или суб-аккаунт): ключи, множитель объема и лимит открытых сделок."""
+
+    def __init__(self, name, api_key=None, api_secret=None, size_multiplier=1.0, max_trades=TRADE_MAX_OPEN_POSITIONS, bybit=None):
+        self.name = name
+        self.size_multiplier = size_multiplier
+        self.max_trades = max_trades
+        # У каждого аккаунта свой клиент: своя подпись запросов и свой пул HTTP-соединений
+        self.bybit = bybit or BybitAPI(api_key, api_secret)
+
+    def __repr__(self):
+        return f"AccountProfile({self.name}, x{self.size_multiplier:g}, max {self.max_trades})"
+
+def load_profiles(primary_bybit=None, names=BYBIT_ACCOUNTS):
+    """Профили из окружения.
+
+    BYBIT_ACCOUNTS — имена через запятую; для имени NAME читаются BYBIT_API_KEY_NAME, BYBIT_API_SECRET_NAME,
+    BYBIT_SIZE_MULTIPLIER_NAME (по умолчанию 1) и BYBIT_MAX_TRADES_NAME (по умолчанию TRADE_MAX_OPEN_POSITIONS).
+    Основной аккаунт "main" использует BYBIT_API_KEY/BYBIT_API_SECRET и общий клиент primary_bybit.
+    """
+    profiles = []
+    for name in [name.strip() for name in (names or "main").split(",") if name.strip()]:
+        suffix = name.upper()
+        multiplier = float(os.getenv(f"BYBIT_SIZE_MULTIPLIER_{suffix}", "1"))
+        max_trades = int(os.getenv(f"BYBIT_MAX_TRADES_{suffix}", str(TRADE_MAX_OPEN_POSITIONS)))
+        if name == "main":
+            profiles.append(AccountProfile(name, BYBIT_API_KEY, BYBIT_API_SECRET, multiplier, max_trades, bybit=primary_bybit))
+        else:
+            profiles.append(AccountProfile(name, os.getenv(f"BYBIT_API_KEY_{suffix}"), os.getenv(f"BYBIT_API_SECRET_{suffix}"),
+                                           multiplier, max_trades))
+    return profiles
+
+class AccountPool:
+    """Параллельное размещение одного ордера на всех аккаунтах.
+
+    Потоки пула живут все время работы, так что соединения клиентов аккаунтов переиспользуются
+    между сделками. На каждом аккаунте независимо: масштабирование объема и локальная проверка
+    ордера (OrderValidator), проверка лимита открытых сделок, затем place_limit_order. Проверку можно
+    выполнить заранее (prepare), а отправку — позже одним вызовом для нескольких сделок (submit).
+    """
+
+    def __init__(self, profiles, orders_per_account=4):
+        self.logger = logging.getLogger(__name__)
+        self.profiles = list(profiles)
+        # Несколько потоков на аккаунт: ордера нескольких монет одной группы уходят одновременно
+        self.executor = ThreadPoolExecutor(max_workers=max(len(self.profiles), 1) * orders_per_account, thread_name_prefix="account")
+        self.submit_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def open_positions(self):
+        """{имя аккаунта: число открытых позиций}, запросы выполняются параллельно."""
+        counts = self.executor.map(lambda profile: profile.bybit.get_open_positions(), self.profiles)
+        return {profile.name: count for profile, count in zip(self.profiles, counts)}
+
+    def prepare(self, trade, validator, market_price=None):
+        """Объем с множителем и локальная проверка ордера на каждом аккаунте, без запросов к бирже."""
+        prepared = []
+        for profile in self.profiles:
+            # Округление убирает хвост умножения float (0.7 * 3 = 2.0999999999999996) до выравнивания на qtyStep
+            qty = round(trade["qty"] * profile.size_multiplier, 12)
+            prepared.append(PreparedOrder(profile, trade["coin"], validator.validate(dict(trade, qty=qty), market_price)))
+        return prepared
+
+    def place(self, trade, validator, market_price=None):
+        """Размещает сделку на всех аккаунтах параллельно и возвращает список AccountResult."""
+        return self.submit(self.prepare(trade, validator, market_price))
+
+    def submit(self, prepared):
+        """Отправляет подготовленные ордера параллельно; результаты — в порядке prepared.
+
+        Открытые позиции читаются один раз на аккаунт до отправки, и ордерам аккаунта в порядке
+        prepared раздаются только свободные места max_trades − открытые: ордера нескольких монет
+        одной группы не проходят проверку лимита одновременно. Отправки из разных потоков
+        (TradeManager и быстрый путь) выполняются по очереди, чтобы лимит считался по актуальным позициям.
+        """
+        with self.submit_lock:
+            profiles = list({order.profile.name: order.profile for order in prepared}.values())
+            counts = dict(zip([profile.name for profile in profiles],
+                              self.executor.map(lambda profile: profile.bybit.get_open_positions(), profiles)))
+            free = {profile.name: profile.max_trades - counts[profile.name] for profile in profiles}
+            results = [None] * len(prepared)
+            futures = []
+            for idx, order in enumerate(prepared):
+                profile, validation = order.profile, order.validation
+                if validation.error:
+                    results[idx] = self._result(profile, None, None, validation.error, True)
+                elif free[profile.name] <= 0:
+                    results[idx] = self._result(profile, None, None, "лимит сделок", True)
+                else:
+                    free[profile.name] -= 1
+                    futures.append((idx, self.executor.submit(self._submit_one, order)))
+            for idx, future in futures:
+                results[idx] = future.result()
+            return results
+
+    def _submit_one(self, prepared):
+        profile, symbol, validation = prepared
+        started = time.monotonic()
+        try:
+            order = validation.order
+            order_id = profile.bybit.place_limit_order(
+                symbol=order["symbol"],
+                side=order["side"],
+                qty=order["qty"],
+                price=order["price"],
+                take_profit=order["take_profit"],
+                stop_loss=order["stop_loss"]
+            )
+            return self._result(profile, order_id, order["qty"], None if order_id else "биржа отклонила ордер", False)
+        except Exception as e:
+            self.logger.error(f"Аккаунт {profile.name}: ошибка размещения ордера {symbol}: {e}")
+            return self._result(profile, None, None, str(e), False)
+        finally:
+            ORDER_SECONDS.observe(time.monotonic() - started, profile.name)
+
+    def _result(self, profile, order_id, qty, error, rejected):
+        ORDERS.inc(profile.name, "executed" if order_id else "rejected" if rejected else "failed")
+        return AccountResult(profile.name, order_id, qty, error, rejected)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,82 @@
+import numpy as np
+
+# Окна ATR (в днях), которые считаются за один проход
+ATR_WINDOWS = (7, 14, 30)
+
+def ohlc_matrix(candles_by_symbol, days):
+    """Собирает свечи в матрицы symbols × days (по времени от старых к новым).
+
+    candles_by_symbol — {symbol: [(start_ms, open, high, low, close), ...]} в любом порядке,
+    как возвращает BybitAPI.get_daily_candles. Недостающие дни слева заполняются NaN.
+    Возвращает (symbols, open, high, low, close).
+    """
+    symbols = list(candles_by_symbol)
+    shape = (len(symbols), days)
+    open_, high, low, close = (np.full(shape, np.nan) for _ in range(4))
+    for row, symbol in enumerate(symbols):
+        candles = sorted(candles_by_symbol[symbol], key=lambda candle: candle[0])[-days:]
+        if not candles:
+            continue
+        values = np.asarray([candle[1:5] for candle in candles], dtype=np.float64)
+        start = days - len(candles)
+        open_[row, start:] = values[:, 0]
+        high[row, start:] = values[:, 1]
+        low[row, start:] = values[:, 2]
+        close[row, start:] = values[:, 3]
+    return symbols, open_, high, low, close
+
+def true_range(high, low, close):
+    """True range: max(high - low, |high - prev_close|, |low - prev_close|) для всех символов сразу.
+
+    Для первого дня (нет предыдущего закрытия) используется high - low.
+    """
+    prev_close = np.empty_like(close)
+    prev_close[:, 0] = np.nan
+    prev_close[:, 1:] = close[:, :-1]
+    # fmax пропускает NaN, поэтому при отсутствии prev_close остается high - low
+    return np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+def wilder_atr(tr, period):
+    """ATR по Уайлдеру на последний день: SMA первых period значений TR, далее (ATR*(n-1) + TR)/n.
+
+    Цикл идет только по дням, по символам — векторно. Символы, у которых меньше period
+    значений TR, получают NaN.
+    """
+    n_symbols, n_days = tr.shape
+    atr = np.full(n_symbols, np.nan)
+    total = np.zeros(n_symbols)
+    count = np.zeros(n_symbols, dtype=np.int64)
+    for day in range(n_days):
+        values = tr[:, day]
+        valid = ~np.isnan(values)
+        seeded = valid & (count >= period)
+        atr[seeded] = (atr[seeded] * (period - 1) + values[seeded]) / period
+        seeding = valid & (count < period)
+        total[seeding] += values[seeding]
+        count[seeding] += 1
+        just_seeded = seeding & (count == period)
+        atr[just_seeded] = total[just_seeded] / period
+    return atr
+
+def sma_atr(tr, period):
+    """Простое среднее TR за последние period дней; NaN, если данных меньше period."""
+    window = tr[:, -period:]
+    enough = np.count_nonzero(~np.isnan(window), axis=1) >= period
+    return np.where(enough, np.nansum(window, axis=1) / period, np.nan)
+
+def atr_windows(high, low, close, windows=ATR_WINDOWS, method="wilder"):
+    """Считает ATR сразу для нескольких окон: {window: массив по символам}."""
+    tr = true_range(high, low, close)
+    calculate = wilder_atr if method == "wilder" else sma_atr
+    return {window: calculate(tr, window) for window in windows}
+
+def atr_for_symbols(candles_by_symbol, windows=ATR_WINDOWS, method="wilder"):
+    """Удобная обертка: {symbol: {window: atr}} по свечам BybitAPI.get_daily_candles (NaN заменяется на None)."""
+    if not candles_by_symbol:
+        return {}
+    symbols, _, high, low, close = ohlc_matrix(candles_by_symbol, max(windows) + 1)
+    results = atr_windows(high, low, close, windows, method)
+    return {
+        symbol: {window: (None if np.isnan(results[window][row]) else float(results[window][row])) for window in windows}
+        for row, symbol in enumerate(symbols)
+    }
@@ -0,0 +1,308 @@
+import os
+
+# Бенчмарки работают офлайн: без шины цен и с журналом только предупреждений (значения можно переопределить)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["PRICE_BUS_NAME"] = ""
+
+import argparse
+import contextlib
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from bybit_api import BybitAPI
+from fetch_prices import PriceFetcher
+from google_sheets import GoogleSheetsClient
+from price_monitor import PriceMonitor
+from trading_engine import TradingEngine
+from populate_historical_data import populate_historical_data
+from populate_static_data import EXPECTED_HEADERS
+from storage import InMemoryStorage
+from price_store import PriceStore
+import fakes
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_OUTPUT = os.path.join(project_dir, "benchmarks", "results.json")
+
+# Реестр бенчмарков: имя -> функция подготовки, возвращающая (prepare, run).
+# prepare() выполняется вне замера, run() — замеряемая итерация, возвращает число операций.
+BENCHMARKS = {}
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+class BenchContext:
+    """Общие офлайн-фикстуры: символы, фейковый Bybit и таблица, сгенерированные из seed."""
+
+    def __init__(self, symbols_count, seed):
+        self.seed = seed
+        self.symbols = fakes.fake_symbols(symbols_count, seed)
+        self.bybit = fakes.FakeBybitAPI(self.symbols, seed)
+        self.analitics = fakes.analitics_rows(self.symbols, self.bybit, seed, trading_share=1.0)
+        self.trade_rows = fakes.trade_sheet_rows(self.symbols, self.bybit, seed, rows_count=max(symbols_count * 2, 100))
+        # С ATR: PriceMonitor читает его для индекса близости к уровням
+        self.database = fakes.database_rows(self.symbols, EXPECTED_HEADERS, self.bybit, seed)
+
+    def spreadsheet(self, **extra_sheets):
+        sheets = {"analitics": self.analitics, "long": self.trade_rows, "short": self.trade_rows, "database": self.database}
+        sheets.update(extra_sheets)
+        return fakes.FakeSpreadsheet(sheets)
+
+    def sheets_client(self, storage=None, **extra_sheets):
+        return GoogleSheetsClient(None, "benchmark", storage=storage, spreadsheet=self.spreadsheet(**extra_sheets))
+
+    def price_path(self, ticks_per_symbol):
+        """Тики (symbol, price, ts) — блуждание вокруг базовой цены, пересекающее уровни ±3%."""
+        rng = random.Random(self.seed)
+        ts = time.time()
+        ticks = []
+        prices = {symbol: self.bybit.base_price(symbol) for symbol in self.symbols}
+        for _ in range(ticks_per_symbol):
+            for symbol in self.symbols:
+                prices[symbol] *= 1 + rng.gauss(0, 0.01)
+                ts += 0.001
+                ticks.append((symbol, prices[symbol], ts))
+        return ticks
+
+@benchmark("price_monitor.check_levels")
+def bench_check_levels(ctx):
+    monitor = PriceMonitor(google_sheets=ctx.sheets_client(), bybit_api=ctx.bybit)
+    ticks = ctx.price_path(50)
+
+    def prepare():
+        monitor.alerts_history = []
+        monitor.prev_ticks = {symbol: None for symbol in monitor.prev_ticks}
+        monitor.alerted = {symbol: {"long": False, "short": False} for symbol in monitor.alerted}
+
+    def run():
+        for symbol, price, ts in ticks:
+            monitor.check_levels(symbol, price, ts)
+        return len(ticks)
+
+    return prepare, run
+
+@benchmark("trading_engine.process_new_alerts")
+def bench_alert_burst(ctx, burst_size=500):
+    monitor = PriceMonitor(google_sheets=ctx.sheets_client(), bybit_api=ctx.bybit)
+    engine = TradingEngine(monitor, send_message=lambda text: None)
+    rng = random.Random(ctx.seed)
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    burst = [
+        {
+            "symbol": rng.choice(ctx.symbols),
+            "type": rng.choice(["LONG", "SHORT"]),
+            "price": 1.0,
+            "level": 1.0,
+            "timestamp": timestamp,
+            "detected_at": time.time()
+        }
+        for _ in range(burst_size)
+    ]
+
+    def prepare():
+        monitor.alerts_history = list(burst)
+        engine.last_alert_count = 0
+        engine.long_alerts, engine.short_alerts = {}, {}
+        engine.long_window_start = engine.short_window_start = None
+
+    def run():
+        engine.process_new_alerts()
+        return burst_size
+
+    return prepare, run
+
+@benchmark("bybit_api.subscribe_to_ticker.handle_message")
+def bench_ticker_messages(ctx):
+    api = BybitAPI()
+    api._ws = fakes.FakeWebSocket()
+    coins = [{"coin": symbol, "long_level": None, "short_level": None} for symbol in ctx.symbols]
+    fetcher = PriceFetcher(bybit_api=api, trading_coins=coins)
+    fetcher.set_valid_symbols(ctx.symbols)
+    api.subscribe_to_ticker(ctx.symbols, fetcher.handle_price_update)
+    messages = [fakes.ticker_message(symbol, price, int(ts * 1000)) for symbol, price, ts in ctx.price_path(20)]
+
+    def run():
+        for message in messages:
+            api.ws.deliver(message)
+        return len(messages)
+
+    return None, run
+
+@benchmark("price_store.update_and_changed_since")
+def bench_price_store(ctx):
+    store = PriceStore(ctx.symbols)
+    ticks = [(store.id_of(symbol), price, ts) for symbol, price, ts in ctx.price_path(20)]
+
+    def run():
+        version = store.version
+        for symbol_id, price, ts in ticks:
+            store.update(symbol_id, price, ts)
+        store.changed_since(version)
+        return len(ticks)
+
+    return None, run
+
+@benchmark("proximity_index.select")
+def bench_proximity_select(ctx):
+    monitor = PriceMonitor(google_sheets=ctx.sheets_client(), bybit_api=ctx.bybit)
+    store = monitor.price_fetcher.store
+    for symbol in ctx.symbols:
+        store.add_symbol(symbol)
+    # Оценка по базовой цене, затем проход со снимком изменившихся символов
+    for symbol in ctx.symbols:
+        monitor.proximity.update(symbol, ctx.bybit.base_price(symbol), monitor.active_levels(symbol))
+    ticks = [(store.id_of(symbol), price, ts) for symbol, price, ts in ctx.price_path(1)]
+
+    def run():
+        version = store.version
+        for symbol_id, price, ts in ticks:
+            store.update(symbol_id, price, ts)
+        monitor.proximity.select(store.changed_since(version))
+        return len(ticks)
+
+    return None, run
+
+@benchmark("google_sheets.get_trading_coins")
+def bench_trading_coins(ctx):
+    client = ctx.sheets_client(storage=InMemoryStorage())
+
+    def run():
+        return len(client.get_trading_coins())
+
+    return None, run
+
+@benchmark("google_sheets.get_pending_trades")
+def bench_pending_trades(ctx):
+    client = ctx.sheets_client()
+
+    def run():
+        client.get_pending_trades()
+        return 1
+
+    return None, run
+
+@benchmark("populate_historical_data")
+def bench_populate_historical(ctx):
+    state = {}
+
+    def prepare():
+        storage = InMemoryStorage()
+        storage.upsert_instruments([
+            {"symbol": symbol, "tick_size": 0.0001, "min_order_qty": 0.1, "qty_step": 0.1, "max_order_qty": None,
+             "min_price": None, "max_price": None, "taker_fee": 0.00055, "maker_fee": 0.0002}
+            for symbol in ctx.symbols
+        ])
+        database = fakes.database_rows(ctx.symbols, EXPECTED_HEADERS)
+        state["storage"] = storage
+        state["client"] = ctx.sheets_client(storage=storage, database=database)
+
+    def run():
+        populate_historical_data(sheets_client=state["client"], bybit_api=ctx.bybit, storage=state["storage"], request_delay=0)
+        return len(ctx.symbols)
+
+    return prepare, run
+
+def measure(prepare, run, repeat):
+    """Одна прогревочная итерация и repeat замеров; возвращает статистику на операцию."""
+    durations = []
+    ops = 0
+    for iteration in range(repeat + 1):
+        if prepare:
+            prepare()
+        started = time.perf_counter()
+        ops = run()
+        elapsed = time.perf_counter() - started
+        if iteration:
+            durations.append(elapsed)
+    median = statistics.median(durations)
+    return {
+        "ops": ops,
+        "repeat": repeat,
+        "best_seconds": min(durations),
+        "median_seconds": median,
+        "median_per_op_us": median / ops * 1e6 if ops else None,
+        "ops_per_second": ops / median if median else None
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=project_dir).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(previous, current, threshold):
+    """Сравнивает медианное время на операцию с прошлым прогоном; возвращает строки отчета и регрессии."""
+    lines, regressions = [], []
+    previous_results = (previous or {}).get("results", {})
+    for name, result in current["results"].items():
+        old = previous_results.get(name)
+        new_value = result["median_per_op_us"]
+        if not old or not old.get("median_per_op_us") or not new_value:
+            lines.append(f"{name}: {new_value:.2f} мкс/оп (нет прошлого результата)")
+            continue
+        change = new_value / old["median_per_op_us"] - 1
+        mark = ""
+        if change > threshold:
+            mark = "  РЕГРЕССИЯ"
+            regressions.append(name)
+        lines.append(f"{name}: {new_value:.2f} мкс/оп ({change:+.1%} к {previous.get('revision')}){mark}")
+    return lines, regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарки горячих путей")
+    parser.add_argument("--symbols", type=int, default=200, help="число символов в фикстурах")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="запустить только указанные")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON с результатами; прошлый файл служит базой сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление на операцию (доля)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    current = {
+        "revision": git_revision(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"symbols": args.symbols, "seed": args.seed, "repeat": args.repeat},
+        "results": {}
+    }
+    # Модули проекта печатают в stdout; во время замеров вывод отбрасывается
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            ctx = BenchContext(args.symbols, args.seed)
+        for name in args.only or BENCHMARKS:
+            with contextlib.redirect_stdout(devnull):
+                prepare, run = BENCHMARKS[name](ctx)
+                current["results"][name] = measure(prepare, run, args.repeat)
+
+    previous = None
+    if os.path.exists(args.output):
+        with open(args.output, encoding="utf-8") as file:
+            previous = json.load(file)
+        if previous.get("params") != current["params"]:
+            print(f"Параметры прошлого прогона {previous.get('params')} отличаются, сравнение может быть некорректным")
+    lines, regressions = compare(previous, current, args.threshold)
+    print("\n".join(lines))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(current, file, ensure_ascii=False, indent=2)
+    # История всех прогонов для сравнения между версиями
+    with open(os.path.splitext(args.output)[0] + "_history.jsonl", "a", encoding="utf-8") as file:
+        file.write(json.dumps(current, ensure_ascii=False) + "\n")
+    print(f"Результаты сохранены в {args.output}")
+
+    if regressions and args.fail_on_regression:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,44 @@ from pybit.unified_trading import HTTP, WebSocket
 import logging
 import time
 import requests
+from urllib.parse import urlsplit
+from log_setup import TickLogSampler
+from ticks import TickTable
+from order_book import OrderBookFeed
+from metrics import REGISTRY
+from config import TICK_LOG_INTERVAL_SECONDS, BYBIT_REST_URL, BYBIT_WS_URL
+
+REQUEST_SECONDS = REGISTRY.histogram("bybit_request_seconds", "Время REST-запросов к Bybit, с", ("path",))
+TICKS = REGISTRY.counter("bybit_ticks_total", "Тиков WebSocket по символам", ("symbol",))
+WS_LAG_SECONDS = REGISTRY.histogram("bybit_ws_lag_seconds", "Задержка тика: время получения минус ts биржи, с")
+
+class BybitWebSocket(WebSocket):
+    """WebSocket pybit, передающий сообщения orderbook в колбэк без изменений.
+
+    pybit ведет собственную копию стакана в списках и отдает в колбэк ее глубокую копию без номера
+    обновления u; локальный стакан (order_book.py) сам применяет snapshot/delta и следит за номерами.
+    """
+
+    def _process_normal_message(self, message):
+        topic = message["topic"]
+        if topic.startswith("orderbook."):
+            self._get_callback(topic)(message)
+            return
+        super()._process_normal_message(message)
+
+class LocalWebSocket(BybitWebSocket):
+    """WebSocket pybit с явным адресом (например, локальный fake_bybit_server.py).
+
+    pybit собирает адрес из поддоменов Bybit внутри _connect, поэтому адрес подменяется там же;
+    переподключения pybit идут на тот же адрес.
+    """
+
+    def __init__(self, url, **kwargs):
+        self.url = url
+        super().__init__(**kwargs)
+
+    def _connect(self, url):
+        super()._connect(self.url)
 
 class BybitAPI:
     def __init__(self, api_key=None, api_secret=None):
@@ -12,8 +50,68 @@ class BybitAPI:
             api_secret=api_secret,
             testnet=False
         )
-        self.ws = WebSocket(testnet=False, channel_type="linear")
-        self.logger.info("HTTP и WebSocket клиенты инициализированы")
+        # Адреса REST и WebSocket можно переопределить (локальный сервер для нагрузочных тестов)
+        self.rest_url = BYBIT_REST_URL.rstrip("/")
+        self.session.endpoint = self.rest_url
+        self._instrument_session()
+        # Пул соединений для прямых REST-запросов (tickers и т.п.)
+        self.http = requests.Session()
+        self.http.hooks["response"].append(
+            lambda response, *args, **kwargs: REQUEST_SECONDS.observe(response.elapsed.total_seconds(), urlsplit(response.url).path)
+        )
+        # WebSocket открывается лениво при первой подписке: задачам без подписок он не нужен
+        self._ws = None
+        # Логи тиков WebSocket: выборка не чаще раза в интервал на символ
+        self.tick_log = TickLogSampler(self.logger, TICK_LOG_INTERVAL_SECONDS)
+        # Сетки цен (tickSize) загружаются при первом ордере
+        self._tick_table = None
+        self._order_books = None
+        self.logger.info("HTTP клиент инициализирован")
+
+    def _instrument_session(self):
+        """Замеряет время всех запросов pybit (они проходят через _submit_request)."""
+        submit = self.session._submit_request
+
+        def timed_submit(method=None, path=None, query=None, auth=False):
+            started = time.monotonic()
+            try:
+                return submit(method=method, path=path, query=query, auth=auth)
+            finally:
+                REQUEST_SECONDS.observe(time.monotonic() - started, urlsplit(path or "").path)
+
+        self.session._submit_request = timed_submit
+
+    @property
+    def ws(self):
+        if self._ws is None:
+            self._ws = self.create_websocket()
+            self.logger.info("WebSocket клиент инициализирован")
+        return self._ws
+
+    def create_websocket(self, **kwargs):
+        """Новое публичное WebSocket-соединение linear (для шардов ws_supervisor.py)."""
+        if BYBIT_WS_URL:
+            return LocalWebSocket(BYBIT_WS_URL, testnet=False, channel_type="linear", **kwargs)
+        return BybitWebSocket(testnet=False, channel_type="linear", **kwargs)
+
+    @property
+    def order_books(self):
+        """Локальные стаканы символов (order_book.OrderBookFeed), соединение открывается при первом track."""
+        if self._order_books is None:
+            self._order_books = OrderBookFeed(self)
+        return self._order_books
+
+    def get_orderbook(self, symbol, limit=50):
+        """Снимок стакана через REST: {"b": [[цена, объем], ...], "a": [...], "u": ..., "ts": ...} или None."""
+        try:
+            response = self.session.get_orderbook(category="linear", symbol=symbol, limit=limit)
+            if response['retCode'] == 0:
+                return response['result']
+            self.logger.error(f"Ошибка получения стакана {symbol}: {response['retMsg']}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Исключение при получении стакана {symbol}: {e}")
+            return None
 
     def get_last_7_days_high_low(self, symbol, days=7):
         """Получает high и low за последние 7 дней, исключая текущий день."""
@@ -43,15 +141,67 @@ class BybitAPI:
             self.logger.error(f"Исключение при запросе исторических данных для {symbol}: {e}")
             return []
 
+    def get_daily_candles(self, symbol, days=31):
+        """Получает дневные свечи (start_ms, open, high, low, close) за последние days дней, исключая текущий день."""
+        self.logger.debug(f"Запрос дневных свечей для {symbol}, период: {days} дней")
+        try:
+            end_time = int(time.time() * 1000) - (86400 * 1000)
+            start_time = end_time - (days * 86400 * 1000)
+            response = self.session.get_kline(
+                category="linear",
+                symbol=symbol,
+                interval="D",
+                start=start_time,
+                end=end_time,
+                limit=days
+            )
+            if response['retCode'] == 0 and response['result']['list']:
+                candles = [
+                    (int(candle[0]), float(candle[1]), float(candle[2]), float(candle[3]), float(candle[4]))
+                    for candle in response['result']['list']
+                ]
+                candles.sort(key=lambda x: x[0], reverse=True)
+                self.logger.info(f"Успешно получено {len(candles)} дневных свечей для {symbol}")
+                return candles
+            self.logger.error(f"Ошибка получения дневных свечей для {symbol}: {response['retMsg']}")
+            return []
+        except Exception as e:
+            self.logger.error(f"Исключение при запросе дневных свечей для {symbol}: {e}")
+            return []
+
+    def get_minute_candles(self, symbol, start_ms, end_ms):
+        """Минутные свечи (start_ms, open, high, low, close) за [start_ms, end_ms] по возрастанию времени (до 1000 штук)."""
+        try:
+            response = self.session.get_kline(
+                category="linear",
+                symbol=symbol,
+                interval="1",
+                start=start_ms,
+                end=end_ms,
+                limit=1000
+            )
+            if response['retCode'] == 0:
+                candles = [
+                    (int(candle[0]), float(candle[1]), float(candle[2]), float(candle[3]), float(candle[4]))
+                    for candle in response['result']['list']
+                ]
+                candles.sort(key=lambda x: x[0])
+                return candles
+            self.logger.error(f"Ошибка получения минутных свечей для {symbol}: {response['retMsg']}")
+            return []
+        except Exception as e:
+            self.logger.error(f"Исключение при запросе минутных свечей для {symbol}: {e}")
+            return []
+
     def get_24h_volume(self, symbol):
         """Получает объём торгов за последние 24 часа в USDT."""
         self.logger.debug(f"Запрос объема торгов за 24 часа для {symbol}")
         try:
-            base_url = "https://api.bybit.com"
+            base_url = self.rest_url
             endpoint = "/v5/market/tickers"
             params = {"category": "linear", "symbol": symbol}
             self.logger.debug(f"GET запрос: {base_url + endpoint}, параметры: {params}")
-            response = requests.get(base_url + endpoint, params=params)
+            response = self.http.get(base_url + endpoint, params=params)
             data = response.json()
             self.logger.debug(f"Ответ от API: {data}")
             if data["retCode"] == 0 and data["result"]["list"]:
@@ -132,20 +282,83 @@ class BybitAPI:
             self.logger.error(f"Исключение при запросе списка фьючерсов: {e}")
             return []
 
-    def subscribe_to_ticker(self, symbols, callback):
-        """Подписка на текущие цены через WebSocket."""
+    def get_futures_instruments_info(self, limit=1000, symbol=None):
+        """Получает полную информацию (priceFilter, lotSizeFilter и т.д.) по всем фьючерсам с пагинацией.
+
+        symbol — только один инструмент (пустой список, если его нет на бирже); None при ошибке запроса.
+        """
+        self.logger.debug(f"Запрос информации по фьючерсным инструментам, limit={limit}, symbol={symbol}")
+        try:
+            instruments = []
+            cursor = None
+            extra = {"symbol": symbol} if symbol else {}
+            while True:
+                response = self.session.get_instruments_info(category="linear", limit=limit, cursor=cursor, **extra)
+                if response['retCode'] != 0:
+                    self.logger.error(f"Ошибка получения информации об инструментах: {response['retMsg']}")
+                    return None
+                page = response['result']['list']
+                instruments.extend(page)
+                cursor = response['result'].get('nextPageCursor')
+                if not cursor or len(page) < limit:
+                    break
+            self.logger.info(f"Получена информация по {len(instruments)} фьючерсным инструментам")
+            return instruments
+        except Exception as e:
+            self.logger.error(f"Исключение при запросе информации об инструментах: {e}")
+            return None
+
+    def get_all_fee_rates(self):
+        """Получает комиссии по всем линейным контрактам одним запросом: {symbol: (maker_fee, taker_fee)}."""
+        self.logger.debug("Запрос комиссий по всем символам")
+        try:
+            response = self.session.get_fee_rates(category="linear")
+            if response['retCode'] == 0:
+                fees = {
+                    item['symbol']: (float(item.get('makerFeeRate', 0)), float(item.get('takerFeeRate', 0)))
+                    for item in response['result']['list']
+                }
+                self.logger.info(f"Получены комиссии для {len(fees)} символов")
+                return fees
+            self.logger.error(f"Не удалось получить комиссии: {response['retMsg']}")
+            return {}
+        except Exception as e:
+            self.logger.error(f"Исключение при запросе комиссий: {e}")
+            return {}
+
+    def subscribe_to_ticker(self, symbols, callback, ws=None):
+        """Подписка на текущие цены через WebSocket (по умолчанию — общее соединение self.ws)."""
         self.logger.debug(f"Подписка на тикеры для символов: {symbols}")
         def handle_message(message):
-            self.logger.debug(f"Получено WebSocket сообщение: {message}")
             if 'topic' in message and 'data' in message:
                 symbol = message['topic'].split('.')[1]
                 last_price = float(message['data']['lastPrice'])
-                self.logger.info(f"Текущая цена для {symbol}: {last_price}")
-                callback(symbol, last_price)
+                self.tick_log.log(symbol, "Текущая цена для %s: %s", symbol, last_price, price=last_price)
+                # Время биржи передается в секундах (в сообщении — миллисекунды)
+                received = time.time()
+                exchange_ts = message['ts'] / 1000 if 'ts' in message else received
+                TICKS.inc(symbol)
+                WS_LAG_SECONDS.observe(max(received - exchange_ts, 0.0))
+                callback(symbol, last_price, exchange_ts)
 
+        ws = ws or self.ws
         for symbol in symbols:
             self.logger.debug(f"Подписка на тикер для {symbol}")
-            self.ws.ticker_stream(symbol=symbol, callback=handle_message)
+            ws.ticker_stream(symbol=symbol, callback=handle_message)
+
+    def subscribe_to_trades(self, symbols, callback, ws=None):
+        """Подписка на поток сделок publicTrade: callback(symbol, min_price, max_price, ts) на каждое сообщение."""
+        def handle_message(message):
+            trades = message.get('data')
+            if not trades:
+                return
+            symbol = message['topic'].split('.')[1]
+            prices = [float(trade['p']) for trade in trades]
+            callback(symbol, min(prices), max(prices), trades[-1]['T'] / 1000)
+
+        ws = ws or self.ws
+        for symbol in symbols:
+            ws.trade_stream(symbol=symbol, callback=handle_message)
 
     def get_open_positions(self):
         """Возвращает количество открытых позиций."""
@@ -163,8 +376,23 @@ class BybitAPI:
             self.logger.error(f"Исключение при получении позиций: {e}")
             return 0
 
+    def tick_grid(self, symbol):
+        """Сетка цен символа (ticks.TickGrid); каталог tickSize запрашивается один раз."""
+        if self._tick_table is None or symbol not in self._tick_table:
+            table = TickTable.load(self)
+            if len(table) or self._tick_table is None:
+                self._tick_table = table
+        return self._tick_table.grid(symbol)
+
+    def format_price(self, symbol, price):
+        """Цена ордера строкой, выровненной на tickSize символа (строки уже проверены OrderValidator)."""
+        if isinstance(price, str):
+            return price
+        grid = self.tick_grid(symbol)
+        return grid.format(grid.to_ticks(price))
+
     def place_limit_order(self, symbol, side, qty, price, take_profit=None, stop_loss=None):
-        """Размещает лимитный ордер."""
+        """Размещает лимитный ордер; цены округляются до ближайшего тика символа."""
         self.logger.debug(f"Размещение ордера: symbol={symbol}, side={side}, qty={qty}, price={price}, "
                         f"take_profit={take_profit}, stop_loss={stop_loss}")
         try:
@@ -174,10 +402,10 @@ class BybitAPI:
                 side=side,
                 orderType="Limit",
                 qty=str(qty),
-                price=str(price),
+                price=self.format_price(symbol, price),
                 timeInForce="GTC",
-                takeProfit=str(take_profit) if take_profit else None,
-                stopLoss=str(stop_loss) if stop_loss else None
+                takeProfit=self.format_price(symbol, take_profit) if take_profit else None,
+                stopLoss=self.format_price(symbol, stop_loss) if stop_loss else None
             )
             self.logger.debug(f"Ответ от place_order: {response}")
             if response['retCode'] == 0:
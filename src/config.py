@@ -2,9 +2,100 @@ import os
 
 BYBIT_API_KEY = os.getenv("BYBIT_API_KEY")
 BYBIT_API_SECRET = os.getenv("BYBIT_API_SECRET")
+# Аккаунты для исполнения сделок через запятую ("main" — ключи выше); ключи, множитель объема и лимит
+# сделок остальных — в BYBIT_API_KEY_<ИМЯ>, BYBIT_API_SECRET_<ИМЯ>, BYBIT_SIZE_MULTIPLIER_<ИМЯ>, BYBIT_MAX_TRADES_<ИМЯ>
+BYBIT_ACCOUNTS = os.getenv("BYBIT_ACCOUNTS", "main")
+TRADE_MAX_OPEN_POSITIONS = int(os.getenv("TRADE_MAX_OPEN_POSITIONS", "5"))
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID")
 GOOGLE_CREDENTIALS_PATH = os.getenv("GOOGLE_CREDENTIALS_PATH")
+# Имя, под которым путь к ключу сервисного аккаунта импортируют модули
+GOOGLE_SHEETS_CREDENTIALS = GOOGLE_CREDENTIALS_PATH
 GOOGLE_SHEETS_ID = os.getenv("GOOGLE_SHEETS_ID")
 
 ALERT_TIMEOUT_MINUTES = 60  # Для тестов 1 минута, в продакшне можно установить 60
+
+# Опрос листов long/short: минимальный и максимальный интервал (сек) и период контрольного полного чтения
+TRADE_POLL_MIN_SECONDS = float(os.getenv("TRADE_POLL_MIN_SECONDS", "3"))
+TRADE_POLL_MAX_SECONDS = float(os.getenv("TRADE_POLL_MAX_SECONDS", "60"))
+TRADE_FULL_REFRESH_SECONDS = float(os.getenv("TRADE_FULL_REFRESH_SECONDS", "300"))
+
+# Локальное хранилище данных листов "database"/"analitics": "sqlite" или "memory"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+STORAGE_PATH = os.getenv("STORAGE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "market.db"))
+
+# Расписания планировщика (cron из 5 полей, UTC): дневная свеча Bybit закрывается в 00:00 UTC
+STATIC_SCHEDULE = os.getenv("STATIC_SCHEDULE", "1 0 * * *")
+HISTORICAL_SCHEDULE = os.getenv("HISTORICAL_SCHEDULE", "3 0 * * *")
+SCHEDULER_RUN_ON_START = os.getenv("SCHEDULER_RUN_ON_START", "true").lower() == "true"
+
+# Бюджет запросов к Google Sheets API на процесс (лимит Google — 60 запросов в минуту на пользователя)
+SHEETS_REQUESTS_PER_MINUTE = int(os.getenv("SHEETS_REQUESTS_PER_MINUTE", "60"))
+
+# Шина цен в разделяемой памяти: имя сегмента (пусто — шина отключена), емкость и допустимое отклонение цены входа
+PRICE_BUS_NAME = os.getenv("PRICE_BUS_NAME", "")
+PRICE_BUS_CAPACITY = int(os.getenv("PRICE_BUS_CAPACITY", "1024"))
+PRICE_BUS_MAX_AGE_SECONDS = float(os.getenv("PRICE_BUS_MAX_AGE_SECONDS", "60"))
+ENTRY_PRICE_MAX_DEVIATION = float(os.getenv("ENTRY_PRICE_MAX_DEVIATION", "0.1"))
+# Локальная проверка ордера: допустимое отклонение цены входа от рыночной (доля), дальше — отклонение до отправки
+ORDER_PRICE_BAND = float(os.getenv("ORDER_PRICE_BAND", "0.3"))
+# Сколько секунд символ, не найденный на бирже, считается отсутствующим без повторного запроса instruments-info
+ORDER_MISSING_SYMBOL_TTL = float(os.getenv("ORDER_MISSING_SYMBOL_TTL", "300"))
+
+# Логирование: уровень, формат ("text" или "json") и интервал выборки логов тиков на символ (сек)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+TICK_LOG_INTERVAL_SECONDS = float(os.getenv("TICK_LOG_INTERVAL_SECONDS", "60"))
+
+# Метрики: порт HTTP-сервера Prometheus в каждом сервисе (0 — не запускать) и адреса /metrics для команды Telegram
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+METRICS_URLS = [url.strip() for url in os.getenv("METRICS_URLS", "").split(",") if url.strip()]
+
+# Адреса Bybit: REST и публичный WebSocket linear (пусто — адрес pybit по умолчанию).
+# Для нагрузочных тестов указываются адреса локального fake_bybit_server.py
+BYBIT_REST_URL = os.getenv("BYBIT_REST_URL", "https://api.bybit.com")
+BYBIT_WS_URL = os.getenv("BYBIT_WS_URL", "")
+
+# Профилирование по запросу (/debug/* на порту метрик, команды /profile, /heap, /threads): каталог результатов и предел длительности
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "profiles"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+
+# Надзор за WebSocket-потоком тикеров: символов на соединение, пороги молчания соединения и символа,
+# максимальная задержка переподключения и период проверки (сек)
+WS_SHARD_SIZE = int(os.getenv("WS_SHARD_SIZE", "100"))
+WS_STALE_CONNECTION_SECONDS = float(os.getenv("WS_STALE_CONNECTION_SECONDS", "30"))
+WS_STALE_SYMBOL_SECONDS = float(os.getenv("WS_STALE_SYMBOL_SECONDS", "300"))
+WS_RECONNECT_MAX_SECONDS = float(os.getenv("WS_RECONNECT_MAX_SECONDS", "60"))
+WS_WATCHDOG_INTERVAL_SECONDS = float(os.getenv("WS_WATCHDOG_INTERVAL_SECONDS", "1"))
+
+# Добор пропущенных пересечений по минутным свечам после разрывов потока: параллельных запросов,
+# максимальная длина добора (мин) и пауза между проверками PriceMonitor, считающаяся разрывом (сек)
+GAP_RECOVERY_WORKERS = int(os.getenv("GAP_RECOVERY_WORKERS", "8"))
+GAP_RECOVERY_MAX_MINUTES = int(os.getenv("GAP_RECOVERY_MAX_MINUTES", "1000"))
+GAP_RECOVERY_MIN_SECONDS = float(os.getenv("GAP_RECOVERY_MIN_SECONDS", "60"))
+
+# Касания уровней по потоку сделок publicTrade (по умолчанию выключено): близость к уровню (в ATR),
+# символов на соединение, число соединений и минимальный интервал пересмотра набора символов (сек)
+TRADE_STREAM_ENABLED = os.getenv("TRADE_STREAM_ENABLED", "false").lower() == "true"
+TRADE_STREAM_PROXIMITY = float(os.getenv("TRADE_STREAM_PROXIMITY", "0.25"))
+TRADE_STREAM_SYMBOLS_PER_CONNECTION = int(os.getenv("TRADE_STREAM_SYMBOLS_PER_CONNECTION", "20"))
+TRADE_STREAM_MAX_CONNECTIONS = int(os.getenv("TRADE_STREAM_MAX_CONNECTIONS", "1"))
+TRADE_STREAM_RESELECT_SECONDS = float(os.getenv("TRADE_STREAM_RESELECT_SECONDS", "30"))
+
+# Индекс близости к уровням: символы дальше PROXIMITY_BAND_ATR ATR от активных уровней проверяются
+# только после движения цены к уровню; ATR по умолчанию (если его нет на листе database) — доля цены
+PROXIMITY_BAND_ATR = float(os.getenv("PROXIMITY_BAND_ATR", "1.0"))
+PROXIMITY_DEFAULT_ATR_SHARE = float(os.getenv("PROXIMITY_DEFAULT_ATR_SHARE", "0.02"))
+
+# Локальный стакан для оценки проскальзывания входа: глубина потока orderbook, ожидание первого снимка (с)
+# и допустимое проскальзывание средней цены исполнения от середины спреда (доля; 0 — не ограничивать)
+ORDER_BOOK_DEPTH = int(os.getenv("ORDER_BOOK_DEPTH", "50"))
+ORDER_BOOK_WAIT_SECONDS = float(os.getenv("ORDER_BOOK_WAIT_SECONDS", "2"))
+ORDER_MAX_SLIPPAGE = float(os.getenv("ORDER_MAX_SLIPPAGE", "0.005"))
+
+# Быстрый путь входа по решению TradingEngine: "off", "confirm" (одна кнопка в Telegram, нужен общий процесс
+# orchestrator.py с trade_manager) или "auto" (ордера отправляются сразу); срок действия кнопки и период
+# повторного чтения строк подготовленных сделок с листов long/short (сек)
+FAST_PATH_MODE = os.getenv("FAST_PATH_MODE", "off").lower()
+FAST_PATH_CONFIRM_SECONDS = float(os.getenv("FAST_PATH_CONFIRM_SECONDS", "300"))
+FAST_PATH_REFRESH_SECONDS = float(os.getenv("FAST_PATH_REFRESH_SECONDS", "60"))
@@ -0,0 +1,497 @@
+import argparse
+import base64
+import csv
+import hashlib
+import json
+import logging
+import random
+import socket
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import fakes
+
+# Локальный заменитель Bybit v5 для нагрузочных тестов без сети:
+#   REST: market/tickers, market/kline, market/instruments-info, account/fee-rate,
+#         position/list, order/create, order/cancel-all (+ POST /fake/disconnect)
+#   WebSocket: публичный поток tickers.<SYMBOL> (snapshot при подписке, затем delta),
+#              publicTrade.<SYMBOL> (сделка по цене каждого тика), ping/pong
+# Подключение бота: BYBIT_REST_URL=http://127.0.0.1:<rest_port>, BYBIT_WS_URL=ws://127.0.0.1:<ws_port>/v5/public/linear
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x8, 0x9, 0xA
+INTERVAL_MS = {"1": 60_000, "3": 180_000, "5": 300_000, "15": 900_000, "30": 1_800_000, "60": 3_600_000,
+               "120": 7_200_000, "240": 14_400_000, "D": 86_400_000}
+
+logger = logging.getLogger("fake_bybit_server")
+
+class RandomWalkPrices:
+    """Случайное блуждание цен от детерминированных начальных значений."""
+
+    def __init__(self, symbols, seed=0, volatility=0.0005):
+        self.rng = random.Random(seed)
+        self.volatility = volatility
+        reference = fakes.FakeBybitAPI(symbols, seed)
+        self.prices = {symbol: reference.base_price(symbol) for symbol in symbols}
+
+    def current(self, symbol):
+        return self.prices[symbol]
+
+    def next(self, symbol):
+        self.prices[symbol] *= 1 + self.rng.gauss(0, self.volatility)
+        return self.prices[symbol]
+
+class ReplayPrices:
+    """Воспроизведение записанных цен из CSV (symbol,price); по окончании запись повторяется по кругу."""
+
+    def __init__(self, path):
+        self.paths = {}
+        with open(path, newline="", encoding="utf-8") as file:
+            for row in csv.reader(file):
+                if len(row) < 2 or row[0] == "symbol":
+                    continue
+                self.paths.setdefault(row[0], []).append(float(row[1]))
+        self.positions = {symbol: 0 for symbol in self.paths}
+
+    def current(self, symbol):
+        return self.paths[symbol][self.positions[symbol]]
+
+    def next(self, symbol):
+        self.positions[symbol] = (self.positions[symbol] + 1) % len(self.paths[symbol])
+        return self.current(symbol)
+
+class WebSocketConnection:
+    """Серверная сторона RFC 6455: рукопожатие, текстовые кадры, ping/pong и close."""
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.conn_id = uuid.uuid4().hex
+        self.topics = set()
+        self.send_lock = threading.Lock()
+        self.open = False
+
+    def handshake(self):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                return False
+            request += chunk
+        headers = {}
+        for line in request.decode("latin-1").split("\r\n")[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get("sec-websocket-key")
+        if not key:
+            self.sock.sendall(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        self.sock.sendall(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+        )
+        self.open = True
+        return True
+
+    @staticmethod
+    def encode_frame(opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        return header + payload
+
+    def send_raw(self, frame):
+        try:
+            with self.send_lock:
+                self.sock.sendall(frame)
+            return True
+        except OSError:
+            self.open = False
+            return False
+
+    def send_json(self, message):
+        return self.send_raw(self.encode_frame(OP_TEXT, json.dumps(message).encode()))
+
+    def _recv_exact(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("соединение закрыто клиентом")
+            data += chunk
+        return data
+
+    def recv_frame(self):
+        first, second = self._recv_exact(2)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", self._recv_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self._recv_exact(8))[0]
+        mask = self._recv_exact(4) if second & 0x80 else None
+        payload = self._recv_exact(length)
+        if mask:
+            payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        return opcode, payload
+
+    def close(self, abrupt=False):
+        """Закрывает соединение; abrupt=True — обрыв без кадра close (имитация сетевого сбоя)."""
+        if self.open and not abrupt:
+            self.send_raw(self.encode_frame(OP_CLOSE, struct.pack("!H", 1000)))
+        self.open = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+class FakeBybitServer:
+    """REST- и WebSocket-сервер, имитирующий публичные и торговые эндпоинты Bybit v5 на одной машине."""
+
+    def __init__(self, symbols, host="127.0.0.1", rest_port=0, ws_port=0, prices=None, ticks_per_second=1.0,
+                 seed=0, disconnect_every=None, response_delay=0.05):
+        self.symbols = list(symbols)
+        self.known_symbols = set(self.symbols)
+        self.host = host
+        self.catalog = fakes.FakeBybitAPI(self.symbols, seed)
+        self.prices = prices or RandomWalkPrices(self.symbols, seed)
+        self.ticks_per_second = ticks_per_second
+        self.seed = seed
+        self.disconnect_every = disconnect_every
+        # pybit регистрирует подписку уже после отправки запроса, поэтому ответ на localhost задерживается
+        self.response_delay = response_delay
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        self.positions = {}
+        self.orders = []
+        self.sent_messages = 0
+        self.running = False
+
+        self.rest_server = ThreadingHTTPServer((host, rest_port), self._rest_handler())
+        self.rest_server.daemon_threads = True
+        self.ws_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.ws_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.ws_socket.bind((host, ws_port))
+        self.ws_socket.listen(64)
+
+    @property
+    def rest_url(self):
+        return f"http://{self.host}:{self.rest_server.server_address[1]}"
+
+    @property
+    def ws_url(self):
+        return f"ws://{self.host}:{self.ws_socket.getsockname()[1]}/v5/public/linear"
+
+    def start(self):
+        self.running = True
+        for name, target in [("rest", self.rest_server.serve_forever), ("ws-accept", self._accept_loop),
+                             ("ticker", self._ticker_loop)]:
+            threading.Thread(target=target, daemon=True, name=f"fake-bybit-{name}").start()
+        if self.disconnect_every:
+            threading.Thread(target=self._disconnect_loop, daemon=True, name="fake-bybit-disconnect").start()
+        logger.info(f"Fake Bybit запущен: REST {self.rest_url}, WebSocket {self.ws_url}, {len(self.symbols)} символов")
+        return self
+
+    def stop(self):
+        self.running = False
+        self.rest_server.shutdown()
+        self.ws_socket.close()
+        self.disconnect_all(abrupt=False)
+
+    def disconnect_all(self, abrupt=True):
+        """Разрывает все WebSocket-соединения (по умолчанию без кадра close)."""
+        with self.connections_lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            connection.close(abrupt=abrupt)
+        logger.info(f"Разорвано {len(connections)} WebSocket-соединений")
+        return len(connections)
+
+    # --- WebSocket ---
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                sock, address = self.ws_socket.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve_connection, args=(WebSocketConnection(sock, address),), daemon=True).start()
+
+    def _serve_connection(self, connection):
+        try:
+            if not connection.handshake():
+                connection.close(abrupt=True)
+                return
+            with self.connections_lock:
+                self.connections.append(connection)
+            while connection.open:
+                opcode, payload = connection.recv_frame()
+                if opcode == OP_TEXT:
+                    self._handle_ws_message(connection, json.loads(payload))
+                elif opcode == OP_PING:
+                    connection.send_raw(connection.encode_frame(OP_PONG, payload))
+                elif opcode == OP_CLOSE:
+                    connection.close()
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            connection.open = False
+            with self.connections_lock:
+                if connection in self.connections:
+                    self.connections.remove(connection)
+
+    def _handle_ws_message(self, connection, message):
+        op = message.get("op")
+        response = {"success": True, "ret_msg": "", "conn_id": connection.conn_id, "req_id": message.get("req_id", ""), "op": op}
+        if op == "ping":
+            response["ret_msg"] = "pong"
+            connection.send_json(response)
+        elif op in ("subscribe", "unsubscribe"):
+            topics = message.get("args", [])
+            unknown = [topic for topic in topics if not self._topic_symbol(topic)]
+            if unknown:
+                response.update(success=False, ret_msg=f"error:handler not found,topic:{unknown[0]}")
+                connection.send_json(response)
+                return
+            if op == "subscribe":
+                threading.Timer(self.response_delay, self._complete_subscription, (connection, topics, response)).start()
+            else:
+                connection.topics.difference_update(topics)
+                connection.send_json(response)
+
+    def _complete_subscription(self, connection, topics, response):
+        """Ответ на подписку, снапшоты и включение топиков в рассылку тиков."""
+        connection.send_json(response)
+        for topic in topics:
+            if topic.startswith("tickers."):
+                connection.send_json(self._ticker_message(self._topic_symbol(topic), "snapshot"))
+        connection.topics.update(topics)
+
+    def _topic_symbol(self, topic):
+        kind, _, symbol = topic.partition(".")
+        return symbol if kind in ("tickers", "publicTrade") and symbol in self.known_symbols else None
+
+    def _ticker_message(self, symbol, message_type, price=None):
+        price = self.prices.current(symbol) if price is None else price
+        data = {"symbol": symbol, "lastPrice": f"{price:.6g}", "markPrice": f"{price:.6g}"}
+        if message_type == "snapshot":
+            data.update(turnover24h=str(self.catalog.get_24h_volume(symbol)), volume24h="0", tickDirection="ZeroPlusTick")
+        return {"topic": f"tickers.{symbol}", "type": message_type, "data": data, "cs": 0, "ts": int(time.time() * 1000)}
+
+    def _trade_message(self, symbol, price):
+        now = int(time.time() * 1000)
+        trade = {"T": now, "s": symbol, "S": "Buy", "v": "1", "p": f"{price:.6g}", "L": "ZeroPlusTick", "i": str(uuid.uuid4()), "BT": False}
+        return {"topic": f"publicTrade.{symbol}", "type": "snapshot", "data": [trade], "ts": now}
+
+    def _ticker_loop(self):
+        """Каждый период выпускает по тику на символ и рассылает его подписанным соединениям."""
+        period = 1.0 / self.ticks_per_second
+        next_tick = time.monotonic()
+        while self.running:
+            with self.connections_lock:
+                connections = [connection for connection in self.connections if connection.topics]
+            for symbol in self.symbols:
+                price = self.prices.next(symbol)
+                topic = f"tickers.{symbol}"
+                receivers = [connection for connection in connections if topic in connection.topics]
+                frame = WebSocketConnection.encode_frame(OP_TEXT, json.dumps(self._ticker_message(symbol, "delta", price)).encode())
+                for connection in receivers:
+                    if connection.send_raw(frame):
+                        self.sent_messages += 1
+                trade_topic = f"publicTrade.{symbol}"
+                trade_receivers = [connection for connection in connections if trade_topic in connection.topics]
+                if trade_receivers:
+                    frame = WebSocketConnection.encode_frame(OP_TEXT, json.dumps(self._trade_message(symbol, price)).encode())
+                    for connection in trade_receivers:
+                        if connection.send_raw(frame):
+                            self.sent_messages += 1
+            next_tick += period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()  # Не успеваем за заданной частотой: не накапливаем отставание
+
+    def _disconnect_loop(self):
+        while self.running:
+            time.sleep(self.disconnect_every)
+            self.disconnect_all(abrupt=True)
+
+    # --- REST ---
+
+    def _rest_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _params(self):
+                url = urlsplit(self.path)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                if self.command == "POST":
+                    length = int(self.headers.get("Content-Length") or 0)
+                    body = self.rfile.read(length) if length else b""
+                    params.update(json.loads(body) if body else {})
+                return url.path, params
+
+            def _reply(self, result, ret_code=0, ret_msg="OK"):
+                body = json.dumps({"retCode": ret_code, "retMsg": ret_msg, "result": result, "retExtInfo": {},
+                                   "time": int(time.time() * 1000)}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _dispatch(self):
+                path, params = self._params()
+                route = server.ROUTES.get((self.command, path))
+                if route is None:
+                    self._reply({}, 10001, f"unknown endpoint {path}")
+                    return
+                try:
+                    result = route(server, params)
+                except ValueError as e:
+                    self._reply({}, 10001, str(e))
+                    return
+                self._reply(result)
+
+            do_GET = _dispatch
+            do_POST = _dispatch
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _require_symbol(self, params):
+        symbol = params.get("symbol")
+        if symbol and symbol not in self.known_symbols:
+            raise ValueError(f"params error: symbol invalid {symbol}")
+        return symbol
+
+    def rest_tickers(self, params):
+        symbol = self._require_symbol(params)
+        symbols = [symbol] if symbol else self.symbols
+        return {"category": "linear", "list": [
+            {"symbol": s, "lastPrice": f"{self.prices.current(s):.6g}", "markPrice": f"{self.prices.current(s):.6g}",
+             "turnover24h": str(self.catalog.get_24h_volume(s)), "volume24h": "0"}
+            for s in symbols
+        ]}
+
+    def rest_kline(self, params):
+        symbol = self._require_symbol(params)
+        interval_ms = INTERVAL_MS.get(str(params.get("interval", "D")))
+        if not symbol or interval_ms is None:
+            raise ValueError("params error: symbol and interval are required")
+        limit = min(int(params.get("limit", 200)), 1000)
+        end = int(params.get("end", time.time() * 1000))
+        start = int(params.get("start", 0))
+        rng = random.Random(f"{self.seed}:{symbol}:{interval_ms}:{end // interval_ms}")
+        price = self.prices.current(symbol)
+        candles = []
+        open_time = end // interval_ms * interval_ms
+        while len(candles) < limit and open_time >= start:
+            close = price
+            open_price = close / (1 + rng.gauss(0, 0.002 * (interval_ms / 60_000) ** 0.5))
+            high = max(open_price, close) * (1 + abs(rng.gauss(0, 0.001)))
+            low = min(open_price, close) * (1 - abs(rng.gauss(0, 0.001)))
+            candles.append([str(open_time), f"{open_price:.6g}", f"{high:.6g}", f"{low:.6g}", f"{close:.6g}", "0", "0"])
+            price = open_price
+            open_time -= interval_ms
+        return {"category": "linear", "symbol": symbol, "list": candles}
+
+    def rest_instruments_info(self, params):
+        symbol = self._require_symbol(params)
+        instruments = self.catalog.get_futures_instruments_info()
+        if symbol:
+            instruments = [info for info in instruments if info["symbol"] == symbol]
+        limit = int(params.get("limit", 500))
+        offset = int(params.get("cursor") or 0)
+        page = instruments[offset:offset + limit]
+        for info in page:
+            info.update(status="Trading", contractType="LinearPerpetual")
+        next_cursor = str(offset + limit) if offset + limit < len(instruments) else ""
+        return {"category": "linear", "list": page, "nextPageCursor": next_cursor}
+
+    def rest_fee_rate(self, params):
+        symbol = self._require_symbol(params)
+        fees = self.catalog.get_all_fee_rates()
+        return {"list": [
+            {"symbol": s, "makerFeeRate": str(maker), "takerFeeRate": str(taker)}
+            for s, (maker, taker) in fees.items() if not symbol or s == symbol
+        ]}
+
+    def rest_positions(self, params):
+        return {"category": "linear", "list": [
+            {"symbol": symbol, "side": position["side"], "size": str(position["size"]), "avgPrice": str(position["price"])}
+            for symbol, position in self.positions.items()
+        ]}
+
+    def rest_order_create(self, params):
+        symbol = self._require_symbol(params)
+        qty = float(params.get("qty", 0))
+        if not symbol or qty <= 0:
+            raise ValueError("params error: symbol and qty are required")
+        order_id = uuid.uuid4().hex
+        self.orders.append({"orderId": order_id, **params})
+        # Лимитный ордер считается исполненным сразу: позиция появляется в position/list
+        self.positions[symbol] = {"side": params.get("side"), "size": qty, "price": float(params.get("price", 0) or 0)}
+        return {"orderId": order_id, "orderLinkId": params.get("orderLinkId", "")}
+
+    def rest_cancel_all(self, params):
+        cancelled, self.orders = self.orders, []
+        return {"list": [{"orderId": order["orderId"], "orderLinkId": ""} for order in cancelled], "success": "1"}
+
+    def rest_disconnect(self, params):
+        return {"disconnected": self.disconnect_all(abrupt=str(params.get("abrupt", "true")).lower() == "true")}
+
+    ROUTES = {
+        ("GET", "/v5/market/tickers"): rest_tickers,
+        ("GET", "/v5/market/kline"): rest_kline,
+        ("GET", "/v5/market/instruments-info"): rest_instruments_info,
+        ("GET", "/v5/account/fee-rate"): rest_fee_rate,
+        ("GET", "/v5/position/list"): rest_positions,
+        ("POST", "/v5/order/create"): rest_order_create,
+        ("POST", "/v5/order/cancel-all"): rest_cancel_all,
+        ("POST", "/fake/disconnect"): rest_disconnect,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный заменитель Bybit v5 (REST + WebSocket tickers)")
+    parser.add_argument("--symbols", type=int, default=500, help="число синтетических символов")
+    parser.add_argument("--rate", type=float, default=20, help="тиков в секунду на символ")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--rest-port", type=int, default=18080)
+    parser.add_argument("--ws-port", type=int, default=18081)
+    parser.add_argument("--replay", help="CSV symbol,price для воспроизведения вместо случайного блуждания")
+    parser.add_argument("--disconnect-every", type=float, help="разрывать WebSocket-соединения каждые N секунд")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    prices = ReplayPrices(args.replay) if args.replay else None
+    symbols = list(prices.paths) if prices else fakes.fake_symbols(args.symbols, args.seed)
+    server = FakeBybitServer(symbols, args.host, args.rest_port, args.ws_port, prices=prices, ticks_per_second=args.rate,
+                             seed=args.seed, disconnect_every=args.disconnect_every).start()
+    # Строка готовности для load_test.py и других запускающих процессов
+    print(f"READY {server.rest_url} {server.ws_url}", flush=True)
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(f"Отправлено сообщений: {server.sent_messages}, соединений: {len(server.connections)}")
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
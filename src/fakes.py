@@ -0,0 +1,257 @@
+import random
+import time
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import a1_to_rowcol, column_letter_to_index
+
+# Офлайн-заменители Google Sheets и Bybit для бенчмарков и локальных прогонов.
+# Все данные генерируются детерминированно из seed, поэтому прогоны повторяемы.
+
+def _trim(values):
+    """Как Sheets API: пустые значения в конце строки/столбца не возвращаются."""
+    end = len(values)
+    while end and values[end - 1] in ("", None):
+        end -= 1
+    return values[:end]
+
+class FakeWorksheet:
+    """Лист в памяти с подмножеством методов gspread.Worksheet, которые использует проект."""
+
+    def __init__(self, title, rows):
+        self.title = title
+        self.rows = [list(row) for row in rows]
+        self.updated_cells = 0
+
+    def _ensure(self, row, col):
+        while len(self.rows) < row:
+            self.rows.append([])
+        line = self.rows[row - 1]
+        if len(line) < col:
+            line.extend([""] * (col - len(line)))
+
+    def get_all_values(self, value_render_option=None):
+        width = max((len(row) for row in self.rows), default=0)
+        return [list(row) + [""] * (width - len(row)) for row in self.rows]
+
+    def row_values(self, row):
+        return _trim([str(value) for value in self.rows[row - 1]]) if row <= len(self.rows) else []
+
+    def col_values(self, col):
+        return _trim([str(row[col - 1]) if len(row) >= col else "" for row in self.rows])
+
+    def update_cell(self, row, col, value):
+        self._ensure(row, col)
+        self.rows[row - 1][col - 1] = value
+        self.updated_cells += 1
+
+    def batch_update(self, data, **kwargs):
+        total = 0
+        for block in data:
+            start = block["range"].split(":")[0]
+            row, col = a1_to_rowcol(start)
+            for row_offset, values in enumerate(block["values"]):
+                for col_offset, value in enumerate(values):
+                    self.update_cell(row + row_offset, col + col_offset, value)
+                    total += 1
+        return {"totalUpdatedCells": total}
+
+    def append_rows(self, values, **kwargs):
+        self.rows.extend(list(row) for row in values)
+
+    def delete_rows(self, start_index, end_index=None):
+        del self.rows[start_index - 1:(end_index or start_index)]
+
+    def clear(self):
+        self.rows = []
+
+class FakeSpreadsheet:
+    """Таблица в памяти: worksheet(), worksheets() и values_batch_get() как у gspread.Spreadsheet."""
+
+    def __init__(self, sheets):
+        self.sheets = {title: FakeWorksheet(title, rows) for title, rows in sheets.items()}
+        self.requests = 0
+
+    def worksheet(self, title):
+        self.requests += 1
+        if title not in self.sheets:
+            raise WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def worksheets(self):
+        self.requests += 1
+        return list(self.sheets.values())
+
+    def values_batch_get(self, ranges, params=None):
+        self.requests += 1
+        by_columns = (params or {}).get("majorDimension") == "COLUMNS"
+        value_ranges = []
+        for range_name in ranges:
+            title, _, cols = range_name.partition("!")
+            first, _, last = cols.partition(":")
+            first_col = column_letter_to_index(first)
+            last_col = column_letter_to_index(last or first)
+            rows = self.sheets[title].rows if title in self.sheets else []
+            columns = [
+                _trim([str(row[col - 1]) if len(row) >= col else "" for row in rows])
+                for col in range(first_col, last_col + 1)
+            ]
+            if by_columns:
+                values = _trim(columns) if any(columns) else []
+            else:
+                height = max((len(column) for column in columns), default=0)
+                values = [_trim([column[i] if i < len(column) else "" for column in columns]) for i in range(height)]
+            value_ranges.append({"range": range_name, "values": values})
+        return {"valueRanges": value_ranges}
+
+class FakeWebSocket:
+    """Запоминает колбэки подписок; сообщения подаются вызовом deliver()."""
+
+    def __init__(self):
+        self.callbacks = {}
+
+    def ticker_stream(self, symbol, callback):
+        self.callbacks[symbol] = callback
+
+    def deliver(self, message):
+        self.callbacks[message["topic"].split(".")[1]](message)
+
+    def is_connected(self):
+        return True
+
+    def exit(self):
+        self.callbacks.clear()
+
+class FakeBybitAPI:
+    """Детерминированный Bybit: свечи — случайное блуждание от seed, объёмы и каталог постоянны."""
+
+    def __init__(self, symbols, seed=0):
+        self.symbols = list(symbols)
+        self.seed = seed
+        self.requests = 0
+        self.ws = FakeWebSocket()
+
+    def _rng(self, symbol):
+        return random.Random(f"{self.seed}:{symbol}")
+
+    def base_price(self, symbol):
+        return round(self._rng(symbol).uniform(0.05, 500), 4)
+
+    def get_24h_volume(self, symbol):
+        self.requests += 1
+        # Примерно две трети символов проходят фильтр объема populate_historical_data
+        return round(self._rng(symbol).uniform(1e6, 1.5e8), 2)
+
+    def get_daily_candles(self, symbol, days=31):
+        self.requests += 1
+        rng = self._rng(symbol)
+        price = self.base_price(symbol)
+        day_ms = 86_400_000
+        start = (int(time.time() * 1000) // day_ms - 1) * day_ms
+        candles = []
+        for day in range(days):
+            open_price = price
+            close = max(open_price * (1 + rng.gauss(0, 0.03)), 1e-6)
+            high = max(open_price, close) * (1 + abs(rng.gauss(0, 0.01)))
+            low = min(open_price, close) * (1 - abs(rng.gauss(0, 0.01)))
+            candles.append((start - day * day_ms, open_price, high, low, close))
+            price = close
+        return candles
+
+    def get_minute_candles(self, symbol, start_ms, end_ms):
+        self.requests += 1
+        rng = random.Random(f"{self.seed}:{symbol}:{start_ms}")
+        price = self.base_price(symbol)
+        candles = []
+        for open_time in range(start_ms // 60_000 * 60_000, end_ms + 1, 60_000):
+            close = max(price * (1 + rng.gauss(0, 0.003)), 1e-6)
+            high = max(price, close) * (1 + abs(rng.gauss(0, 0.001)))
+            low = min(price, close) * (1 - abs(rng.gauss(0, 0.001)))
+            candles.append((open_time, price, high, low, close))
+            price = close
+        return candles
+
+    def get_futures_instruments_info(self, limit=1000, symbol=None):
+        self.requests += 1
+        return [
+            {
+                "symbol": name,
+                "priceFilter": {"tickSize": "0.0001", "minPrice": "0.0001", "maxPrice": "199999.98"},
+                "lotSizeFilter": {"minOrderQty": "0.1", "qtyStep": "0.1", "maxOrderQty": "1000000"}
+            }
+            for name in self.symbols
+            if symbol is None or name == symbol
+        ]
+
+    def get_all_fee_rates(self):
+        self.requests += 1
+        return {symbol: (0.0002, 0.00055) for symbol in self.symbols}
+
+    def create_websocket(self, **kwargs):
+        return FakeWebSocket()
+
+    def subscribe_to_ticker(self, symbols, callback, ws=None):
+        pass
+
+def fake_symbols(count, seed=0):
+    """Детерминированный список тикеров вида XXXUSDT."""
+    rng = random.Random(seed)
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    symbols = []
+    while len(symbols) < count:
+        symbol = "".join(rng.choice(letters) for _ in range(rng.randint(3, 5))) + "USDT"
+        if symbol not in symbols:
+            symbols.append(symbol)
+    return symbols
+
+def analitics_rows(symbols, bybit, seed=0, trading_share=0.5, level_offset=0.03):
+    """Лист analitics: D — Торговля, G — монета, J/M — уровни LONG/SHORT на level_offset от базовой цены."""
+    rng = random.Random(seed)
+    rows = [[""] * 13]
+    rows[0][3], rows[0][6], rows[0][9], rows[0][12] = "Торговля", "Монета", "Уровень 1 - LONG", "Уровень 1 - SHORT"
+    for symbol in symbols:
+        price = bybit.base_price(symbol)
+        row = [""] * 13
+        row[3] = "TRUE" if rng.random() < trading_share else "FALSE"
+        row[6] = symbol
+        row[9] = str(round(price * (1 - level_offset), 6))
+        row[12] = str(round(price * (1 + level_offset), 6))
+        rows.append(row)
+    return rows
+
+def trade_sheet_rows(symbols, bybit, seed=0, pending_share=0.1, rows_count=500):
+    """Лист long/short: F — Вход в сделку, G — статус, H — монета, Y–AB — цена, количество, TP, SL."""
+    rng = random.Random(seed)
+    rows = [[""] * 28 for _ in range(rows_count)]
+    for row in rows[1:]:
+        symbol = rng.choice(symbols)
+        price = bybit.base_price(symbol)
+        row[5] = "TRUE" if rng.random() < pending_share else "FALSE"
+        row[7] = symbol
+        row[24] = str(price)
+        row[25] = str(round(rng.uniform(1, 100), 1))
+        row[26] = str(round(price * 1.05, 4))
+        row[27] = str(round(price * 0.97, 4))
+    return rows
+
+def database_rows(symbols, headers, bybit=None, seed=0, atr_share=(0.01, 0.04)):
+    """Лист database после populate_static_data: статичные столбцы A, Q, R, U, V.
+
+    С bybit заполняется и столбец P (ATR) — доля atr_share базовой цены, как после populate_historical_data.
+    """
+    rng = random.Random(seed)
+    rows = [list(headers)]
+    for symbol in symbols:
+        row = [""] * 22
+        row[0], row[16], row[17], row[20], row[21] = symbol, 0.0001, 0.1, 0.00055, 0.0002
+        if bybit is not None:
+            row[15] = round(bybit.base_price(symbol) * rng.uniform(*atr_share), 6)
+        rows.append(row)
+    return rows
+
+def ticker_message(symbol, price, ts_ms):
+    """Сообщение тикера в формате Bybit v5 (поля, которые читает subscribe_to_ticker)."""
+    return {
+        "topic": f"tickers.{symbol}",
+        "type": "snapshot",
+        "ts": ts_ms,
+        "data": {"symbol": symbol, "lastPrice": f"{price:.4f}", "markPrice": f"{price:.4f}"}
+    }
@@ -0,0 +1,271 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from accounts import AccountPool, load_profiles
+from order_validator import OrderValidator
+from metrics import REGISTRY
+from config import FAST_PATH_MODE, FAST_PATH_CONFIRM_SECONDS, FAST_PATH_REFRESH_SECONDS, ORDER_MAX_SLIPPAGE
+
+ARMED = REGISTRY.gauge("fast_path_armed_trades", "Подготовленных сделок быстрого пути", ("side",))
+ARM_SECONDS = REGISTRY.histogram("fast_path_arm_seconds", "Подготовка ордеров сценария (чтение листа и проверка), с")
+SIGNAL_TO_ACK_SECONDS = REGISTRY.histogram(
+    "fast_path_signal_to_order_ack_seconds", "От решения о входе (или нажатия кнопки) до ответов Bybit на все ордера, с"
+)
+FAST_TRADES = REGISTRY.counter("fast_path_trades_total", "Сделок быстрого пути по результату", ("result",))
+
+# Направление сценария TradingEngine -> лист сделок
+SIDES = {"LONG": "long", "SHORT": "short"}
+
+class FastPath:
+    """Быстрый путь входа: ордера сценария готовятся, пока окно группы открыто, и отправляются по решению о входе.
+
+    Когда в окне TradingEngine набирается группа монет, в фоне читаются строки этих монет с листа
+    long/short, ордера проверяются OrderValidator, подписываются стаканы и прогреваются соединения
+    аккаунтов. Решение о входе (fire) в режиме "auto" сразу отправляет ордера на все аккаунты, в режиме
+    "confirm" — присылает одну кнопку в Telegram, нажатие которой отправляет их. Перед отправкой строки
+    получают статус "вход, ожидание"; итоговые статусы в листе и итог в Telegram пишутся после отправки
+    в фоновом потоке.
+    """
+
+    def __init__(self, sheets, accounts, validator, telegram, bybit=None, price_store=None, mode=FAST_PATH_MODE,
+                 confirm_seconds=FAST_PATH_CONFIRM_SECONDS, refresh_seconds=FAST_PATH_REFRESH_SECONDS):
+        self.logger = logging.getLogger(__name__)
+        self.sheets = sheets
+        self.accounts = accounts
+        self.validator = validator
+        self.telegram = telegram
+        self.bybit = bybit  # Клиент с локальными стаканами для проверки проскальзывания (необязателен)
+        self.price_store = price_store  # PriceStore с текущими ценами для проверки цены входа (необязателен)
+        self.mode = mode
+        self.confirm_seconds = confirm_seconds
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        self.coins = {side: set() for side in SIDES}  # Монеты открытого окна
+        self.armed = {side: {} for side in SIDES}  # Монета -> строка листа с проверенным ордером
+        self.armed_at = {side: 0.0 for side in SIDES}
+        self.confirmations = {}  # Токен кнопки -> (направление, сделки, время отправки)
+        # Чтение листа при подготовке, итог в Telegram и запись статусов — вне цикла TradingEngine
+        self.background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fast-path")
+        self.logger.info(f"Быстрый путь входа: режим {mode}, аккаунты {accounts.profiles}")
+
+    def arm(self, side, coins):
+        """Окно группы открыто или в него вошли новые монеты: ордера готовятся в фоне."""
+        coins = set(coins)
+        with self.lock:
+            if coins <= self.coins[side]:
+                return
+            self.coins[side] |= coins
+            self.armed_at[side] = time.monotonic()
+        self.background.submit(self._arm, side)
+
+    def refresh(self):
+        """Повторная подготовка открытых сценариев раз в refresh_seconds: параметры в листе могли измениться."""
+        now = time.monotonic()
+        for side in SIDES:
+            with self.lock:
+                if not self.coins[side] or now - self.armed_at[side] < self.refresh_seconds:
+                    continue
+                self.armed_at[side] = now
+            self.background.submit(self._arm, side)
+
+    def disarm(self, side):
+        """Сценарий отменен: подготовленные ордера сбрасываются."""
+        with self.lock:
+            self.coins[side].clear()
+            self.armed[side] = {}
+        ARMED.set(side, value=0)
+
+    def _arm(self, side):
+        started = time.monotonic()
+        try:
+            with self.lock:
+                coins = set(self.coins[side])
+            if not coins:
+                return
+            rows = {}
+            for trade in self.sheets.get_trade_rows([SIDES[side]]):
+                rows.setdefault(trade["coin"], trade)  # Первая строка монеты на листе
+            armed = {}
+            for coin in sorted(coins):
+                trade = rows.get(coin)
+                if trade is None:
+                    self.logger.info(f"Быстрый путь {side}: нет строки {coin} с параметрами ордера на листе {SIDES[side]}")
+                    continue
+                errors = [order.validation.error for order in self.accounts.prepare(trade, self.validator, self._market_price(coin))]
+                if all(errors):
+                    self.logger.warning(f"Быстрый путь {side}: ордер {coin} не прошел проверку: {errors[0]}")
+                    continue
+                armed[coin] = trade
+            if self.bybit is not None and armed:
+                try:
+                    self.bybit.order_books.track(list(armed))
+                except Exception as e:
+                    self.logger.error(f"Быстрый путь: не удалось подписаться на стаканы: {e}")
+            # Запрос позиций держит открытыми соединения клиентов аккаунтов к моменту отправки
+            open_positions = self.accounts.open_positions()
+            with self.lock:
+                # Монеты, вышедшие из окна, пока шла подготовка (вход или отмена), не сохраняются
+                self.armed[side] = {coin: trade for coin, trade in armed.items() if coin in self.coins[side]}
+                count = len(self.armed[side])
+            ARMED.set(side, value=count)
+            ARM_SECONDS.observe(time.monotonic() - started)
+            self.logger.info(f"Быстрый путь {side}: подготовлено {count} из {len(coins)} сделок, открытых позиций {open_positions}")
+            print(f"Быстрый путь {side}: подготовлено {count} из {len(coins)} сделок")
+        except Exception as e:
+            self.logger.error(f"Быстрый путь {side}: ошибка подготовки ордеров: {e}")
+
+    def fire(self, side):
+        """Решение TradingEngine о входе; возвращает False, если подготовленных ордеров нет."""
+        fired_at = time.monotonic()
+        with self.lock:
+            trades = list(self.armed[side].values())
+            self.coins[side].clear()
+            self.armed[side] = {}
+        ARMED.set(side, value=0)
+        if not trades:
+            self.logger.warning(f"Быстрый путь {side}: подготовленных ордеров нет")
+            return False
+        if self.mode == "auto":
+            self._submit(side, trades, fired_at)
+        else:
+            self._request_confirmation(side, trades)
+        return True
+
+    def _request_confirmation(self, side, trades):
+        token = uuid.uuid4().hex[:12]
+        with self.lock:
+            self.confirmations[token] = (side, trades, time.monotonic())
+        lines = [f"Быстрый вход {side}: сделок {len(trades)}, ордера проверены"]
+        for trade in trades:
+            lines.append(f"{trade['coin']}: цена {trade['entry_price']}, количество {trade['qty']}, "
+                         f"стоп-лосс {trade['stop_loss']}, тейк-профит {trade['take_profit'] or 'не установлен'}")
+        lines.append(f"Кнопка действует {self.confirm_seconds:.0f} с")
+        # Разметка клавиатуры Bot API без python-telegram-bot: trading_engine может работать без него
+        reply_markup = {"inline_keyboard": [[
+            {"text": "Войти", "callback_data": f"fast:yes:{token}"},
+            {"text": "Отмена", "callback_data": f"fast:no:{token}"}
+        ]]}
+        if self.telegram.send("\n".join(lines), reply_markup=reply_markup) is None:
+            with self.lock:
+                self.confirmations.pop(token, None)
+            self.logger.error(f"Быстрый путь {side}: не удалось отправить запрос подтверждения")
+
+    def handle_callback(self, data):
+        """Нажатие кнопки "fast:<yes|no>:<токен>"; возвращает текст ответа в чат."""
+        _, action, token = data.split(":", 2)
+        with self.lock:
+            pending = self.confirmations.pop(token, None)
+        if pending is None:
+            return "Быстрый вход не найден или уже обработан."
+        side, trades, sent_at = pending
+        if action != "yes":
+            self.logger.info(f"Быстрый вход {side} отменен пользователем")
+            FAST_TRADES.inc("cancelled", amount=len(trades))
+            return f"Быстрый вход {side} отменен."
+        if time.monotonic() - sent_at > self.confirm_seconds:
+            self.logger.warning(f"Быстрый вход {side}: кнопка нажата после {self.confirm_seconds:.0f} с, ордера не отправлены")
+            FAST_TRADES.inc("expired", amount=len(trades))
+            return f"Быстрый вход {side} устарел, ордера не отправлены."
+        self.logger.info(f"Быстрый вход {side} подтвержден пользователем (кнопка)")
+        self._submit(side, trades, time.monotonic())
+        return f"Быстрый вход {side}: ордера отправлены."
+
+    def _submit(self, side, trades, started):
+        # Повторная проверка по текущей цене и стакану — локальная, без запросов к бирже
+        orders, skipped = [], {}
+        for trade in trades:
+            error = self._slippage_error(trade)
+            if error:
+                skipped[trade["coin"]] = error
+                continue
+            # Статус до отправки: TradeManager не запросит подтверждение той же строки, если в ней стоит TRUE
+            try:
+                self.sheets.update_trade_status(trade["sheet"], trade["row"], "вход, ожидание")
+            except Exception as e:
+                skipped[trade["coin"]] = "не удалось отметить строку в листе"
+                self.logger.error(f"Быстрый путь: строка {trade['coin']} не отмечена, ордер не отправлен: {e}")
+                continue
+            orders.extend(self.accounts.prepare(trade, self.validator, self._market_price(trade["coin"])))
+        results = self.accounts.submit(orders)
+        elapsed = time.monotonic() - started
+        SIGNAL_TO_ACK_SECONDS.observe(elapsed)
+        by_coin = {}
+        for order, result in zip(orders, results):
+            by_coin.setdefault(order.symbol, []).append(result)
+        self.logger.info(f"Быстрый вход {side}: {len(orders)} ордеров за {elapsed:.3f} с")
+        self.background.submit(self._report, side, trades, by_coin, skipped, elapsed)
+
+    def _market_price(self, coin):
+        value = self.price_store.get(coin) if self.price_store is not None else None
+        return value[0] if value else None
+
+    def _slippage_error(self, trade):
+        """Проскальзывание по локальному стакану без ожидания снимка (нет данных — не ограничивается)."""
+        if self.bybit is None or not ORDER_MAX_SLIPPAGE:
+            return None
+        book = self.bybit.order_books.get(trade["coin"])
+        if book is None:
+            return None
+        qty = trade["qty"] * sum(profile.size_multiplier for profile in self.accounts.profiles)
+        estimate = book.estimate_fill(trade["side"], qty, trade["entry_price"])
+        if estimate and estimate.filled_qty and estimate.slippage > ORDER_MAX_SLIPPAGE:
+            return f"проскальзывание {estimate.slippage:.2%} больше {ORDER_MAX_SLIPPAGE:.2%}"
+        return None
+
+    def _report(self, side, trades, by_coin, skipped, elapsed):
+        """Итог в Telegram и статусы строк в листе после отправки ордеров."""
+        lines = [f"Быстрый вход {side}: ордера отправлены за {elapsed:.2f} с"]
+        statuses = []
+        for trade in trades:
+            coin = trade["coin"]
+            results = by_coin.get(coin, [])
+            executed = [result for result in results if result.order_id]
+            if coin in skipped:
+                status, result_name = f"отменено: {skipped[coin]}", "cancelled"
+            elif not executed and all(result.rejected for result in results):
+                reasons = {result.error for result in results}
+                reason = reasons.pop() if len(reasons) == 1 else "; ".join(f"{result.account}: {result.error}" for result in results)
+                status, result_name = f"отменено: {reason}", "cancelled"
+            elif len(executed) == len(results):
+                status, result_name = "вход выполнен (быстрый путь)", "executed"
+            elif executed:
+                status, result_name = f"вход выполнен: {len(executed)} из {len(results)} (быстрый путь)", "executed"
+            else:
+                status, result_name = "ошибка входа (быстрый путь)", "failed"
+            FAST_TRADES.inc(result_name)
+            statuses.append((trade, status))
+            lines.append(f"{coin}: {status}")
+            for result in results:
+                if result.order_id:
+                    lines.append(f"  {result.account}: Order ID: {result.order_id}, количество {result.qty}")
+                elif not result.rejected:
+                    lines.append(f"  {result.account}: не выполнена — {result.error}")
+        self.telegram.send("\n".join(lines))
+        for trade, status in statuses:
+            try:
+                self.sheets.update_trade_status(trade["sheet"], trade["row"], status)
+                self.sheets.cancel_trade(trade["sheet"], trade["row"])  # Сбрасываем флаг TRUE, как TradeManager
+            except Exception as e:
+                self.logger.error(f"Быстрый путь: не удалось записать статус {trade['coin']}: {e}")
+
+    def close(self):
+        self.background.shutdown(wait=False)
+
+def build_fast_path(sheets, bybit, telegram, price_store=None, accounts=None, validator=None, mode=FAST_PATH_MODE):
+    """FastPath для режима mode или None, если быстрый путь выключен.
+
+    Аккаунты и проверку ордеров можно передать общие с TradeManager (orchestrator.py).
+    """
+    if mode not in ("auto", "confirm"):
+        return None
+    return FastPath(
+        sheets,
+        accounts or AccountPool(load_profiles(primary_bybit=bybit)),
+        validator or OrderValidator(bybit, storage=sheets.storage),
+        telegram,
+        bybit=bybit,
+        price_store=price_store,
+        mode=mode
+    )
@@ -5,7 +5,15 @@ from datetime import datetime
 from bybit_api import BybitAPI
 import requests
 from google_sheets import GoogleSheetsClient
+from storage import create_storage
+from price_bus import PriceBusWriter
+from price_store import PriceStore
+from ws_supervisor import FeedSupervisor
+from telegram_bot import send_telegram_message
+from metrics import REGISTRY
+from log_setup import setup_logger
 from config import GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID  # Добавляем импорт
+from config import PRICE_BUS_NAME, PRICE_BUS_CAPACITY, BYBIT_REST_URL
 
 # Создаем директорию для логов
 log_dir = "logs"
@@ -16,44 +24,53 @@ if not os.path.exists(log_dir):
 current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 log_file = os.path.join(log_dir, f"fetch_prices_{current_time}.log")
 
-# Создаем логгер для fetch_prices
-logger = logging.getLogger("fetch_prices")
-logger.setLevel(logging.INFO)
+# Создаем логгер для fetch_prices (запись в файл и консоль выполняется в фоновом потоке)
+setup_logger("fetch_prices", log_file, mode='w')
 
-# Создаем файловый обработчик
-file_handler = logging.FileHandler(log_file, mode='w', encoding='utf-8')
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(file_handler)
-
-# Добавляем консольный обработчик
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(console_handler)
+SUBSCRIBED_SYMBOLS = REGISTRY.gauge("price_fetcher_subscribed_symbols", "Символов с подпиской на тикер")
+PRICE_UPDATES = REGISTRY.counter("price_fetcher_updates_total", "Обработанных обновлений цены")
 
 class PriceFetcher:
-    def __init__(self):
+    def __init__(self, google_sheets=None, bybit_api=None, trading_coins=None, price_bus=None, notify=None):
         self.logger = logging.getLogger("fetch_prices")
         self.logger.info("Инициализация PriceFetcher")
         print("Инициализация PriceFetcher...")
 
-        # Получаем монеты из Google Sheets
-        google_sheets = GoogleSheetsClient(GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID)  # Обновляем вызов
-        self.trading_coins = google_sheets.get_trading_coins()
+        # Получаем монеты из Google Sheets, если список не передан (например, из PriceMonitor)
+        if trading_coins is None:
+            google_sheets = google_sheets or GoogleSheetsClient(GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID, storage=create_storage())
+            trading_coins = google_sheets.get_trading_coins()
+        self.trading_coins = trading_coins
         self.symbols = [coin["coin"] for coin in self.trading_coins]
 
         # Логируем список монет
         self.logger.info(f"Получено {len(self.trading_coins)} монет для мониторинга: {self.symbols}")
         print(f"Получено {len(self.trading_coins)} монет для мониторинга: {self.symbols}")
 
-        self.bybit_api = BybitAPI()
-        self.current_prices = {symbol: 0.0 for symbol in self.symbols}
+        self.bybit_api = bybit_api or BybitAPI()
+        # Последние цены и время биржи; в хранилище регистрируются только прошедшие проверку символы
+        self.store = PriceStore(capacity=len(self.symbols))
         self.valid_symbols = []
         self.running = True
+        # Надзор за WebSocket-потоком создается после проверки символов; уведомления о разрывах — в Telegram
+        self.supervisor = None
+        # Обработчики разрывов потока (symbols, gap_start, gap_end), передаются в FeedSupervisor
+        self.gap_listeners = []
+        self.notify = notify or send_telegram_message
+
+        # Публикация цен для других процессов (trade_manager и т.д.) без отдельных WebSocket-подключений
+        self.price_bus = price_bus
+        if self.price_bus is None and PRICE_BUS_NAME:
+            try:
+                self.price_bus = PriceBusWriter(PRICE_BUS_NAME, self.symbols, capacity=max(PRICE_BUS_CAPACITY, len(self.symbols)))
+            except Exception as e:
+                self.logger.error(f"Не удалось создать шину цен {PRICE_BUS_NAME}: {e}")
+                print(f"Не удалось создать шину цен {PRICE_BUS_NAME}: {e}")
 
     def validate_symbol(self, symbol):
         """Проверяет валидность символа через REST API."""
         try:
-            base_url = "https://api.bybit.com"
+            base_url = BYBIT_REST_URL.rstrip("/")
             endpoint = "/v5/market/instruments-info"
             params = {"category": "linear", "symbol": symbol}
             response = requests.get(base_url + endpoint, params=params)
@@ -70,38 +87,46 @@ class PriceFetcher:
             print(f"Ошибка проверки символа {symbol}: {e}")
             return False
 
-    def handle_price_update(self, symbol, last_price):
+    def handle_price_update(self, symbol, last_price, exchange_ts=None):
         """Обработка обновления цены."""
-        if symbol in self.valid_symbols:
-            self.current_prices[symbol] = last_price
-            self.logger.debug(f"Обновлена цена для {symbol}: {last_price}")
-            print(f"Обновлена цена для {symbol}: {last_price}")
+        exchange_ts = exchange_ts or time.time()
+        # Тики символов, не прошедших проверку, хранилище отбрасывает (поиск ID в словаре, O(1))
+        if self.store.update_symbol(symbol, last_price, exchange_ts) is not None:
+            PRICE_UPDATES.inc()
+            if self.price_bus is not None:
+                self.price_bus.publish_symbol(symbol, last_price, exchange_ts)
 
     def reconnect(self):
-        """Переподключение WebSocket при разрыве."""
+        """Переподключение WebSocket: все шарды переподписываются на уже проверенные символы."""
         self.logger.warning("Попытка переподключения WebSocket...")
         print("Попытка переподключения WebSocket...")
-        self.bybit_api = BybitAPI()
-        self.valid_symbols = []
-        self.subscribe_to_valid_symbols()
+        if self.supervisor is None:
+            self.subscribe_to_valid_symbols()
+        else:
+            self.supervisor.restart_all()
+
+    def set_valid_symbols(self, symbols):
+        """Запоминает прошедшие проверку символы и регистрирует их в хранилище цен."""
+        self.valid_symbols = list(symbols)
+        for symbol in self.valid_symbols:
+            self.store.add_symbol(symbol)
 
     def subscribe_to_valid_symbols(self):
         """Подписка только на валидные символы."""
-        self.valid_symbols = [s for s in self.symbols if self.validate_symbol(s)]
+        self.set_valid_symbols(s for s in self.symbols if self.validate_symbol(s))
         if not self.valid_symbols:
             self.logger.error("Не удалось найти валидные символы. Завершаем работу.")
             print("Не удалось найти валидные символы. Завершаем работу.")
             self.running = False
             return
 
-        for symbol in self.valid_symbols:
-            try:
-                self.bybit_api.subscribe_to_ticker([symbol], self.handle_price_update)
-                self.logger.info(f"Успешно подписались на {symbol}")
-                print(f"Успешно подписались на {symbol}")
-            except Exception as e:
-                self.logger.error(f"Ошибка подписки на {symbol}: {e}")
-                print(f"Ошибка подписки на {symbol}: {e}")
+        SUBSCRIBED_SYMBOLS.set(value=len(self.valid_symbols))
+        # Подписки по шардам; переподключения и переподписку дальше выполняет FeedSupervisor
+        self.supervisor = FeedSupervisor(self.bybit_api, self.store, self.valid_symbols, self.handle_price_update, notify=self.notify)
+        self.supervisor.gap_listeners = self.gap_listeners
+        self.supervisor.start()
+        self.logger.info(f"Подписка на {len(self.valid_symbols)} символов в {len(self.supervisor.shards)} соединениях")
+        print(f"Подписка на {len(self.valid_symbols)} символов в {len(self.supervisor.shards)} соединениях")
 
     def run(self):
         """Запуск получения цен."""
@@ -114,31 +139,27 @@ class PriceFetcher:
         if not self.valid_symbols:
             return
 
-        # Бесконечный цикл с логированием цен
+        # Бесконечный цикл с логированием цен; за соединениями следит FeedSupervisor, ошибка итерации цикл не прерывает
+        self.logger.info("Начало мониторинга цен...")
+        print("Начало мониторинга цен...")
         try:
-            self.logger.info("Начало мониторинга цен...")
-            print("Начало мониторинга цен...")
             while self.running:
-                prices_str = ", ".join(
-                    f"{symbol}: {price}" for symbol, price in self.current_prices.items()
-                    if symbol in self.valid_symbols
-                )
-                self.logger.info(f"Текущие цены: {prices_str}")
-                print(f"Текущие цены: {prices_str}")
+                try:
+                    prices_str = ", ".join(f"{symbol}: {price}" for symbol, price in self.get_current_prices().items())
+                    self.logger.info(f"Текущие цены: {prices_str}")
+                    print(f"Текущие цены: {prices_str}")
+                except Exception as e:
+                    self.logger.error(f"Неожиданная ошибка в цикле: {e}")
+                    print(f"Неожиданная ошибка в цикле: {e}")
                 time.sleep(10)
         except KeyboardInterrupt:
             self.logger.info("Остановлено пользователем")
             print("Остановлено пользователем")
-        except Exception as e:
-            self.logger.error(f"Неожиданная ошибка в цикле: {e}")
-            print(f"Неожиданная ошибка в цикле: {e}")
-            self.reconnect()
-            if self.running:
-                time.sleep(5)
+        self.supervisor.stop()
 
     def get_current_prices(self):
-        """Метод для получения текущих цен."""
-        return self.current_prices
+        """Метод для получения текущих цен (копия из согласованного снимка хранилища)."""
+        return self.store.snapshot().as_dict()
 
 if __name__ == "__main__":
     fetcher = PriceFetcher()
@@ -0,0 +1,54 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import REGISTRY
+from config import GAP_RECOVERY_WORKERS, GAP_RECOVERY_MAX_MINUTES
+
+RECOVERIES = REGISTRY.counter("gap_recovery_runs_total", "Доборов пропущенных пересечений после разрывов", ("source",))
+RECOVERY_SECONDS = REGISTRY.histogram("gap_recovery_seconds", "Время добора по минутным свечам, с")
+MINUTE_MS = 60_000
+
+class GapRecovery:
+    """Загружает минутные свечи за интервал разрыва потока параллельно по символам.
+
+    Свечи отдаются в PriceMonitor.check_range, который по high/low находит пропущенные
+    пересечения уровней и создает оповещения с их настоящим временем.
+    """
+
+    def __init__(self, bybit_api, workers=GAP_RECOVERY_WORKERS):
+        self.logger = logging.getLogger(__name__)
+        self.bybit_api = bybit_api
+        self.workers = workers
+
+    def fetch(self, symbols, gap_start, gap_end):
+        """{symbol: [(start_ms, open, high, low, close), ...]} по возрастанию времени за [gap_start, gap_end] (с)."""
+        end_ms = int(gap_end * 1000)
+        # Свеча, в которой начался разрыв, тоже нужна: пересечение могло случиться сразу после последнего тика
+        start_ms = max(int(gap_start * 1000) // MINUTE_MS * MINUTE_MS, end_ms - GAP_RECOVERY_MAX_MINUTES * MINUTE_MS)
+        if start_ms > int(gap_start * 1000):
+            self.logger.warning(f"Разрыв длиннее {GAP_RECOVERY_MAX_MINUTES} минут: добираются только последние")
+
+        def load(symbol):
+            return symbol, self.bybit_api.get_minute_candles(symbol, start_ms, end_ms)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(symbols)))) as pool:
+            return dict(pool.map(load, symbols))
+
+    def recover(self, monitor, symbols, gap_start, gap_end, source="feed"):
+        """Добирает пересечения за разрыв для символов и возвращает число новых оповещений."""
+        started = time.monotonic()
+        symbols = monitor.symbols_to_watch(symbols)
+        if not symbols or gap_end <= gap_start:
+            return 0
+        candles = self.fetch(symbols, gap_start, gap_end)
+        alerts = 0
+        for symbol, symbol_candles in candles.items():
+            alerts += monitor.check_range(symbol, [
+                (max(start_ms / 1000, gap_start), open_price, high, low, close)
+                for start_ms, open_price, high, low, close in symbol_candles
+                if start_ms + MINUTE_MS > gap_start * 1000
+            ])
+        RECOVERIES.inc(source)
+        RECOVERY_SECONDS.observe(time.monotonic() - started)
+        self.logger.info(f"Добор разрыва {gap_end - gap_start:.0f} с ({source}) по {len(symbols)} символам: оповещений {alerts}")
+        return alerts
@@ -1,10 +1,17 @@
 import gspread
+from gspread.utils import rowcol_to_a1
 from google.oauth2.service_account import Credentials
+import json
 import logging
 import os
+import threading
+import time
+import zlib
+from log_setup import setup_logger
+from metrics import REGISTRY
 
 try:
-    from config import GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID
+    from config import GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID, SHEETS_REQUESTS_PER_MINUTE
 except ImportError as e:
     print(f"Ошибка импорта из config.py: {str(e)}")
     raise
@@ -14,33 +21,58 @@ project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 log_dir = os.path.join(project_dir, "Logs")
 os.makedirs(log_dir, exist_ok=True)
 
-# Отладочный вывод пути
-print(f"Текущая директория: {os.getcwd()}")
-print(f"Путь к папке логов: {log_dir}")
-
 # Путь к файлу логов
 log_file = os.path.join(log_dir, "google_sheets.log")
 
-# Настройка логирования с выводом в консоль и файл
-logging.basicConfig(
-    level=logging.DEBUG,  # Установлен уровень DEBUG для детального вывода
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file, mode='a', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
-
-# Проверка, работает ли FileHandler
-try:
-    logging.info(f"Лог-файл настроен на: {log_file}")
-    print(f"Лог-файл настроен на: {log_file}")
-except Exception as e:
-    print(f"Ошибка настройки лога: {str(e)}")
-    logging.error(f"Ошибка настройки лога: {str(e)}")
+# Корневой логгер пишет в консоль и файл из фонового потока; уровень задает LOG_LEVEL (по умолчанию INFO)
+setup_logger(None, log_file)
+logging.info(f"Лог-файл настроен на: {log_file}")
+
+REQUEST_SECONDS = REGISTRY.histogram("sheets_request_seconds", "Время запросов к Google Sheets API, с", ("method",))
+QUOTA_WAIT_SECONDS = REGISTRY.histogram("sheets_quota_wait_seconds", "Ожидание токена квоты Google Sheets, с")
+QUOTA_TOKENS = REGISTRY.gauge("sheets_quota_tokens", "Остаток токенов квоты Google Sheets")
+QUOTA_USED = REGISTRY.counter("sheets_requests_total", "Запросов к Google Sheets API")
+
+class SheetsQuota:
+    """Токен-бакет на запросы к Google Sheets API.
+
+    Один экземпляр разделяется всеми сервисами, которые работают через общий GoogleSheetsClient,
+    поэтому суммарная нагрузка не превышает requests_per_minute.
+    """
+
+    def __init__(self, requests_per_minute):
+        self.capacity = float(requests_per_minute)
+        self.rate = requests_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Забирает один токен, при исчерпании бюджета ждет его пополнения."""
+        started = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.used += 1
+                    QUOTA_USED.inc()
+                    QUOTA_TOKENS.set(value=self.tokens)
+                    QUOTA_WAIT_SECONDS.observe(now - started)
+                    return
+                wait = (1 - self.tokens) / self.rate
+            logging.debug(f"Квота Google Sheets исчерпана, ожидание {wait:.2f} с")
+            time.sleep(wait)
 
 class GoogleSheetsClient:
-    def __init__(self, credentials_file, spreadsheet_id):
+    TRADE_SHEETS = ["long", "short"]
+    # F–H: Вход в сделку, Статус сделки, Монета; Y–AB: Т вх, Кол. монет, Тейк-профит, Стоп-лосс
+    TRADE_RANGES = ["F:H", "Y:AB"]
+
+    def __init__(self, credentials_file, spreadsheet_id, storage=None, quota=None, spreadsheet=None):
         logging.info("Инициализация GoogleSheetsClient")
         print("Инициализация GoogleSheetsClient")
         logging.info(f"GOOGLE_SHEETS_CREDENTIALS: {credentials_file}")
@@ -48,6 +80,20 @@ class GoogleSheetsClient:
         print(f"GOOGLE_SHEETS_CREDENTIALS: {credentials_file}")
         print(f"GOOGLE_SHEETS_ID: {spreadsheet_id}")
 
+        # Все запросы клиента (включая запросы через дескрипторы листов) проходят через общий бюджет квоты
+        self.quota = quota or SheetsQuota(SHEETS_REQUESTS_PER_MINUTE)
+        # Готовую таблицу можно передать извне (например, офлайн-таблицу из fakes.py для бенчмарков)
+        self.client = None
+        self.spreadsheet = spreadsheet if spreadsheet is not None else self._open_spreadsheet(credentials_file, spreadsheet_id)
+
+        # Кэш дескрипторов листов и заголовков: worksheet() каждый раз запрашивает метаданные таблицы
+        self._worksheets = {}
+        self._headers = {}
+        # Локальное хранилище (storage.Storage), куда зеркалируются уровни с листа analitics
+        self.storage = storage
+
+    def _open_spreadsheet(self, credentials_file, spreadsheet_id):
+        """Авторизуется сервисным аккаунтом и открывает таблицу; запросы клиента идут через квоту."""
         scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
         try:
             creds = Credentials.from_service_account_file(credentials_file, scopes=scope)
@@ -57,20 +103,55 @@ class GoogleSheetsClient:
             raise
 
         self.client = gspread.authorize(creds)
+
+        request = self.client.request
+
+        def limited_request(method, *args, **kwargs):
+            self.quota.acquire()
+            started = time.monotonic()
+            try:
+                return request(method, *args, **kwargs)
+            finally:
+                REQUEST_SECONDS.observe(time.monotonic() - started, method)
+
+        self.client.request = limited_request
         try:
-            self.spreadsheet = self.client.open_by_key(spreadsheet_id)
+            spreadsheet = self.client.open_by_key(spreadsheet_id)
             logging.info(f"Подключение к таблице с ID: {spreadsheet_id}")
             print(f"Подключение к таблице с ID: {spreadsheet_id}")
+            return spreadsheet
         except Exception as e:
             logging.error(f"Ошибка при подключении к таблице: {str(e)}")
             print(f"Ошибка при подключении к таблице: {str(e)}")
             raise
 
-    def get_sheet(self, sheet_name):
+    def _worksheet(self, sheet_name):
+        """Возвращает дескриптор листа из кэша, запрашивая метаданные только при промахе."""
+        worksheet = self._worksheets.get(sheet_name)
+        if worksheet is not None:
+            return worksheet
         logging.info(f"Попытка получить лист: {sheet_name}")
         print(f"Попытка получить лист: {sheet_name}")
         try:
-            return self.spreadsheet.worksheet(sheet_name)
+            worksheet = self.spreadsheet.worksheet(sheet_name)
+        except gspread.exceptions.WorksheetNotFound:
+            self.invalidate_worksheet(sheet_name)
+            raise
+        self._worksheets[sheet_name] = worksheet
+        return worksheet
+
+    def invalidate_worksheet(self, sheet_name=None):
+        """Сбрасывает кэш дескриптора и заголовков листа (или всех листов, если имя не указано)."""
+        if sheet_name is None:
+            self._worksheets.clear()
+            self._headers.clear()
+        else:
+            self._worksheets.pop(sheet_name, None)
+            self._headers.pop(sheet_name, None)
+
+    def get_sheet(self, sheet_name):
+        try:
+            return self._worksheet(sheet_name)
         except gspread.exceptions.WorksheetNotFound:
             logging.error(f"Лист {sheet_name} не найден")
             print(f"Лист {sheet_name} не найден")
@@ -81,7 +162,9 @@ class GoogleSheetsClient:
             return None
 
     def list_sheets(self):
-        sheets = [worksheet.title for worksheet in self.spreadsheet.worksheets()]
+        worksheets = self.spreadsheet.worksheets()
+        self._worksheets = {worksheet.title: worksheet for worksheet in worksheets}
+        sheets = list(self._worksheets)
         logging.info(f"Доступные листы: {sheets}")
         print(f"Доступные листы: {sheets}")
         return sheets
@@ -95,6 +178,21 @@ class GoogleSheetsClient:
             logging.error(f"Ошибка при обновлении ячейки: строка {row}, столбец {col}, значение {value}: {str(e)}")
             print(f"Ошибка при обновлении ячейки: строка {row}, столбец {col}, значение {value}: {str(e)}")
 
+    def get_headers(self, sheet_name):
+        """Возвращает заголовки (первую строку) листа, кэшируя их до инвалидации."""
+        headers = self._headers.get(sheet_name)
+        if headers is None:
+            headers = self._worksheet(sheet_name).row_values(1)
+            self._headers[sheet_name] = headers
+        return headers
+
+    def get_header_map(self, sheet_name):
+        """Возвращает словарь {заголовок: номер столбца (с 1)}; для повторяющихся заголовков берется первый."""
+        header_map = {}
+        for col_idx, header in enumerate(self.get_headers(sheet_name), start=1):
+            header_map.setdefault(header, col_idx)
+        return header_map
+
     def get_all_data(self, sheet):
         logging.info("Чтение всех данных из листа")
         print("Чтение всех данных из листа")
@@ -105,14 +203,51 @@ class GoogleSheetsClient:
             print(f"Ошибка при чтении данных из листа: {str(e)}")
             return []
 
+    def write_diff(self, sheet, old_rows, new_rows):
+        """Записывает в лист только изменившиеся ячейки одним batch_update.
+
+        old_rows — текущее содержимое листа (уже прочитанное), new_rows — желаемое.
+        Строки old_rows за пределами new_rows очищаются. Возвращает число записанных ячеек
+        или None, если ответ API не совпал с ожидаемым количеством.
+        """
+        data = diff_ranges(old_rows, new_rows)
+        if not data:
+            logging.info(f"Лист {sheet.title}: изменений нет, запись не требуется")
+            return 0
+        expected_cells = sum(len(block["values"]) * len(block["values"][0]) for block in data)
+        response = sheet.batch_update(data)
+        written_cells = response.get("totalUpdatedCells", 0) if isinstance(response, dict) else 0
+        logging.info(f"Лист {sheet.title}: записано {written_cells} ячеек в {len(data)} диапазонах")
+        if written_cells != expected_cells:
+            logging.error(f"Лист {sheet.title}: ожидалась запись {expected_cells} ячеек, записано {written_cells}")
+            return None
+        return written_cells
+
     def get_trading_coins(self):
+        """Возвращает монеты и уровни с листа analitics, зеркалируя их в локальное хранилище.
+
+        Если лист недоступен, возвращает последние сохраненные в хранилище уровни.
+        """
+        trading_coins = self._read_trading_coins()
+        if self.storage is None:
+            return trading_coins or []
+        if trading_coins is None:
+            trading_coins = self.storage.get_levels()
+            logging.warning(f"Лист analitics недоступен, используем {len(trading_coins)} монет из локального хранилища")
+            print(f"Лист analitics недоступен, используем {len(trading_coins)} монет из локального хранилища")
+            return trading_coins
+        self.storage.replace_levels(trading_coins)
+        return trading_coins
+
+    def _read_trading_coins(self):
+        """Читает лист analitics; возвращает None, если лист прочитать не удалось."""
         logging.info("Начало выполнения get_trading_coins")
         print("Начало выполнения get_trading_coins")
         sheet = self.get_sheet("analitics")
         if not sheet:
             logging.error("Не удалось получить лист analitics")
             print("Не удалось получить лист analitics")
-            return []
+            return None
 
         try:
             trading_column = sheet.col_values(4)  # Столбец D (индекс 4)
@@ -121,7 +256,7 @@ class GoogleSheetsClient:
         except Exception as e:
             logging.error(f"Ошибка при получении столбца Торговля: {str(e)}")
             print(f"Ошибка при получении столбца Торговля: {str(e)}")
-            return []
+            return None
 
         valid_rows = [i for i, status in enumerate(trading_column[1:], start=2) if status.strip().upper() in ["TRUE", "TRU"]]
         logging.info(f"Найдено строк с TRUE: {len(valid_rows)} на индексах: {valid_rows}")
@@ -165,104 +300,178 @@ class GoogleSheetsClient:
         print(f"Найдено {len(trading_coins)} монет для мониторинга")
         return trading_coins
 
+    def get_atr(self):
+        """Возвращает {монета: ATR} со столбца ATR листа database.
+
+        Если лист недоступен, берет ATR из исторических данных локального хранилища.
+        """
+        sheet = self.get_sheet("database")
+        if sheet:
+            try:
+                header_map = self.get_header_map("database")
+                coin_col, atr_col = header_map.get("Монета", 1), header_map.get("ATR")
+                atr = {}
+                if atr_col:
+                    for row in self.get_all_data(sheet)[1:]:
+                        if len(row) >= max(coin_col, atr_col) and row[coin_col - 1]:
+                            value = _to_float(row[atr_col - 1])
+                            if value:
+                                atr[row[coin_col - 1]] = value
+                if atr or self.storage is None:
+                    return atr
+            except Exception as e:
+                logging.error(f"Ошибка при чтении ATR с листа database: {str(e)}")
+                print(f"Ошибка при чтении ATR с листа database: {str(e)}")
+        if self.storage is None:
+            return {}
+        return {symbol: row["atr"] for symbol, row in self.storage.get_historical().items() if row.get("atr")}
+
     def get_pending_trades(self):
-        """Получает список сделок для входа с вкладок long и short."""
+        """Получает список сделок для входа с вкладок long и short одним запросом values_batchGet.
+
+        Возвращает None, если листы прочитать не удалось (в отличие от пустого списка — сделок нет).
+        """
         logging.info("Начало выполнения get_pending_trades")
         print("Начало выполнения get_pending_trades")
+
+        blocks = self._read_trade_blocks(self.TRADE_SHEETS)
+        if blocks is None:
+            return None
         pending_trades = []
+        for sheet_name, entry_block, order_block in blocks:
+            pending_trades.extend(self.parse_pending_trades(sheet_name, entry_block, order_block))
 
-        # Проверяем вкладки long и short
-        for sheet_name in ["long", "short"]:
-            logging.info(f"Попытка получить лист: {sheet_name}")
-            print(f"Попытка получить лист: {sheet_name}")
-            try:
-                worksheet = self.spreadsheet.worksheet(sheet_name)
-
-                # Получаем данные из нужных колонок
-                trade_entry_col = worksheet.col_values(6)  # F: Вход в сделку (индекс 6)
-                status_col = worksheet.col_values(7)       # G: Статус сделки (индекс 7)
-                coin_col = worksheet.col_values(8)         # H: Монета (индекс 8)
-                entry_price_col = worksheet.col_values(25) # Y: Т вх (индекс 25)
-                qty_col = worksheet.col_values(26)         # Z: Кол. монет (индекс 26)
-                take_profit_col = worksheet.col_values(27) # AA: Тейк-профит (индекс 27)
-                stop_loss_col = worksheet.col_values(28)   # AB: Стоп-лосс (индекс 28)
-
-                # Находим строки, где в столбце "Вход в сделку" стоит TRUE
-                trade_indices = [i for i, val in enumerate(trade_entry_col) if val.strip().upper() == "TRUE"]
-                logging.info(f"Найдено строк с TRUE на листе {sheet_name}: {len(trade_indices)} на индексах: {trade_indices}")
-                print(f"Найдено строк с TRUE на листе {sheet_name}: {len(trade_indices)} на индексах: {trade_indices}")
-
-                for idx in trade_indices:
-                    row_idx = idx + 1  # Индекс строки в Google Sheets (начинается с 1)
-                    logging.debug(f"Обработка строки {row_idx}, значение F: '{trade_entry_col[idx]}'")
-                    print(f"Обработка строки {row_idx}, значение F: '{trade_entry_col[idx]}'")
-
-                    # Проверяем, не обработана ли уже эта строка (статус не пустой и не указан как "отменено")
-                    status = status_col[idx] if idx < len(status_col) else ""
-                    if status.strip() in ["вход, ожидание", "отменено: лимит сделок"]:
-                        logging.debug(f"Строка {row_idx} пропущена: статус '{status}'")
-                        print(f"Строка {row_idx} пропущена: статус '{status}'")
-                        continue
+        logging.info(f"Найдено {len(pending_trades)} сделок для входа")
+        print(f"Найдено {len(pending_trades)} сделок для входа")
+        return pending_trades
 
-                    try:
-                        coin = coin_col[idx] if idx < len(coin_col) else None
-                        entry_price = entry_price_col[idx] if idx < len(entry_price_col) else None
-                        qty = qty_col[idx] if idx < len(qty_col) else None
-                        take_profit = take_profit_col[idx] if idx < len(take_profit_col) else None
-                        stop_loss = stop_loss_col[idx] if idx < len(stop_loss_col) else None
-
-                        logging.debug(f"Строка {row_idx} данные: coin={coin}, entry_price={entry_price}, qty={qty}, take_profit={take_profit}, stop_loss={stop_loss}")
-
-                        try:
-                            entry_price = float(entry_price) if entry_price and entry_price != '#N/A' else None
-                            qty = float(qty) if qty and qty != '#N/A' else None
-                            take_profit = float(take_profit) if take_profit and take_profit != '#N/A' else None
-                            stop_loss = float(stop_loss) if stop_loss and stop_loss != '#N/A' else None
-                        except ValueError as e:
-                            logging.error(f"Ошибка преобразования данных в строке {row_idx}: {e}")
-                            print(f"Ошибка преобразования данных в строке {row_idx}: {e}")
-                            continue
-
-                        # Проверяем, что все обязательные параметры присутствуют
-                        if not all([coin, entry_price, qty, stop_loss]):
-                            logging.warning(f"Пропущены обязательные параметры в строке {row_idx} листа {sheet_name}: coin={coin}, entry_price={entry_price}, qty={qty}, stop_loss={stop_loss}")
-                            print(f"Пропущены обязательные параметры в строке {row_idx} листа {sheet_name}: coin={coin}, entry_price={entry_price}, qty={qty}, stop_loss={stop_loss}")
-                            continue
-
-                        pending_trades.append({
-                            "sheet": sheet_name,
-                            "row": row_idx,
-                            "coin": coin,
-                            "entry_price": entry_price,
-                            "qty": qty,
-                            "take_profit": take_profit,
-                            "stop_loss": stop_loss,
-                            "side": "Buy" if sheet_name.lower() == "long" else "Sell"
-                        })
-                        logging.info(f"Добавлена сделка для обработки: {sheet_name}, строка {row_idx}, монета {coin}")
-                        print(f"Добавлена сделка для обработки: {sheet_name}, строка {row_idx}, монета {coin}")
-                    except Exception as e:
-                        logging.error(f"Ошибка при обработке строки {row_idx} на листе {sheet_name}: {e}")
-                        print(f"Ошибка при обработке строки {row_idx} на листе {sheet_name}: {e}")
-                        continue
+    def get_trade_rows(self, sheet_names=None):
+        """Строки листов long/short с полными параметрами ордера, независимо от флага "Вход в сделку".
 
-            except Exception as e:
-                logging.error(f"Ошибка при обработке листа {sheet_name}: {e}")
-                print(f"Ошибка при обработке листа {sheet_name}: {e}")
+        Строки со статусом бота пропускаются: в работе или исполненные ("вход…", "ошибка входа…")
+        и отмененные ("отменено…", в том числе отказ оператора).
+        """
+        trades = []
+        for sheet_name, entry_block, order_block in self._read_trade_blocks(sheet_names or self.TRADE_SHEETS) or []:
+            trades.extend(self.parse_pending_trades(sheet_name, entry_block, order_block, flagged_only=False))
+        return trades
+
+    def _read_trade_blocks(self, sheet_names):
+        """Столбцы F–H и Y–AB листов одним запросом: список (лист, entry_block, order_block), None при ошибке."""
+        ranges = [f"{sheet_name}!{cols}" for sheet_name in sheet_names for cols in self.TRADE_RANGES]
+        try:
+            response = self.spreadsheet.values_batch_get(ranges, params={"majorDimension": "COLUMNS"})
+        except Exception as e:
+            logging.error(f"Ошибка при пакетном чтении листов {sheet_names}: {e}")
+            print(f"Ошибка при пакетном чтении листов {sheet_names}: {e}")
+            return None
+
+        value_ranges = response.get("valueRanges", [])
+        blocks = []
+        for sheet_idx, sheet_name in enumerate(sheet_names):
+            entry_block = value_ranges[sheet_idx * 2].get("values", []) if len(value_ranges) > sheet_idx * 2 else []
+            order_block = value_ranges[sheet_idx * 2 + 1].get("values", []) if len(value_ranges) > sheet_idx * 2 + 1 else []
+            blocks.append((sheet_name, entry_block, order_block))
+        return blocks
+
+    def get_trade_fingerprint(self):
+        """Возвращает отпечаток столбца F (Вход в сделку) листов long и short одним запросом.
+
+        Отпечаток намного меньше полного чтения F–H и Y–AB. Статус (G) бот пишет сам, поэтому он
+        в отпечаток не входит. Правки параметров в строке, уже отмеченной TRUE, подхватывает
+        контрольное полное чтение SheetChangeDetector (full_refresh_interval).
+        """
+        ranges = [f"{sheet_name}!F:F" for sheet_name in self.TRADE_SHEETS]
+        response = self.spreadsheet.values_batch_get(ranges, params={"majorDimension": "COLUMNS"})
+        values = [value_range.get("values", []) for value_range in response.get("valueRanges", [])]
+        return zlib.crc32(json.dumps(values, ensure_ascii=False).encode("utf-8"))
+
+    @staticmethod
+    def parse_pending_trades(sheet_name, entry_block, order_block, flagged_only=True):
+        """Разбирает столбцы F–H и Y–AB (majorDimension=COLUMNS) одного листа в записи сделок.
+
+        flagged_only=False — все строки с монетой (кроме заголовка), а не только строки с TRUE;
+        пропуски при этом пишутся в лог только на уровне DEBUG.
+        """
+        # Пустые столбцы в конце диапазона API не возвращает, дополняем их пустыми списками
+        entry_block = list(entry_block) + [[]] * (3 - len(entry_block))
+        order_block = list(order_block) + [[]] * (4 - len(order_block))
+        trade_entry_col, status_col, coin_col = entry_block[:3]
+        entry_price_col, qty_col, take_profit_col, stop_loss_col = order_block[:4]
+
+        def cell(column, idx):
+            return column[idx] if idx < len(column) else None
+
+        def to_float(value):
+            return float(value) if value and value != '#N/A' else None
+
+        def report(level, message):
+            if flagged_only:
+                logging.log(level, message)
+                print(message)
+            else:
+                logging.debug(message)
+
+        if flagged_only:
+            # Находим строки, где в столбце "Вход в сделку" стоит TRUE
+            trade_indices = [i for i, val in enumerate(trade_entry_col) if str(val).strip().upper() == "TRUE"]
+            logging.info(f"Найдено строк с TRUE на листе {sheet_name}: {len(trade_indices)} на индексах: {trade_indices}")
+        else:
+            trade_indices = [i for i in range(1, len(coin_col)) if coin_col[i]]
+
+        pending_trades = []
+        for idx in trade_indices:
+            row_idx = idx + 1  # Индекс строки в Google Sheets (начинается с 1)
+
+            # Проверяем, не обработана ли уже эта строка (статус не пустой и не указан как "отменено")
+            status = cell(status_col, idx) or ""
+            if status.strip() in ["вход, ожидание", "отменено: лимит сделок"]:
+                logging.debug(f"Строка {row_idx} пропущена: статус '{status}'")
+                continue
+            if not flagged_only and status.strip().startswith(("вход", "отменено", "ошибка входа")):
+                # Строка в работе, исполнена или отменена (в том числе оператором): быстрый путь ее не готовит
+                logging.debug(f"Строка {row_idx} пропущена: статус '{status}'")
                 continue
 
-        logging.info(f"Найдено {len(pending_trades)} сделок для входа")
-        print(f"Найдено {len(pending_trades)} сделок для входа")
+            coin = cell(coin_col, idx)
+            try:
+                entry_price = to_float(cell(entry_price_col, idx))
+                qty = to_float(cell(qty_col, idx))
+                take_profit = to_float(cell(take_profit_col, idx))
+                stop_loss = to_float(cell(stop_loss_col, idx))
+            except ValueError as e:
+                report(logging.ERROR, f"Ошибка преобразования данных в строке {row_idx}: {e}")
+                continue
+
+            # Проверяем, что все обязательные параметры присутствуют
+            if not all([coin, entry_price, qty, stop_loss]):
+                report(logging.WARNING, f"Пропущены обязательные параметры в строке {row_idx} листа {sheet_name}: coin={coin}, entry_price={entry_price}, qty={qty}, stop_loss={stop_loss}")
+                continue
+
+            pending_trades.append({
+                "sheet": sheet_name,
+                "row": row_idx,
+                "coin": coin,
+                "entry_price": entry_price,
+                "qty": qty,
+                "take_profit": take_profit,
+                "stop_loss": stop_loss,
+                "side": "Buy" if sheet_name.lower() == "long" else "Sell"
+            })
+            if flagged_only:
+                logging.info(f"Добавлена сделка для обработки: {sheet_name}, строка {row_idx}, монета {coin}")
+                print(f"Добавлена сделка для обработки: {sheet_name}, строка {row_idx}, монета {coin}")
         return pending_trades
 
     def update_trade_status(self, sheet_name, row, status):
         """Обновляет статус сделки в столбце G."""
         try:
-            worksheet = self.spreadsheet.worksheet(sheet_name)
+            worksheet = self._worksheet(sheet_name)
             worksheet.update_cell(row, 7, status)  # Столбец G (7-й)
             logging.info(f"Статус сделки обновлен: лист {sheet_name}, строка {row}, статус {status}")
             print(f"Статус сделки обновлен: лист {sheet_name}, строка {row}, статус {status}")
         except Exception as e:
+            self.invalidate_worksheet(sheet_name)
             logging.error(f"Ошибка при обновлении статуса в листе {sheet_name}, строка {row}: {e}")
             print(f"Ошибка при обновлении статуса в листе {sheet_name}, строка {row}: {e}")
             raise
@@ -270,15 +479,71 @@ class GoogleSheetsClient:
     def cancel_trade(self, sheet_name, row):
         """Отменяет сделку (сбрасывает F в FALSE)."""
         try:
-            worksheet = self.spreadsheet.worksheet(sheet_name)
+            worksheet = self._worksheet(sheet_name)
             worksheet.update_cell(row, 6, "FALSE")  # Столбец F (6-й)
             logging.info(f"Сделка отменена: лист {sheet_name}, строка {row}")
             print(f"Сделка отменена: лист {sheet_name}, строка {row}")
         except Exception as e:
+            self.invalidate_worksheet(sheet_name)
             logging.error(f"Ошибка при отмене сделки в листе {sheet_name}, строка {row}: {e}")
             print(f"Ошибка при отмене сделки в листе {sheet_name}, строка {row}: {e}")
             raise
 
+def _to_float(value):
+    """Число из ячейки листа или None для пустых, #N/A и нечисловых значений (допускается запятая)."""
+    try:
+        return float(str(value).replace(",", ".")) if value not in (None, "", "#N/A") else None
+    except ValueError:
+        return None
+
+def _cells_equal(old, new):
+    """Сравнивает значение ячейки листа с записываемым (числа — с допуском на представление float)."""
+    old = '' if old is None else old
+    new = '' if new is None else new
+    if isinstance(old, bool) or isinstance(new, bool):
+        return str(old).upper() == str(new).upper()
+    try:
+        old_num, new_num = float(old), float(new)
+    except (TypeError, ValueError):
+        return str(old) == str(new)
+    return abs(old_num - new_num) <= 1e-12 * max(1.0, abs(old_num), abs(new_num))
+
+def diff_ranges(old_rows, new_rows):
+    """Строит данные для batch_update: изменившиеся ячейки, сгруппированные в прямоугольные диапазоны.
+
+    В каждой строке берется отрезок от первой до последней изменившейся ячейки; соседние строки
+    с одинаковым отрезком объединяются в один диапазон.
+    """
+    width = max([len(row) for row in old_rows] + [len(row) for row in new_rows] + [0])
+    spans = []  # (номер строки с 0, первый столбец, последний столбец, значения)
+    for row_idx in range(max(len(old_rows), len(new_rows))):
+        old_row = old_rows[row_idx] if row_idx < len(old_rows) else []
+        new_row = new_rows[row_idx] if row_idx < len(new_rows) else []
+        new_row = list(new_row) + [''] * (width - len(new_row))
+        changed = [
+            col for col in range(width)
+            if not _cells_equal(old_row[col] if col < len(old_row) else '', new_row[col])
+        ]
+        if changed:
+            spans.append((row_idx, changed[0], changed[-1], new_row[changed[0]:changed[-1] + 1]))
+
+    data = []
+    for row_idx, first_col, last_col, values in spans:
+        if data and data[-1]["_last_row"] == row_idx - 1 and data[-1]["_cols"] == (first_col, last_col):
+            data[-1]["values"].append(values)
+            data[-1]["_last_row"] = row_idx
+        else:
+            data.append({"_first_row": row_idx, "_last_row": row_idx, "_cols": (first_col, last_col), "values": [values]})
+
+    return [
+        {
+            "range": f"{rowcol_to_a1(block['_first_row'] + 1, block['_cols'][0] + 1)}:"
+                     f"{rowcol_to_a1(block['_last_row'] + 1, block['_cols'][1] + 1)}",
+            "values": block["values"]
+        }
+        for block in data
+    ]
+
 if __name__ == "__main__":
     print("Запуск тестового скрипта...")
     try:
@@ -0,0 +1,50 @@
+import math
+from collections import namedtuple
+
+# Поля инструмента, изменение которых считается изменением каталога
+COMPARED_FIELDS = [
+    "tick_size", "min_order_qty", "qty_step", "max_order_qty",
+    "min_price", "max_price", "taker_fee", "maker_fee"
+]
+
+# Результат сравнения каталогов: списки записей (added, changed) и символов (delisted)
+InstrumentChanges = namedtuple("InstrumentChanges", ["added", "delisted", "changed"])
+
+def parse_instrument(info, fees):
+    """Преобразует ответ instruments-info и комиссии (maker_fee, taker_fee) в запись хранилища.
+
+    Возвращает None для инструментов без размера тика или минимального лота.
+    """
+    price_filter = info.get('priceFilter', {})
+    lot_size_filter = info.get('lotSizeFilter', {})
+    tick_size = float(price_filter.get('tickSize', 0))
+    min_order_qty = float(lot_size_filter.get('minOrderQty', 0))
+    if tick_size <= 0 or min_order_qty <= 0:
+        return None
+    maker_fee, taker_fee = fees
+    return {
+        "symbol": info['symbol'],
+        "tick_size": tick_size,
+        "min_order_qty": min_order_qty,
+        "qty_step": float(lot_size_filter.get('qtyStep', min_order_qty)),
+        "max_order_qty": float(lot_size_filter.get('maxOrderQty', 0)) or None,
+        "min_price": float(price_filter.get('minPrice', 0)) or None,
+        "max_price": float(price_filter.get('maxPrice', 0)) or None,
+        "taker_fee": taker_fee,
+        "maker_fee": maker_fee
+    }
+
+def _same(old, new):
+    if old is None or new is None:
+        return old is new
+    return math.isclose(float(old), float(new), rel_tol=1e-12, abs_tol=0.0)
+
+def diff_instruments(previous, current):
+    """Сравнивает предыдущий и текущий каталоги ({symbol: instrument}) и возвращает InstrumentChanges."""
+    added = [instrument for symbol, instrument in current.items() if symbol not in previous]
+    delisted = [symbol for symbol in previous if symbol not in current]
+    changed = [
+        instrument for symbol, instrument in current.items()
+        if symbol in previous and not all(_same(previous[symbol].get(field), instrument.get(field)) for field in COMPARED_FIELDS)
+    ]
+    return InstrumentChanges(added, delisted, changed)
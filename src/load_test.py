@@ -0,0 +1,155 @@
+import os
+
+# Нагрузочный прогон идет без шины цен, сервера метрик и подробного журнала (значения можно переопределить)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["PRICE_BUS_NAME"] = ""
+os.environ["METRICS_PORT"] = "0"
+
+import argparse
+import contextlib
+import json
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from fake_bybit_server import ReplayPrices
+import fakes
+
+src_dir = os.path.dirname(os.path.abspath(__file__))
+
+def start_fake_server(args):
+    """Запускает fake_bybit_server.py отдельным процессом и ждет строку READY с адресами."""
+    command = [
+        sys.executable, os.path.join(src_dir, "fake_bybit_server.py"),
+        "--symbols", str(args.symbols), "--rate", str(args.rate), "--seed", str(args.seed),
+        "--rest-port", "0", "--ws-port", "0"
+    ]
+    if args.replay:
+        command += ["--replay", args.replay]
+    if args.disconnect_every:
+        command += ["--disconnect-every", str(args.disconnect_every)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, cwd=src_dir)
+    line = process.stdout.readline().split()
+    if len(line) != 3 or line[0] != "READY":
+        process.kill()
+        raise RuntimeError(f"fake_bybit_server.py не запустился: {' '.join(line) or 'нет вывода'}")
+    return process, line[1], line[2]
+
+def histogram_summary(histogram):
+    state = histogram.values.get(())
+    if not state or not state["count"]:
+        return {"count": 0, "p50": None, "p99": None, "max": None}
+    return {"count": state["count"], "p50": histogram.quantile(0.5), "p99": histogram.quantile(0.99), "max": state["max"]}
+
+def run_load_test(args, rest_url, ws_url):
+    # Адреса читаются config.py при импорте, поэтому модули проекта импортируются после их установки
+    os.environ["BYBIT_REST_URL"] = rest_url
+    os.environ["BYBIT_WS_URL"] = ws_url
+    from bybit_api import BybitAPI, TICKS, WS_LAG_SECONDS
+    from google_sheets import GoogleSheetsClient
+    from populate_static_data import EXPECTED_HEADERS
+    from price_monitor import PriceMonitor, CROSSING_TO_ALERT_SECONDS
+    from trading_engine import TradingEngine, ALERT_TO_TELEGRAM_SECONDS
+
+    # Уровни ставятся вокруг стартовых цен сервера, чтобы цены регулярно их пересекали
+    if args.replay:
+        replay = ReplayPrices(args.replay)
+        symbols = list(replay.paths)
+        catalog = SimpleNamespace(base_price=replay.current)
+    else:
+        symbols = fakes.fake_symbols(args.symbols, args.seed)
+        catalog = fakes.FakeBybitAPI(symbols, args.seed)
+    spreadsheet = fakes.FakeSpreadsheet({
+        "analitics": fakes.analitics_rows(symbols, catalog, args.seed, trading_share=1.0, level_offset=args.level_offset),
+        "database": fakes.database_rows(symbols, EXPECTED_HEADERS, catalog, args.seed)
+    })
+    messages = []
+    feed_notices = []
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        monitor = PriceMonitor(google_sheets=GoogleSheetsClient(None, "load_test", spreadsheet=spreadsheet), bybit_api=BybitAPI(),
+                               notify=feed_notices.append)
+        engine = TradingEngine(monitor, send_message=messages.append)
+        started = time.time()
+        threading.Thread(target=monitor.run, daemon=True, name="price-monitor").start()
+        threading.Thread(target=engine.run, daemon=True, name="trading-engine").start()
+        # Ждем подписки на все символы, затем замеряем установившийся режим
+        while monitor.price_fetcher.store.updated_count() < len(symbols) and time.time() - started < args.duration:
+            time.sleep(0.5)
+        subscribed_in = time.time() - started
+        ticks_before = sum(TICKS.values.values())
+        cpu_before = resource.getrusage(resource.RUSAGE_SELF)
+        window_start = time.time()
+        time.sleep(args.duration)
+        elapsed = time.time() - window_start
+        cpu_after = resource.getrusage(resource.RUSAGE_SELF)
+        ticks = sum(TICKS.values.values()) - ticks_before
+        monitor.running = engine.running = monitor.price_fetcher.running = False
+
+    cpu_seconds = (cpu_after.ru_utime - cpu_before.ru_utime) + (cpu_after.ru_stime - cpu_before.ru_stime)
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "params": {"symbols": len(symbols), "rate": args.rate, "duration": args.duration, "seed": args.seed,
+                   "disconnect_every": args.disconnect_every, "level_offset": args.level_offset, "replay": args.replay},
+        "subscribed_symbols": monitor.price_fetcher.store.updated_count(),
+        "subscribe_seconds": subscribed_in,
+        "ticks": ticks,
+        "ticks_per_second": ticks / elapsed if elapsed else None,
+        "expected_ticks_per_second": len(symbols) * args.rate,
+        "cpu_share": cpu_seconds / elapsed if elapsed else None,
+        "alerts": len(monitor.alerts_history),
+        "telegram_messages": len(messages),
+        "feed_notices": feed_notices,
+        "ws_lag_seconds": histogram_summary(WS_LAG_SECONDS),
+        "crossing_to_alert_seconds": histogram_summary(CROSSING_TO_ALERT_SECONDS),
+        "alert_to_telegram_seconds": histogram_summary(ALERT_TO_TELEGRAM_SECONDS),
+    }
+
+def format_report(report):
+    lines = [
+        f"Символов: {report['subscribed_symbols']}/{report['params']['symbols']}, подписка за {report['subscribe_seconds']:.1f} с",
+        f"Тиков: {report['ticks']} ({report['ticks_per_second']:.0f}/с при ожидаемых {report['expected_ticks_per_second']:.0f}/с), "
+        f"CPU: {report['cpu_share']:.0%}",
+        f"Оповещений: {report['alerts']}, сообщений Telegram: {report['telegram_messages']}",
+        f"Уведомлений о разрывах потока: {len(report['feed_notices'])}",
+    ]
+    for name in ("ws_lag_seconds", "crossing_to_alert_seconds", "alert_to_telegram_seconds"):
+        summary = report[name]
+        if summary["count"]:
+            lines.append(f"{name}: n={summary['count']} p50≤{summary['p50']:g} p99≤{summary['p99']:g} max={summary['max']:.4g}")
+        else:
+            lines.append(f"{name}: нет наблюдений")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон PriceFetcher → PriceMonitor → TradingEngine на локальном fake Bybit")
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=20, help="тиков в секунду на символ")
+    parser.add_argument("--duration", type=float, default=60, help="длительность замера после подписки, с")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--level-offset", type=float, default=0.002, help="удаление уровней от стартовой цены (доля)")
+    parser.add_argument("--replay", help="CSV symbol,price для fake_bybit_server.py")
+    parser.add_argument("--disconnect-every", type=float, help="разрывать WebSocket каждые N секунд")
+    parser.add_argument("--output", help="сохранить отчет в JSON")
+    args = parser.parse_args(argv)
+
+    process, rest_url, ws_url = start_fake_server(args)
+    try:
+        report = run_load_test(args, rest_url, ws_url)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    print(format_report(report))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"Отчет сохранен в {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
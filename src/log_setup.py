@@ -0,0 +1,95 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import time
+from datetime import datetime, timezone
+from config import LOG_LEVEL, LOG_FORMAT
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Стандартные атрибуты LogRecord: все остальные (переданные через extra) попадают в JSON как поля
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listeners = {}
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись в одну строку JSON: время, уровень, логгер, сообщение и поля из extra."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def make_formatter(log_format=None):
+    return JsonFormatter() if (log_format or LOG_FORMAT) == "json" else logging.Formatter(TEXT_FORMAT)
+
+def setup_logger(name=None, log_file=None, mode='a', level=None, console=True):
+    """Настраивает логгер (name=None — корневой) с асинхронной записью.
+
+    Логгер получает только QueueHandler: форматирование и запись в файл/консоль выполняет
+    фоновый QueueListener, поэтому вызывающий поток не ждет диск и stdout.
+    Повторный вызов для того же имени возвращает уже настроенный логгер.
+    """
+    logger = logging.getLogger(name)
+    if name in _listeners:
+        return logger
+
+    formatter = make_formatter()
+    handlers = []
+    if log_file:
+        file_handler = logging.FileHandler(log_file, mode=mode, encoding='utf-8')
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # Дописываем оставшиеся записи при завершении процесса
+    _listeners[name] = listener
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level or LOG_LEVEL)
+    return logger
+
+class TickLogSampler:
+    """Пропускает в лог не больше одной записи о тиках символа за interval секунд.
+
+    Число пропущенных тиков добавляется в следующую запись (поле skipped).
+    """
+
+    def __init__(self, logger, interval, level=logging.INFO):
+        self.logger = logger
+        self.interval = interval
+        self.level = level
+        self.last_logged = {}
+        self.skipped = {}
+
+    def log(self, symbol, msg, *args, **fields):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        now = time.monotonic()
+        last = self.last_logged.get(symbol)
+        if last is not None and now - last < self.interval:
+            self.skipped[symbol] = self.skipped.get(symbol, 0) + 1
+            return
+        self.last_logged[symbol] = now
+        skipped = self.skipped.pop(symbol, 0)
+        self.logger.log(self.level, msg, *args, extra={"symbol": symbol, "skipped": skipped, **fields})
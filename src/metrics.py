@@ -0,0 +1,224 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import profiling
+from config import METRICS_PORT
+
+# Границы корзин гистограмм: мантиссы внутри каждой декады (точность ~25%, как у HDR с 2 значащими цифрами)
+MANTISSAS = (1, 1.25, 1.5, 2, 2.5, 3, 4, 5, 6, 8)
+# В Prometheus выгружаются только границы 1-2.5-5: они совпадают с внутренними, поэтому счетчики точны
+EXPORTED_MANTISSAS = (1, 2.5, 5)
+# Диапазон задержек в секундах: 100 мкс — 1000 с
+DECADES = range(-4, 4)
+
+def _bounds(mantissas):
+    return [round(m * 10.0 ** d, 10) for d in DECADES for m in mantissas]
+
+BUCKET_BOUNDS = _bounds(MANTISSAS)
+EXPORTED_BOUNDS = _bounds(EXPORTED_MANTISSAS)
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.label_names}, получено {labels}")
+        return tuple(labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.TYPE}"]
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, *labels):
+        return self.values.get(tuple(labels), 0)
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+class Gauge(Counter):
+    TYPE = "gauge"
+
+    def set(self, *labels, value):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+class Histogram(_Metric):
+    """Гистограмма с логарифмически-линейными корзинами (BUCKET_BOUNDS) и оценкой квантилей."""
+
+    TYPE = "histogram"
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(BUCKET_BOUNDS, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {"counts": [0] * (len(BUCKET_BOUNDS) + 1), "sum": 0.0, "count": 0, "max": 0.0}
+            state["counts"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+            state["max"] = max(state["max"], value)
+
+    def quantile(self, q, *labels):
+        """Верхняя граница корзины, в которую попадает квантиль q (None, если наблюдений нет)."""
+        with self.lock:
+            state = self.values.get(tuple(labels))
+            if not state or not state["count"]:
+                return None
+            rank = q * state["count"]
+            seen = 0
+            for index, count in enumerate(state["counts"]):
+                seen += count
+                if seen >= rank and count:
+                    return BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else state["max"]
+            return state["max"]
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for key, state in sorted(self.values.items()):
+                cumulative = 0
+                position = 0
+                for bound in EXPORTED_BOUNDS:
+                    while position < len(BUCKET_BOUNDS) and BUCKET_BOUNDS[position] <= bound:
+                        cumulative += state["counts"][position]
+                        position += 1
+                    labels = _format_labels(self.label_names, key, ("le", repr(bound)))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.label_names, key, ("le", "+Inf"))
+                lines.append(f"{self.name}_bucket{labels} {state['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(state['sum'])}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {state['count']}")
+        return lines
+
+class MetricsRegistry:
+    """Реестр метрик процесса: counter/gauge/histogram создаются при первом обращении по имени."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, description, labels):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, description, labels)
+            elif type(metric) is not cls:
+                raise ValueError(f"Метрика {name} уже зарегистрирована как {metric.TYPE}")
+            return metric
+
+    def counter(self, name, description, labels=()):
+        return self._get(Counter, name, description, labels)
+
+    def gauge(self, name, description, labels=()):
+        return self._get(Gauge, name, description, labels)
+
+    def histogram(self, name, description, labels=()):
+        return self._get(Histogram, name, description, labels)
+
+    def render(self):
+        """Текстовый формат Prometheus (exposition format 0.0.4)."""
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Краткая сводка для Telegram: суммы счетчиков, значения gauge и p50/p99 гистограмм."""
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            with metric.lock:
+                items = sorted(metric.values.items())
+            if isinstance(metric, Histogram):
+                for key, state in items:
+                    label = f"{metric.name}{_format_labels(metric.label_names, key)}"
+                    lines.append(f"{label}: n={state['count']} p50≤{metric.quantile(0.5, *key):g} p99≤{metric.quantile(0.99, *key):g}")
+            elif isinstance(metric, Gauge):
+                for key, value in items:
+                    lines.append(f"{metric.name}{_format_labels(metric.label_names, key)}: {value:g}")
+            else:
+                lines.append(f"{metric.name}: {sum(value for _, value in items):g}")
+        return "\n".join(lines)
+
+# Реестр по умолчанию, общий для всех модулей процесса
+REGISTRY = MetricsRegistry()
+
+def start_http_server(port, host="0.0.0.0", registry=REGISTRY):
+    """Запускает HTTP-сервер с метриками (GET /metrics) в фоновом потоке и возвращает его.
+
+    Тот же сервер принимает команды профилирования /debug/* (см. profiling.handle_request).
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/metrics":
+                self._reply(200, registry.render(), "text/plain; version=0.0.4; charset=utf-8")
+            elif url.path.startswith("/debug/"):
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                status, text = profiling.handle_request(url.path, params)
+                self._reply(status, text, "text/plain; charset=utf-8")
+            else:
+                self.send_error(404)
+
+        def _reply(self, status, text, content_type):
+            body = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    logging.getLogger(__name__).info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
+
+def start_from_config():
+    """Запускает HTTP-сервер, если задан METRICS_PORT (0 — не запускать)."""
+    if METRICS_PORT:
+        try:
+            return start_http_server(METRICS_PORT)
+        except OSError as e:
+            logging.getLogger(__name__).error(f"Не удалось запустить сервер метрик на порту {METRICS_PORT}: {e}")
+    return None
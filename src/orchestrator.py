@@ -0,0 +1,116 @@
+import logging
+import os
+import threading
+from google_sheets import GoogleSheetsClient
+from bybit_api import BybitAPI
+from storage import create_storage
+from telegram_bot import TelegramSender
+from price_monitor import PriceMonitor
+from trading_engine import TradingEngine
+from trade_manager import TradeManager
+from fast_path import build_fast_path
+from scheduler import build_scheduler
+from metrics import start_from_config
+from log_setup import setup_logger
+import telegram_controller
+from config import GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID, BYBIT_API_KEY, BYBIT_API_SECRET
+from config import TELEGRAM_TOKEN, CHAT_ID, SCHEDULER_RUN_ON_START, FAST_PATH_MODE
+
+# Создаем директорию для логов
+log_dir = "logs"
+if not os.path.exists(log_dir):
+    os.makedirs(log_dir)
+
+# Создаем логгер для orchestrator (запись в файл и консоль выполняется в фоновом потоке)
+logger = setup_logger("orchestrator", os.path.join(log_dir, "orchestrator.log"))
+
+# Компоненты, которые можно включить в общий процесс
+ALL_SERVICES = ["trading_engine", "trade_manager", "scheduler", "telegram_controller"]
+
+class Orchestrator:
+    """Запускает сервисы в одном процессе с общими клиентами.
+
+    Все сервисы используют один BybitAPI (одни WebSocket-подключения), один GoogleSheetsClient
+    (общий кэш листов и бюджет квоты), одно хранилище и один TelegramSender.
+    Раздельный запуск сервисов в отдельных контейнерах по-прежнему поддерживается.
+    """
+
+    def __init__(self, services=None):
+        self.logger = logging.getLogger("orchestrator")
+        self.services = services or ALL_SERVICES
+        self.logger.info(f"Инициализация Orchestrator, сервисы: {self.services}")
+        print(f"Инициализация Orchestrator, сервисы: {self.services}")
+
+        self.storage = create_storage()
+        self.sheets = GoogleSheetsClient(GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID, storage=self.storage)
+        self.bybit = BybitAPI(BYBIT_API_KEY, BYBIT_API_SECRET)
+        self.telegram = TelegramSender(TELEGRAM_TOKEN, CHAT_ID)
+
+        self.price_monitor = None
+        self.trading_engine = None
+        self.trade_manager = None
+        self.scheduler = None
+
+        if "trading_engine" in self.services:
+            self.price_monitor = PriceMonitor(google_sheets=self.sheets, bybit_api=self.bybit, notify=self.telegram.send)
+            self.trading_engine = TradingEngine(self.price_monitor, send_message=self.telegram.send)
+        if "trade_manager" in self.services:
+            self.trade_manager = TradeManager(
+                BYBIT_API_KEY, BYBIT_API_SECRET, TELEGRAM_TOKEN, CHAT_ID,
+                bybit=self.bybit, sheets=self.sheets, telegram=self.telegram,
+                price_store=self.price_monitor.price_fetcher.store if self.price_monitor else None
+            )
+        if self.trading_engine:
+            # Быстрый путь входа с общими с TradeManager аккаунтами и проверкой ордеров;
+            # кнопку подтверждения обрабатывает Telegram-приложение TradeManager
+            fast_path_mode = FAST_PATH_MODE
+            if fast_path_mode == "confirm" and not self.trade_manager:
+                self.logger.warning("FAST_PATH_MODE=confirm требует trade_manager в ORCHESTRATOR_SERVICES, быстрый путь выключен")
+                fast_path_mode = "off"
+            self.trading_engine.fast_path = build_fast_path(
+                self.sheets, self.bybit, self.telegram,
+                price_store=self.price_monitor.price_fetcher.store,
+                accounts=self.trade_manager.accounts if self.trade_manager else None,
+                validator=self.trade_manager.order_validator if self.trade_manager else None,
+                mode=fast_path_mode
+            )
+            if self.trade_manager:
+                self.trade_manager.fast_path = self.trading_engine.fast_path
+        if "scheduler" in self.services:
+            self.scheduler = build_scheduler(self.sheets, self.bybit, self.storage)
+
+    def _start_thread(self, name, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True, name=name)
+        thread.start()
+        self.logger.info(f"Сервис {name} запущен")
+        return thread
+
+    def run(self):
+        start_from_config()
+        if self.price_monitor:
+            self._start_thread("price_monitor", self.price_monitor.run)
+            self._start_thread("trading_engine", self.trading_engine.run)
+        if self.scheduler:
+            self._start_thread("scheduler", self.scheduler.run, SCHEDULER_RUN_ON_START)
+
+        # Telegram polling может быть только один на токен: команды контроллера
+        # регистрируются в приложении TradeManager. Управление контейнерами (docker-compose)
+        # из общего процесса не регистрируется — только команды чтения
+        if self.trade_manager:
+            if "telegram_controller" in self.services:
+                telegram_controller.register_handlers(self.trade_manager.app, read_only=True)
+            self.trade_manager.run()
+            return
+        if "telegram_controller" in self.services:
+            telegram_controller.main(read_only=True)
+            return
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            self.logger.info("Остановлено пользователем")
+            print("Остановлено пользователем")
+
+if __name__ == "__main__":
+    services = os.getenv("ORCHESTRATOR_SERVICES")
+    orchestrator = Orchestrator([name.strip() for name in services.split(",")] if services else None)
+    orchestrator.run()
@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+from collections import namedtuple, deque
+import numpy as np
+from metrics import REGISTRY
+from config import ORDER_BOOK_DEPTH
+
+RESYNCS = REGISTRY.counter("order_book_resyncs_total", "Пересинхронизаций локального стакана", ("reason",))
+BOOK_MESSAGES = REGISTRY.counter("order_book_messages_total", "Сообщений orderbook", ("type",))
+
+# Пауза между попытками пересинхронизации (удваивается до максимума, с) и предел буфера дельт на символ:
+# старые дельты из переполненного буфера не нужны — снимок, к которому их применят, будет новее
+RESYNC_MIN_DELAY = 0.5
+RESYNC_MAX_DELAY = 10.0
+RESYNC_BUFFER_LIMIT = 5000
+
+# Оценка исполнения: средняя цена заполненной части, заполненный объем, объем, который встанет в книгу,
+# и проскальзывание средней цены от середины спреда (доля, положительное — хуже середины)
+FillEstimate = namedtuple("FillEstimate", ["avg_price", "filled_qty", "resting_qty", "slippage", "mid_price"])
+
+class BookSide:
+    """Одна сторона стакана: цены в тиках (int64) и объемы (float64), отсортированные от лучшей цены."""
+
+    __slots__ = ("ticks", "sizes", "descending")
+
+    def __init__(self, descending):
+        self.descending = descending
+        self.ticks = np.empty(0, dtype=np.int64)
+        self.sizes = np.empty(0, dtype=np.float64)
+
+    def load(self, ticks, sizes):
+        self.ticks, self.sizes = self._sorted(np.asarray(ticks, dtype=np.int64), np.asarray(sizes, dtype=np.float64))
+
+    def apply(self, ticks, sizes):
+        """Дельта: объем 0 удаляет уровень, иначе уровень вставляется или заменяется."""
+        ticks = np.asarray(ticks, dtype=np.int64)
+        sizes = np.asarray(sizes, dtype=np.float64)
+        keep = ~np.isin(self.ticks, ticks)
+        add = sizes > 0
+        self.ticks, self.sizes = self._sorted(np.concatenate([self.ticks[keep], ticks[add]]),
+                                              np.concatenate([self.sizes[keep], sizes[add]]))
+
+    def _sorted(self, ticks, sizes):
+        order = np.argsort(-ticks if self.descending else ticks, kind="stable")
+        return ticks[order], sizes[order]
+
+    def best(self):
+        return int(self.ticks[0]) if len(self.ticks) else None
+
+class OrderBook:
+    """Локальный L2-стакан символа из потока orderbook.<depth>.<symbol>: snapshot + delta по номеру u."""
+
+    def __init__(self, symbol, grid):
+        self.symbol = symbol
+        self.grid = grid
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide(descending=False)
+        self.update_id = None  # u последнего примененного сообщения (None — стакан не синхронизирован)
+        self.updated_at = 0.0  # ts биржи, с
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+
+    def _levels(self, levels):
+        parse = self.grid.parse
+        return [parse(price) for price, _ in levels], [float(size) for _, size in levels]
+
+    def load_snapshot(self, data, ts=0.0):
+        with self.lock:
+            self.bids.load(*self._levels(data.get("b", [])))
+            self.asks.load(*self._levels(data.get("a", [])))
+            self.update_id = int(data.get("u", 0))
+            self.updated_at = ts
+        self.ready.set()
+
+    def apply_delta(self, data, ts=0.0):
+        """Применяет дельту; при разрыве номеров возвращает False и стакан требует пересинхронизации."""
+        with self.lock:
+            update_id = int(data["u"])
+            if self.update_id is None:
+                return False
+            if update_id <= self.update_id:
+                return True  # Уже учтено снимком REST
+            if update_id != self.update_id + 1:
+                self.update_id = None
+                self.ready.clear()
+                return False
+            if data.get("b"):
+                self.bids.apply(*self._levels(data["b"]))
+            if data.get("a"):
+                self.asks.apply(*self._levels(data["a"]))
+            self.update_id = update_id
+            self.updated_at = ts
+            return True
+
+    def spread(self):
+        """(лучший бид, лучший аск, спред в тиках) в ценах float; None, если стакан пуст."""
+        with self.lock:
+            bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return self.grid.price(bid), self.grid.price(ask), ask - bid
+
+    def depth(self, ticks, side="Buy"):
+        """Объем в пределах ticks тиков от лучшей цены стороны, которую забирает ордер side."""
+        book_side = self.asks if side == "Buy" else self.bids
+        with self.lock:
+            best = book_side.best()
+            if best is None:
+                return 0.0
+            within = np.abs(book_side.ticks - best) <= ticks
+            return float(book_side.sizes[within].sum())
+
+    def estimate_fill(self, side, qty, limit_price=None):
+        """Оценка исполнения qty ордером side; лимитный ордер забирает только уровни не хуже limit_price."""
+        book_side = self.asks if side == "Buy" else self.bids
+        with self.lock:
+            bid, ask = self.bids.best(), self.asks.best()
+            if bid is None or ask is None:
+                return None
+            ticks, sizes = book_side.ticks, book_side.sizes
+            if limit_price is not None:
+                limit = self.grid.to_ticks(limit_price)
+                reachable = ticks <= limit if side == "Buy" else ticks >= limit
+                ticks, sizes = ticks[reachable], sizes[reachable]
+            # Уровни забираются по очереди, пока не набран объем
+            cumulative = np.cumsum(sizes)
+            count = int(np.searchsorted(cumulative, qty)) + 1
+            taken = sizes[:count].copy()
+            if len(taken):
+                taken[-1] -= max(float(cumulative[min(count, len(cumulative)) - 1]) - qty, 0.0)
+            filled = float(taken.sum())
+        mid = (self.grid.price(bid) + self.grid.price(ask)) / 2
+        if filled <= 0:
+            return FillEstimate(None, 0.0, qty, 0.0, mid)
+        avg = float((ticks[:count] * taken).sum() / filled) * self.grid.units / self.grid.scale
+        slippage = (avg - mid) / mid if side == "Buy" else (mid - avg) / mid
+        return FillEstimate(avg, filled, max(qty - filled, 0.0), slippage, mid)
+
+class OrderBookFeed:
+    """Локальные стаканы символов на отдельном WebSocket-соединении.
+
+    Снимок из потока заменяет стакан целиком, дельты применяются по порядку номеров u. При разрыве
+    номеров стакан загружается через REST (u снимка REST совпадает с u потока глубины 50), а дельты,
+    пришедшие во время загрузки, накапливаются и применяются поверх снимка. На символ работает
+    не больше одного потока пересинхронизации; неудачные попытки повторяются им же с растущей паузой.
+    """
+
+    def __init__(self, bybit_api, depth=ORDER_BOOK_DEPTH):
+        self.logger = logging.getLogger(__name__)
+        self.bybit_api = bybit_api
+        self.depth = depth
+        self.books = {}
+        self.pending = {}  # symbol -> дельты, пришедшие во время пересинхронизации
+        self.resyncing = set()  # Символы, для которых работает поток пересинхронизации
+        self.lock = threading.Lock()
+        self.ws = None
+
+    def track(self, symbols):
+        """Подписывает стаканы символов, которые еще не отслеживаются."""
+        with self.lock:
+            new = [symbol for symbol in dict.fromkeys(symbols) if symbol not in self.books]
+            for symbol in new:
+                self.books[symbol] = OrderBook(symbol, self.bybit_api.tick_grid(symbol))
+            if not new:
+                return
+            if self.ws is None:
+                self.ws = self.bybit_api.create_websocket()
+        for symbol in new:
+            self.ws.orderbook_stream(depth=self.depth, symbol=symbol, callback=self.handle_message)
+        self.logger.info(f"Локальные стаканы: {', '.join(new)} (глубина {self.depth})")
+
+    def get(self, symbol, wait=0.0):
+        """Синхронизированный стакан символа или None; wait — сколько ждать первого снимка, с."""
+        book = self.books.get(symbol)
+        if book is None or not book.ready.wait(wait):
+            return None
+        return book
+
+    def handle_message(self, message):
+        symbol = message["topic"].rsplit(".", 1)[1]
+        book = self.books.get(symbol)
+        if book is None:
+            return
+        data = message["data"]
+        ts = message.get("cts", message.get("ts", 0)) / 1000
+        BOOK_MESSAGES.inc(message["type"])
+        with self.lock:
+            if message["type"] == "snapshot":
+                book.load_snapshot(data, ts)
+                self.pending.pop(symbol, None)
+                return
+            if symbol in self.pending:
+                self.pending[symbol].append((data, ts))
+                return
+            if book.apply_delta(data, ts):
+                return
+            self.pending[symbol] = deque([(data, ts)], maxlen=RESYNC_BUFFER_LIMIT)
+            start = symbol not in self.resyncing
+            self.resyncing.add(symbol)
+        self.logger.warning(f"Разрыв номеров стакана {symbol} на u={data.get('u')}, пересинхронизация")
+        RESYNCS.inc("gap")
+        if start:
+            threading.Thread(target=self._resync_loop, args=(symbol,), daemon=True, name=f"book-resync-{symbol}").start()
+
+    def _resync_loop(self, symbol):
+        """Повторяет resync с растущей паузой, пока стакан не будет синхронизирован."""
+        delay = RESYNC_MIN_DELAY
+        while True:
+            try:
+                done = self.resync(symbol)
+            except Exception as e:
+                self.logger.error(f"Ошибка пересинхронизации стакана {symbol}: {e}")
+                done = False
+            with self.lock:
+                if done and symbol not in self.pending:
+                    self.resyncing.discard(symbol)
+                    return
+            if done:
+                delay = RESYNC_MIN_DELAY  # Новый разрыв сразу после успешной пересинхронизации
+                continue
+            time.sleep(delay)
+            delay = min(delay * 2, RESYNC_MAX_DELAY)
+
+    def resync(self, symbol):
+        """Снимок стакана через REST и применение дельт, накопленных за время запроса.
+
+        Возвращает True, если стакан синхронизирован (в том числе снимком из потока), False — нужна повторная попытка.
+        """
+        book = self.books[symbol]
+        with self.lock:
+            if symbol not in self.pending:
+                return True  # Пока ждали, пришел снимок потока
+        snapshot = self.bybit_api.get_orderbook(symbol, self.depth)
+        with self.lock:
+            buffered = self.pending.get(symbol)
+            if buffered is None:
+                return True
+            if snapshot is None:
+                RESYNCS.inc("rest_error")
+                return False
+            book.load_snapshot(snapshot, snapshot.get("ts", 0) / 1000)
+            for data, ts in buffered:
+                if not book.apply_delta(data, ts):
+                    # Снимок старше накопленных дельт: буфер сохраняется до следующей попытки
+                    RESYNCS.inc("stale_snapshot")
+                    self.logger.warning(f"Снимок стакана {symbol} не стыкуется с потоком, повторная пересинхронизация")
+                    return False
+            del self.pending[symbol]
+            return True
+
+    def close(self):
+        if self.ws is not None:
+            try:
+                self.ws.exit()
+            except Exception as e:
+                self.logger.debug(f"Ошибка закрытия соединения стаканов: {e}")
+            self.ws = None
@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from instrument_catalog import parse_instrument
+from metrics import REGISTRY
+from ticks import TickGrid, NEAREST, FLOOR
+from config import ORDER_PRICE_BAND, ORDER_MISSING_SYMBOL_TTL
+
+VALIDATIONS = REGISTRY.counter("order_validator_results_total", "Проверок ордеров перед отправкой", ("result",))
+
+# Результат проверки: order — поля ордера строками на сетке биржи (None, если ордер отклонен),
+# repairs — описания исправлений, error — причина отклонения, retry — отклонение временное
+# (каталог инструментов недоступен): сделку нужно проверить позже, а не отменять
+Validation = namedtuple("Validation", ["order", "repairs", "error", "retry"], defaults=(False,))
+
+class CatalogUnavailable(RuntimeError):
+    """Каталог инструментов не удалось получить ни из хранилища, ни с биржи."""
+
+class OrderValidator:
+    """Локальная проверка лимитного ордера до отправки на биржу.
+
+    Цены выравниваются на tickSize, количество — вниз на qtyStep. Ордер отклоняется, если
+    количество вне [minOrderQty, maxOrderQty], цена вне [minPrice, maxPrice] или дальше
+    ORDER_PRICE_BAND от рыночной, стоп-лосс или тейк-профит не с той стороны от цены входа.
+    Инструмент берется из локального хранилища, а символ, которого там нет (листинг после
+    последнего обновления каталога), запрашивается в instruments-info по символу. Символ, которого
+    нет и на бирже (делистинг, опечатка в листе), запоминается на missing_ttl секунд.
+    """
+
+    def __init__(self, bybit_api, storage=None, price_band=ORDER_PRICE_BAND, missing_ttl=ORDER_MISSING_SYMBOL_TTL):
+        self.logger = logging.getLogger(__name__)
+        self.bybit_api = bybit_api
+        self.storage = storage
+        self.price_band = price_band
+        self.missing_ttl = missing_ttl
+        self.instruments = {}
+        self.missing = {}  # symbol -> время (monotonic), до которого символ не запрашивается на бирже
+        self.grids = {}  # symbol -> (сетка цены, сетка количества)
+        self.lock = threading.Lock()
+
+    def _refresh(self, symbol):
+        """Перечитывает хранилище, а если символа там нет — запрашивает его на бирже."""
+        if self.storage is not None:
+            self.instruments.update(self.storage.get_instruments())
+        if symbol in self.instruments:
+            return
+        if self.missing.get(symbol, 0.0) > time.monotonic():
+            return  # Недавно не найден на бирже: каждое чтение листа не должно стоить запроса
+        infos = self.bybit_api.get_futures_instruments_info(symbol=symbol)
+        if infos is None:
+            raise CatalogUnavailable(f"не удалось получить инструмент {symbol} с биржи")
+        for info in infos:
+            instrument = parse_instrument(info, (0.0, 0.0))
+            if instrument is not None:
+                self.instruments[info["symbol"]] = instrument
+        if symbol in self.instruments:
+            self.missing.pop(symbol, None)
+            self.logger.info(f"Инструмент {symbol} получен с биржи")
+        else:
+            self.missing[symbol] = time.monotonic() + self.missing_ttl
+            self.logger.info(f"Инструмент {symbol} не найден на бирже, повторный запрос через {self.missing_ttl:g} с")
+
+    def instrument(self, symbol):
+        """Инструмент и его сетки; неизвестный символ ищется заново (хранилище, затем биржа не чаще missing_ttl).
+
+        Возвращает (None, None, None), если инструмента нет на бирже, и поднимает CatalogUnavailable,
+        если проверить это не удалось.
+        """
+        with self.lock:
+            if symbol not in self.instruments:
+                self._refresh(symbol)
+                self.grids = {}
+            instrument = self.instruments.get(symbol)
+            if instrument is None:
+                return None, None, None
+            if symbol not in self.grids:
+                self.grids[symbol] = (TickGrid(instrument["tick_size"]),
+                                      TickGrid(instrument.get("qty_step") or instrument["min_order_qty"]))
+            return (instrument,) + self.grids[symbol]
+
+    def validate(self, trade, market_price=None):
+        """Проверяет сделку (coin, side, entry_price, qty, take_profit, stop_loss) и возвращает Validation."""
+        result = self._validate(trade, market_price)
+        VALIDATIONS.inc("retry" if result.retry else "rejected" if result.error else "repaired" if result.repairs else "ok")
+        if result.error:
+            self.logger.warning(f"Ордер {trade.get('coin')} отклонен локально: {result.error}")
+        elif result.repairs:
+            self.logger.info(f"Ордер {trade['coin']} исправлен: {'; '.join(result.repairs)}")
+        return result
+
+    def _validate(self, trade, market_price):
+        symbol = trade.get("coin")
+        try:
+            instrument, price_grid, qty_grid = self.instrument(symbol)
+        except CatalogUnavailable as e:
+            return Validation(None, [], f"каталог инструментов недоступен: {e}", retry=True)
+        if instrument is None:
+            return Validation(None, [], f"инструмент {symbol} не найден в каталоге")
+        buy = trade["side"] == "Buy"
+        repairs = []
+
+        def on_grid(name, value):
+            ticks = price_grid.to_ticks(value, NEAREST)
+            if price_grid.price(ticks) != value:
+                repairs.append(f"{name} {value} → {price_grid.format(ticks)} (шаг цены {price_grid.tick_size})")
+            return ticks
+
+        entry = on_grid("цена входа", trade["entry_price"])
+        stop_loss = on_grid("стоп-лосс", trade["stop_loss"]) if trade.get("stop_loss") else None
+        take_profit = on_grid("тейк-профит", trade["take_profit"]) if trade.get("take_profit") else None
+        if entry <= 0:
+            return Validation(None, repairs, f"цена входа {trade['entry_price']} меньше шага цены")
+
+        # Границы цены инструмента и ценовой диапазон относительно рыночной цены
+        entry_price = price_grid.price(entry)
+        min_price, max_price = instrument.get("min_price"), instrument.get("max_price")
+        if min_price and entry_price < min_price or max_price and entry_price > max_price:
+            return Validation(None, repairs, f"цена входа {entry_price} вне диапазона инструмента [{min_price}, {max_price}]")
+        if market_price and abs(entry_price - market_price) / market_price > self.price_band:
+            return Validation(None, repairs, f"цена входа {entry_price} дальше {self.price_band:.0%} от рыночной {market_price}")
+
+        # Стоп-лосс и тейк-профит должны быть по разные стороны от входа
+        if stop_loss is None:
+            return Validation(None, repairs, "стоп-лосс не установлен")
+        if stop_loss <= 0 or (stop_loss >= entry if buy else stop_loss <= entry):
+            return Validation(None, repairs, f"стоп-лосс {price_grid.format(stop_loss)} не {'ниже' if buy else 'выше'} цены входа {price_grid.format(entry)}")
+        if take_profit is not None and (take_profit <= entry if buy else take_profit >= entry):
+            return Validation(None, repairs, f"тейк-профит {price_grid.format(take_profit)} не {'выше' if buy else 'ниже'} цены входа {price_grid.format(entry)}")
+
+        # Количество округляется вниз: ордер не превышает указанный в листе объем
+        qty = qty_grid.to_ticks(trade["qty"], FLOOR)
+        if qty_grid.price(qty) != trade["qty"]:
+            repairs.append(f"количество {trade['qty']} → {qty_grid.format(qty)} (шаг {qty_grid.tick_size})")
+        qty_value = qty_grid.price(qty)
+        if qty_value < instrument["min_order_qty"]:
+            return Validation(None, repairs, f"количество {qty_value} меньше минимального {instrument['min_order_qty']}")
+        if instrument.get("max_order_qty") and qty_value > instrument["max_order_qty"]:
+            return Validation(None, repairs, f"количество {qty_value} больше максимального {instrument['max_order_qty']}")
+
+        order = {
+            "symbol": symbol,
+            "side": trade["side"],
+            "qty": qty_grid.format(qty),
+            "price": price_grid.format(entry),
+            "take_profit": price_grid.format(take_profit) if take_profit is not None else None,
+            "stop_loss": price_grid.format(stop_loss)
+        }
+        return Validation(order, repairs, None)
@@ -1,6 +1,8 @@
 import logging
 from google_sheets import GoogleSheetsClient
 from bybit_api import BybitAPI
+from storage import create_storage, DATABASE_COLUMNS
+from analytics import ATR_WINDOWS, atr_for_symbols
 from config import GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID
 import time
 from datetime import datetime
@@ -19,25 +21,25 @@ logging.basicConfig(
     encoding='utf-8'  # Кодировка UTF-8 для поддержки русского текста
 )
 
-def calculate_atr(high_low_data):
-    """Расчет ATR (Average True Range) как среднего диапазона (high - low) за 7 дней."""
-    if not high_low_data:  # Если данных нет, возвращаем 0
-        return 0
-    tr_values = [high - low for high, low in high_low_data]  # Вычисляем диапазон (True Range) для каждого дня
-    if len(tr_values) > 7:  # Если дней больше 7, берем только первые 7
-        tr_values = tr_values[:7]
-    elif len(tr_values) < 7:  # Если меньше 7, дополняем нулями
-        tr_values.extend([0] * (7 - len(tr_values)))
-    return sum(tr_values) / 7 if tr_values else 0  # Среднее значение TR за 7 дней
-
-def populate_historical_data():
-    """Основная функция для заполнения исторических данных в Google Sheets."""
+def populate_historical_data(sheets_client=None, bybit_api=None, storage=None, request_delay=0.1, sync=None):
+    """Основная функция для заполнения исторических данных в локальном хранилище и Google Sheets.
+
+    request_delay — пауза между символами (сек) для соблюдения лимитов Bybit API;
+    sync — фоновая выгрузка планировщика (storage.SheetsSync), без нее лист записывается сразу.
+    """
     logger = logging.getLogger(__name__)  # Создаем логгер для записи сообщений
     logger.info("Запуск populate_historical_data.py: обновление исторических данных, объёма и ATR")
 
-    # Инициализация клиентов для работы с Google Sheets и Bybit API
-    sheets_client = GoogleSheetsClient(GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID)
-    bybit_api = BybitAPI()
+    # Инициализация клиентов для работы с Google Sheets, Bybit API и хранилищем (если не переданы извне)
+    sheets_client = sheets_client or GoogleSheetsClient(GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID)
+    bybit_api = bybit_api or BybitAPI()
+    storage = storage or create_storage()
+
+    # Лист читается после выгрузки изменений, поставленных в очередь другими задачами (новые монеты каталога)
+    if sync is not None and not sync.flush():
+        # Иначе строки листа без невыгруженных изменений перезаписали бы их при следующей выгрузке
+        logger.error(f"Лист database не выгружен ({sync.errors}), обновление исторических данных пропущено")
+        return
 
     # Получаем лист "database" из Google Sheets
     logger.info("Попытка получить лист database")
@@ -48,22 +50,29 @@ def populate_historical_data():
 
     # Читаем все данные из листа
     logger.info("Получение существующих данных из листа")
-    all_data = sheet.get_all_values()
+    # Неформатированные значения: числа приходят числами и сравниваются с новыми без учета формата ячеек
+    all_data = sheet.get_all_values(value_render_option="UNFORMATTED_VALUE")
     if len(all_data) < 2:  # Проверяем, есть ли данные кроме заголовка
         logger.error("В листе database отсутствуют монеты, сначала запустите populate_static_data.py")
         return
 
-    # Собираем уникальные символы (монеты) из столбца A
-    symbols = []
-    seen = set()
-    for row in all_data[1:]:  # Пропускаем заголовок
-        if row and row[0] and isinstance(row[0], str) and row[0] not in seen:
-            symbols.append(row[0])
-            seen.add(row[0])
-    logger.info(f"Найдено {len(symbols)} уникальных символов в таблице")
+    # Символы берем из каталога инструментов в хранилище, а если он пуст — из столбца A листа
+    instruments = storage.get_instruments()
+    symbols = list(instruments)
+    if symbols:
+        logger.info(f"Найдено {len(symbols)} символов в локальном хранилище")
+    else:
+        seen = set()
+        for row in all_data[1:]:  # Пропускаем заголовок
+            if row and row[0] and isinstance(row[0], str) and row[0] not in seen:
+                symbols.append(row[0])
+                seen.add(row[0])
+        logger.info(f"Найдено {len(symbols)} уникальных символов в таблице")
 
     # Подготавливаем список строк для записи (начинаем с заголовка)
     updated_rows = [all_data[0]]
+    historical_rows = []  # Строки для таблицы historical локального хранилища
+    candles_by_symbol = {}  # Дневные свечи символов, прошедших фильтр по объёму
     volume_threshold = 49_000_000  # Порог объема для фильтрации символов
     filtered_count = 0  # Счетчик отфильтрованных символов
 
@@ -77,6 +86,10 @@ def populate_historical_data():
             current_row.extend([''] * (22 - len(current_row)))
         # Сохраняем статичные столбцы (A, Q, R, T, U, V)
         static_cols = [current_row[i] for i in [0, 16, 17, 19, 20, 21]]
+        instrument = instruments.get(symbol)
+        if instrument:  # Статичные данные из хранилища приоритетнее содержимого листа
+            static_cols = [symbol, instrument["tick_size"], instrument["min_order_qty"],
+                           static_cols[3], instrument["taker_fee"], instrument["maker_fee"]]
 
         # Получаем объем торгов за 24 часа
         volume_usdt = bybit_api.get_24h_volume(symbol)
@@ -88,8 +101,9 @@ def populate_historical_data():
         atr = ''  # P: ATR
         
         if volume_usdt >= volume_threshold:  # Проверяем, проходит ли символ по объему
-            # Получаем данные за последние 7 дней (high и low)
-            high_low_data = bybit_api.get_last_7_days_high_low(symbol, days=7)
+            # Одним запросом получаем дневные свечи для всех окон ATR; high/low за 7 дней берем из последних
+            candles = bybit_api.get_daily_candles(symbol, days=max(ATR_WINDOWS) + 1)
+            high_low_data = [(high, low) for _, _, high, low, _ in candles[:7]]
             logger.debug(f"Сырые данные high/low для {symbol}: {high_low_data}")
             
             if high_low_data:  # Если данные получены
@@ -107,9 +121,8 @@ def populate_historical_data():
                     historical_values.append(0)
                 logger.info(f"Исторические данные для {symbol} (C–O): {historical_values}")
 
-                # Вычисляем ATR
-                atr = calculate_atr(high_low_data)
-                logger.info(f"ATR для {symbol}: {atr}")
+                # ATR считается после цикла сразу для всех символов
+                candles_by_symbol[symbol] = candles
         else:
             logger.info(f"Символ {symbol} пропущен: объём {volume_usdt} < {volume_threshold:,} USDT")
             filtered_count += 1
@@ -129,44 +142,53 @@ def populate_historical_data():
         )
         logger.info(f"Подготовлена строка для {symbol} (строка {idx + 1}): {new_row}")
         updated_rows.append(new_row)
-
-        time.sleep(0.1)  # Задержка для избежания превышения лимитов API
+        historical_rows.append({
+            "symbol": symbol,
+            "low_day1": low_day1,
+            "history": historical_values,
+            "atr": atr,
+            "volume": volume_usdt
+        })
+
+        if request_delay:
+            time.sleep(request_delay)  # Задержка для избежания превышения лимитов API
+
+    # Векторный расчет True Range и ATR по Уайлдеру (окна 7/14/30) для всех символов за один проход
+    atr_by_symbol = atr_for_symbols(candles_by_symbol)
+    for row, historical in zip(updated_rows[1:], historical_rows):
+        atrs = atr_by_symbol.get(historical["symbol"])
+        if atrs is None:
+            continue
+        atr = atrs[7] if atrs[7] is not None else ''
+        row[15] = atr  # P: ATR (7 дней)
+        historical["atr"] = atr
+        historical["atr_14"] = atrs[14]
+        historical["atr_30"] = atrs[30]
+        logger.info(f"ATR для {historical['symbol']}: {atrs}")
 
     # Логируем статистику
     logger.info(f"Отфильтровано {filtered_count} символов с объёмом менее {volume_threshold:,} USDT")
     logger.info(f"Подготовлено {len(updated_rows) - 1} строк для записи")
 
-    # Определяем диапазон для записи в Google Sheets
-    range_name = f"A1:V{len(updated_rows)}"
-    logger.info(f"Диапазон для записи: {range_name}")
+    # Сохраняем исторические данные в локальное хранилище до выгрузки в таблицу
+    storage.upsert_historical(historical_rows)
+    logger.info(f"В хранилище сохранено {len(historical_rows)} строк исторических данных")
 
-    # Очищаем лист перед записью
-    try:
-        sheet.clear()
-        logger.info("Лист database очищен перед записью")
-    except Exception as e:
-        logger.error(f"Ошибка при очистке листа: {e}")
+    # Записываем в Google Sheets только изменившиеся ячейки: лист не очищается, поэтому другие
+    # сервисы не видят его пустым. В планировщике запись выполняет фоновая выгрузка
+    if sync is not None:
+        sync.push("database", lambda rows: updated_rows, DATABASE_COLUMNS)
+        logger.info("Исторические данные сохранены, выгрузка листа database поставлена в очередь")
         return
-
-    # Записываем данные в Google Sheets
     try:
-        sheet.update(values=updated_rows, range_name=range_name)
-        logger.info(f"Успешно обновлены данные в диапазоне {range_name}")
-        
-        # Проверяем, что данные записаны корректно
-        updated_data = sheet.get_all_values()
-        logger.debug(f"Данные после записи: {updated_data}")
-        if updated_data == updated_rows:
-            logger.info("Данные в таблице совпадают с подготовленными")
-        else:
-            logger.error("Данные в таблице не совпадают с подготовленными")
-            for i, (expected, actual) in enumerate(zip(updated_rows, updated_data)):
-                if expected != actual:
-                    logger.error(f"Различие в строке {i + 1}: ожидаемое={expected}, записано={actual}")
-                    break
+        written_cells = sheets_client.write_diff(sheet, [row[:DATABASE_COLUMNS] for row in all_data], updated_rows)
     except Exception as e:
         logger.error(f"Ошибка при записи данных: {e}")
         return
+    if written_cells is None:
+        logger.error("Количество записанных ячеек не совпадает с подготовленными изменениями")
+        return
+    logger.info(f"Записано {written_cells} изменившихся ячеек, строк в листе: {len(updated_rows)}")
 
     logger.info("Исторические данные, объём и ATR успешно обновлены")
 
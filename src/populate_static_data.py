@@ -1,6 +1,9 @@
 import logging
 from google_sheets import GoogleSheetsClient
 from bybit_api import BybitAPI
+from storage import create_storage, DATABASE_COLUMNS
+from instrument_catalog import parse_instrument, diff_instruments
+from telegram_bot import send_telegram_message
 from config import GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID, BYBIT_API_KEY, BYBIT_API_SECRET
 import time
 
@@ -12,78 +15,136 @@ logging.basicConfig(
     encoding='utf-8'
 )
 
-def populate_static_data():
+EXPECTED_HEADERS = [
+    "Монета", "ДЕНЬ 1", "ДЕНЬ 1", "ДЕНЬ 2", "ДЕНЬ 2", "ДЕНЬ 3", "ДЕНЬ 3",
+    "ДЕНЬ 4", "ДЕНЬ 4", "ДЕНЬ 5", "ДЕНЬ 5", "ДЕНЬ 6", "ДЕНЬ 6", "ДЕНЬ 7", "ДЕНЬ 7",
+    "ATR", "Размер тика", "Мин шаг покупки", "Средний объём", "Текущая цена",
+    "Комиссия открытие", "Комиссия закрытие"
+]
+
+def populate_static_data(sheets_client=None, bybit_api=None, storage=None, force=False, sync=None):
+    """Обновляет каталог инструментов; при force=True лист database сверяется со всем каталогом.
+
+    sync — фоновая выгрузка планировщика (storage.SheetsSync); без нее лист записывается сразу.
+    """
     # Логируем запуск скрипта
     logger = logging.getLogger(__name__)
     logger.info("Запуск populate_static_data.py: обновление статичных данных")
 
-    # Инициализация клиентов
-    sheets_client = GoogleSheetsClient(GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID)
-    bybit_api = BybitAPI(api_key=BYBIT_API_KEY, api_secret=BYBIT_API_SECRET)
+    # Инициализация клиентов (если не переданы извне)
+    sheets_client = sheets_client or GoogleSheetsClient(GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID)
+    bybit_api = bybit_api or BybitAPI(api_key=BYBIT_API_KEY, api_secret=BYBIT_API_SECRET)
+    storage = storage or create_storage()
 
-    # Получение листа database
-    logger.info("Попытка получить лист database")
-    sheet = sheets_client.get_sheet("database")
-    if not sheet:
-        logger.error("Не удалось получить лист database")
-        return
-
-    # Получение списка фьючерсов
-    logger.info("Получение списка фьючерсов")
-    symbols = bybit_api.get_futures_instruments() # Теперь возвращает все символы
-    logger.info(f"Получено {len(symbols)} символов")
-    if not symbols:
+    # Каталог инструментов и комиссии: несколько постраничных запросов вместо двух запросов на символ
+    logger.info("Получение каталога фьючерсов и комиссий")
+    infos = bybit_api.get_futures_instruments_info()
+    if not infos:
         logger.error("Не удалось получить список инструментов")
         return
+    fees = bybit_api.get_all_fee_rates()
+    previous = storage.get_instruments()
 
-    # Проверка заголовков
-    headers = sheet.row_values(1)
-    expected_headers = [
-        "Монета", "ДЕНЬ 1", "ДЕНЬ 1", "ДЕНЬ 2", "ДЕНЬ 2", "ДЕНЬ 3", "ДЕНЬ 3",
-        "ДЕНЬ 4", "ДЕНЬ 4", "ДЕНЬ 5", "ДЕНЬ 5", "ДЕНЬ 6", "ДЕНЬ 6", "ДЕНЬ 7", "ДЕНЬ 7",
-        "ATR", "Размер тика", "Мин шаг покупки", "Средний объём", "Текущая цена",
-        "Комиссия открытие", "Комиссия закрытие"
-    ]
-    if headers != expected_headers:
-        logger.info("Обновление заголовков")
-        sheet.update(values=[expected_headers], range_name="A1:V1")
-    else:
-        logger.info("Заголовки корректны")
-
-    # Фильтрация и сбор данных
-    logger.info("Получение размера тика, минимального шага покупки и комиссий")
-    filtered_symbols = []
-    for symbol in symbols:
-        instrument_info = bybit_api.get_instrument_info(symbol)
-        tick_size = float(instrument_info.get('priceFilter', {}).get('tickSize', 0))
-        min_order_qty = float(instrument_info.get('lotSizeFilter', {}).get('minOrderQty', 0))
-        
-        # Получение комиссий
-        maker_fee, taker_fee = bybit_api.get_fee_rates(symbol)
-        logger.info(f"Комиссии для {symbol}: taker_fee={taker_fee}, maker_fee={maker_fee}")
-
-        if tick_size > 0 and min_order_qty > 0:
-            filtered_symbols.append((symbol, tick_size, min_order_qty, taker_fee, maker_fee))
+    current = {}
+    for info in infos:
+        symbol = info['symbol']
+        fee = fees.get(symbol)
+        if fee is None:
+            # Комиссии не пришли общим запросом: берем сохраненные или запрашиваем по символу
+            known = previous.get(symbol)
+            fee = (known["maker_fee"], known["taker_fee"]) if known else bybit_api.get_fee_rates(symbol)
+        instrument = parse_instrument(info, fee)
+        if instrument:
+            current[symbol] = instrument
         else:
-            logger.warning(f"Пропущен символ {symbol}: tick_size={tick_size}, min_order_qty={min_order_qty}")
+            logger.warning(f"Пропущен символ {symbol}: нет размера тика или минимального шага покупки")
+
+    # Сравниваем с предыдущим каталогом из хранилища и применяем только изменения
+    changes = diff_instruments(previous, current)
+    logger.info(
+        f"Изменения каталога: добавлено {len(changes.added)}, удалено {len(changes.delisted)}, "
+        f"изменено {len(changes.changed)}"
+    )
+    if not (changes.added or changes.delisted or changes.changed or force):
+        logger.info("Каталог инструментов не изменился, запись не требуется")
+        return changes
+
+    def commit():
+        # Каталог сохраняется только после записи листа: иначе следующий запуск сравнил бы каталог
+        # с уже обновленным хранилищем и не выгрузил бы изменения, которые не попали в лист
+        storage.upsert_instruments(changes.added + changes.changed)
+        storage.delete_instruments(changes.delisted)
+        if changes.delisted:
+            send_telegram_message(f"Инструменты сняты с торгов: {', '.join(changes.delisted)}")
+
+    # При принудительном запуске все инструменты каталога считаются обновленными для листа
+    sheet_changes = changes._replace(added=list(current.values()), changed=[]) if force else changes
+    if sync is not None:
+        sync.push("database", lambda rows: rows_with_changes(rows, sheet_changes), DATABASE_COLUMNS, on_written=commit)
+        logger.info("Изменения каталога поставлены в очередь выгрузки листа database")
+        return changes
+    if not apply_changes_to_sheet(sheets_client, sheet_changes):
+        logger.error("Лист database не обновлен, каталог в хранилище не изменен: изменения повторятся при следующем запуске")
+        return changes
+    commit()
+    logger.info("Статичные данные успешно обновлены")
+    return changes
 
-    # Пакетная запись данных в таблицу (полная перезапись)
-    logger.info(f"Запись {len(filtered_symbols)} отфильтрованных символов в таблицу")
-    values = []
-    for symbol, tick_size, min_order_qty, taker_fee, maker_fee in filtered_symbols:
-        row = [symbol] + [""] * 14 + ["", tick_size, min_order_qty, "", "", taker_fee, maker_fee]
-        values.append(row)
+def apply_changes_to_sheet(sheets_client, changes):
+    """Переносит изменения каталога в лист database: правит Q, R, U, V, удаляет и добавляет строки.
+
+    Возвращает True, если лист записан.
+    """
+    logger = logging.getLogger(__name__)
+    logger.info("Попытка получить лист database")
+    sheet = sheets_client.get_sheet("database")
+    if not sheet:
+        logger.error("Не удалось получить лист database")
+        return False
 
-    # Записываем все строки одним запросом
-    range_name = f"A2:V{len(filtered_symbols) + 1}"  # Начиная со второй строки
     try:
-        sheet.update(values=values, range_name=range_name)
-        logger.info(f"Успешно записаны данные в диапазон {range_name}")
+        all_data = sheet.get_all_values(value_render_option="UNFORMATTED_VALUE")
+        old_rows = [row[:DATABASE_COLUMNS] for row in all_data]
+        new_rows = rows_with_changes(old_rows, changes)
+        written_cells = sheets_client.write_diff(sheet, old_rows, new_rows)
     except Exception as e:
         logger.error(f"Ошибка при записи данных: {e}")
-        return
+        return False
+    if written_cells is None:
+        logger.error("Количество записанных ячеек не совпадает с подготовленными изменениями")
+        return False
+    logger.info(f"Лист database обновлен: записано {written_cells} ячеек, строк {len(new_rows) - 1}")
+    return True
 
-    logger.info("Статичные данные успешно обновлены")
+def rows_with_changes(old_rows, changes):
+    """Строки листа database (с заголовком) после применения изменений каталога к old_rows."""
+    delisted = set(changes.delisted)
+    updates = {instrument["symbol"]: instrument for instrument in changes.added + changes.changed}
+
+    new_rows = [EXPECTED_HEADERS]
+    present = set()
+    for row in old_rows[1:]:
+        symbol = row[0] if row else ''
+        if not symbol or symbol in delisted or symbol in present:
+            continue
+        row = list(row) + [''] * (DATABASE_COLUMNS - len(row))
+        instrument = updates.get(symbol)
+        if instrument:
+            row[16] = instrument["tick_size"]      # Q: Размер тика
+            row[17] = instrument["min_order_qty"]  # R: Мин шаг покупки
+            row[20] = instrument["taker_fee"]      # U: Комиссия открытие
+            row[21] = instrument["maker_fee"]      # V: Комиссия закрытие
+        new_rows.append(row)
+        present.add(symbol)
+
+    for instrument in changes.added:
+        if instrument["symbol"] not in present:
+            new_rows.append(
+                [instrument["symbol"]] + [""] * 14 +
+                ["", instrument["tick_size"], instrument["min_order_qty"], "", "",
+                 instrument["taker_fee"], instrument["maker_fee"]]
+            )
+    return new_rows
 
 if __name__ == "__main__":
-    populate_static_data()
\ No newline at end of file
+    populate_static_data(force=True)
\ No newline at end of file
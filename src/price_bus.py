@@ -0,0 +1,172 @@
+import logging
+import struct
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+# Формат сегмента разделяемой памяти:
+#   заголовок: magic (8 байт), capacity (uint32), count (uint32)
+#   таблица символов: capacity × SYMBOL_SIZE байт (utf-8, дополнено нулями)
+#   слоты: capacity × (seq uint64, price float64, exchange_ts float64)
+MAGIC = b"PRICEBUS"
+HEADER = struct.Struct("<8sII")
+SYMBOL_SIZE = 32
+SLOT_FIELDS = 3
+
+# Сегменты, созданные писателями этого процесса (ими управляет resource_tracker писателя)
+_owned_segments = set()
+
+def _layout(capacity):
+    slots_offset = HEADER.size + capacity * SYMBOL_SIZE
+    return slots_offset, slots_offset + capacity * SLOT_FIELDS * 8
+
+class PriceBusWriter:
+    """Публикует последние цены в разделяемую память (один писатель на шину).
+
+    Каждый слот защищен seqlock: перед записью seq становится нечетным, после — четным,
+    поэтому читатели без блокировок отличают целостный снимок от записи в процессе.
+    """
+
+    def __init__(self, name, symbols, capacity=None):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.capacity = capacity or max(len(symbols), 1)
+        slots_offset, size = _layout(self.capacity)
+        try:
+            # Сегмент от предыдущего запуска писателя пересоздаем
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _owned_segments.add(name)
+        self.shm.buf[:size] = bytes(size)
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, self.capacity, 0)
+        slots = self.shm.buf[slots_offset:size]
+        self._seq = slots.cast("Q")
+        self._values = slots.cast("d")
+        self.ids = {}
+        for symbol in symbols:
+            self.add_symbol(symbol)
+        self.logger.info(f"Шина цен {name} создана: {len(self.ids)} символов, емкость {self.capacity}")
+
+    def add_symbol(self, symbol):
+        """Регистрирует символ и возвращает его ID (номер слота)."""
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is not None:
+            return symbol_id
+        symbol_id = len(self.ids)
+        if symbol_id >= self.capacity:
+            raise ValueError(f"Шина цен {self.name} заполнена: емкость {self.capacity}")
+        encoded = symbol.encode("utf-8")[:SYMBOL_SIZE]
+        offset = HEADER.size + symbol_id * SYMBOL_SIZE
+        self.shm.buf[offset:offset + len(encoded)] = encoded
+        self.ids[symbol] = symbol_id
+        # Счетчик увеличивается после записи имени, чтобы читатель не увидел пустой символ
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, self.capacity, len(self.ids))
+        return symbol_id
+
+    def publish(self, symbol_id, price, exchange_ts):
+        base = symbol_id * SLOT_FIELDS
+        seq = self._seq[base]
+        self._seq[base] = seq + 1
+        self._values[base + 1] = price
+        self._values[base + 2] = exchange_ts
+        self._seq[base] = seq + 2
+
+    def publish_symbol(self, symbol, price, exchange_ts):
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is not None:
+            self.publish(symbol_id, price, exchange_ts)
+
+    def close(self, unlink=True):
+        self._seq.release()
+        self._values.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+            _owned_segments.discard(self.name)
+
+class PriceBusReader:
+    """Читает цены из шины без блокировок и без дополнительных подключений к бирже."""
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.shm = shared_memory.SharedMemory(name=name)
+        # Сегмент принадлежит писателю: не даем resource_tracker читателя удалить его при выходе
+        if name not in _owned_segments:
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        magic, self.capacity, _ = HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC:
+            self.shm.close()
+            raise ValueError(f"Сегмент {name} не является шиной цен")
+        slots_offset, size = _layout(self.capacity)
+        slots = self.shm.buf[slots_offset:size]
+        self._seq = slots.cast("Q")
+        self._values = slots.cast("d")
+        self.ids = {}
+        self.refresh_symbols()
+
+    def refresh_symbols(self):
+        """Подгружает символы, добавленные писателем после подключения."""
+        _, _, count = HEADER.unpack_from(self.shm.buf, 0)
+        for symbol_id in range(len(self.ids), count):
+            offset = HEADER.size + symbol_id * SYMBOL_SIZE
+            raw = bytes(self.shm.buf[offset:offset + SYMBOL_SIZE]).rstrip(b"\0")
+            self.ids[raw.decode("utf-8")] = symbol_id
+        return self.ids
+
+    def read_id(self, symbol_id, retries=1000):
+        """Возвращает (price, exchange_ts, seq) слота или None, если цена еще не публиковалась."""
+        base = symbol_id * SLOT_FIELDS
+        for _ in range(retries):
+            seq_before = self._seq[base]
+            if seq_before & 1:
+                continue
+            price = self._values[base + 1]
+            exchange_ts = self._values[base + 2]
+            if self._seq[base] == seq_before:
+                return None if seq_before == 0 else (price, exchange_ts, seq_before)
+        self.logger.warning(f"Не удалось получить согласованное значение слота {symbol_id} шины {self.name}")
+        return None
+
+    def read(self, symbol):
+        """Возвращает (price, exchange_ts) для символа или None."""
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.refresh_symbols().get(symbol)
+            if symbol_id is None:
+                return None
+        value = self.read_id(symbol_id)
+        return None if value is None else value[:2]
+
+    def snapshot(self):
+        """Возвращает {symbol: (price, exchange_ts)} по всем опубликованным символам."""
+        self.refresh_symbols()
+        result = {}
+        for symbol, symbol_id in self.ids.items():
+            value = self.read_id(symbol_id)
+            if value is not None:
+                result[symbol] = value[:2]
+        return result
+
+    def age(self, symbol):
+        """Возраст последней цены символа в секундах по времени биржи (None, если цены нет)."""
+        value = self.read(symbol)
+        return None if value is None else time.time() - value[1]
+
+    def close(self):
+        self._seq.release()
+        self._values.release()
+        self.shm.close()
+
+def open_reader(name):
+    """Подключается к шине цен; возвращает None, если шина не задана или писатель еще не запущен."""
+    if not name:
+        return None
+    try:
+        return PriceBusReader(name)
+    except (FileNotFoundError, ValueError) as e:
+        logging.getLogger(__name__).warning(f"Шина цен {name} недоступна: {e}")
+        return None
@@ -3,9 +3,19 @@ import time
 import os
 from datetime import datetime
 from google_sheets import GoogleSheetsClient
+from storage import create_storage
 from fetch_prices import PriceFetcher
 import threading
+import queue
+from gap_recovery import GapRecovery
+from trade_stream import TradeWatcher
+from proximity_index import ProximityIndex
+from ticks import TickTable, FLOOR, CEIL
+from log_setup import setup_logger, TickLogSampler
+from metrics import REGISTRY
 from config import GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID  # Добавляем импорт
+from config import TICK_LOG_INTERVAL_SECONDS, GAP_RECOVERY_MIN_SECONDS
+from config import TRADE_STREAM_ENABLED, TRADE_STREAM_PROXIMITY
 
 # Создаем директорию для логов
 log_dir = "logs"
@@ -16,28 +26,23 @@ if not os.path.exists(log_dir):
 current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 log_file = os.path.join(log_dir, f"price_monitor_{current_time}.log")
 
-# Создаем логгер для price_monitor
-logger = logging.getLogger("price_monitor")
-logger.setLevel(logging.INFO)
+# Создаем логгер для price_monitor (запись в файл и консоль выполняется в фоновом потоке)
+setup_logger("price_monitor", log_file, mode='w')
 
-# Создаем файловый обработчик
-file_handler = logging.FileHandler(log_file, mode='w', encoding='utf-8')
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(file_handler)
-
-# Добавляем консольный обработчик
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(console_handler)
+LEVEL_CHECKS = REGISTRY.counter("price_monitor_checks_total", "Проверок уровней")
+ALERTS = REGISTRY.counter("price_monitor_alerts_total", "Оповещений о пересечении уровней", ("type",))
+CROSSING_TO_ALERT_SECONDS = REGISTRY.histogram(
+    "price_monitor_crossing_to_alert_seconds", "От тика с пересечением (ts биржи) до оповещения, с"
+)
 
 class PriceMonitor:
-    def __init__(self):
+    def __init__(self, google_sheets=None, bybit_api=None, notify=None):
         self.logger = logging.getLogger("price_monitor")
         self.logger.info("Инициализация PriceMonitor")
         print("Инициализация PriceMonitor...")
 
         # Получаем монеты и уровни из Google Sheets
-        self.google_sheets = GoogleSheetsClient(GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID)  # Обновляем вызов
+        self.google_sheets = google_sheets or GoogleSheetsClient(GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID, storage=create_storage())
         self.trading_coins = self.google_sheets.get_trading_coins()
         self.levels = {coin["coin"]: {"long_level": coin["long_level"], "short_level": coin["short_level"]} for coin in self.trading_coins}
 
@@ -47,65 +52,173 @@ class PriceMonitor:
             self.logger.info(f"Монета: {coin['coin']}, long_level: {coin['long_level']}, short_level: {coin['short_level']}")
         print(f"Получено {len(self.trading_coins)} монет для мониторинга: {[coin['coin'] for coin in self.trading_coins]}")
 
-        # Инициализация PriceFetcher
-        self.price_fetcher = PriceFetcher()
+        # Инициализация PriceFetcher: монеты уже прочитаны, повторно лист не читаем
+        self.price_fetcher = PriceFetcher(google_sheets=self.google_sheets, bybit_api=bybit_api, trading_coins=self.trading_coins, notify=notify)
         self.running = True
         self.alerts_history = []
-        self.prev_prices = {coin["coin"]: None for coin in self.trading_coins}  # Храним предыдущие цены
+
+        # Цены и уровни сравниваются в целых тиках символа; уровни с листа выравниваются на сетку tickSize
+        # в сторону от цены: LONG вниз, SHORT вверх — выравнивание не срабатывает раньше уровня с листа
+        self.tick_table = TickTable.load(self.price_fetcher.bybit_api)
+        self.level_ticks = {}
+        for symbol, levels in self.levels.items():
+            grid = self.tick_table.grid(symbol)
+            self.level_ticks[symbol] = {}
+            for key, level in levels.items():
+                ticks = grid.to_ticks(level, FLOOR if key == "long_level" else CEIL) if level is not None else None
+                if ticks is not None and grid.price(ticks) != level:
+                    self.logger.info(f"{symbol}: {key} {level} выровнен на сетку {grid.tick_size}: {grid.format(ticks)}")
+                    levels[key] = grid.price(ticks)
+                self.level_ticks[symbol][key] = ticks
+        self.prev_ticks = {coin["coin"]: None for coin in self.trading_coins}  # Предыдущие цены в тиках
         self.alerted = {coin["coin"]: {"long": False, "short": False} for coin in self.trading_coins}  # Флаги оповещений
+        self.tick_log = TickLogSampler(self.logger, TICK_LOG_INTERVAL_SECONDS, level=logging.DEBUG)
 
-    def check_levels(self, symbol, current_price):
-        """Проверяет пересечение уровней LONG/SHORT и генерирует оповещения."""
-        levels = self.levels.get(symbol, {})
+        # Добор пересечений, пропущенных во время разрывов потока и пауз между проверками
+        self.gap_recovery = GapRecovery(self.price_fetcher.bybit_api)
+        self.pending_gaps = queue.Queue()
+        self.price_fetcher.gap_listeners.append(self.on_feed_gap)
+        # Индекс близости к уровням: далекие от уровней символы отсеиваются до проверки
+        try:
+            atr = self.google_sheets.get_atr()
+        except Exception as e:
+            self.logger.error(f"Не удалось получить ATR, используется доля цены: {e}")
+            atr = {}
+        self.proximity = ProximityIndex(self.price_fetcher.store, atr)
+        # Необязательный поток сделок для символов рядом с уровнями
+        self.trade_watcher = TradeWatcher(self.price_fetcher.bybit_api) if TRADE_STREAM_ENABLED else None
+
+    def check_levels(self, symbol, current_price, tick_ts=None):
+        """Проверяет пересечение уровней LONG/SHORT и генерирует оповещения.
+
+        tick_ts — время биржи (с) тика с текущей ценой, для замера задержки оповещения.
+        """
+        LEVEL_CHECKS.inc()
+        levels = self.level_ticks.get(symbol, {})
         long_level = levels.get("long_level")
         short_level = levels.get("short_level")
+        grid = self.tick_table.grid(symbol)
+        ticks = grid.to_ticks(current_price)
 
-        # Логируем для отладки
-        self.logger.debug(f"Проверка уровней для {symbol}: current_price {current_price}, long_level: {long_level}, short_level: {short_level}")
-        print(f"Проверка уровней для {symbol}: current_price {current_price}, long_level: {long_level}, short_level: {short_level}")
+        # Проверка выполняется на каждом тике: в лог попадает выборка, не чаще раза в интервал на символ
+        self.tick_log.log(symbol, "Проверка уровней для %s: current_price %s (%s тиков), long_level: %s, short_level: %s",
+                          symbol, current_price, ticks, long_level, short_level, price=current_price)
 
         # Если предыдущей цены нет (первый тик), просто сохраняем и выходим
-        if self.prev_prices[symbol] is None:
-            self.prev_prices[symbol] = current_price
+        prev = self.prev_ticks[symbol]
+        if prev is None:
+            self.prev_ticks[symbol] = ticks
             return
 
-        # Проверяем пересечение
+        # Проверяем пересечение (целые тики: граница уровня сравнивается точно)
         if long_level is not None and not self.alerted[symbol]["long"]:
-            if self.prev_prices[symbol] > long_level and current_price <= long_level:
-                alert_msg = f"Пересечение уровня LONG для {symbol}: цена {current_price} <= {long_level}"
-                self.logger.info(alert_msg)
-                print(alert_msg)
-                self.alerts_history.append({
-                    "symbol": symbol,
-                    "type": "LONG",
-                    "price": current_price,
-                    "level": long_level,
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-                self.alerted[symbol]["long"] = True
-                # Логируем историю только при новом оповещении
-                self.logger.info(f"История оповещений: {self.alerts_history[-5:]}")
-                print(f"История оповещений: {self.alerts_history[-5:]}")
+            if prev > long_level and ticks <= long_level:
+                self._emit_alert(symbol, "LONG", grid.price(ticks), grid.price(long_level), tick_ts)
 
         if short_level is not None and not self.alerted[symbol]["short"]:
-            if self.prev_prices[symbol] < short_level and current_price >= short_level:
-                alert_msg = f"Пересечение уровня SHORT для {symbol}: цена {current_price} >= {short_level}"
-                self.logger.info(alert_msg)
-                print(alert_msg)
-                self.alerts_history.append({
-                    "symbol": symbol,
-                    "type": "SHORT",
-                    "price": current_price,
-                    "level": short_level,
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-                self.alerted[symbol]["short"] = True
-                # Логируем историю только при новом оповещении
-                self.logger.info(f"История оповещений: {self.alerts_history[-5:]}")
-                print(f"История оповещений: {self.alerts_history[-5:]}")
+            if prev < short_level and ticks >= short_level:
+                self._emit_alert(symbol, "SHORT", grid.price(ticks), grid.price(short_level), tick_ts)
 
         # Обновляем предыдущую цену
-        self.prev_prices[symbol] = current_price
+        self.prev_ticks[symbol] = ticks
+
+    def check_range(self, symbol, candles):
+        """Ищет пересечения уровней по свечам (ts, open, high, low, close) за разрыв потока.
+
+        Пересечение LONG — цена была выше уровня, а low свечи до него дошла (SHORT — зеркально).
+        Оповещение получает время свечи (backfilled); предыдущая цена живого потока не меняется.
+        Возвращает число новых оповещений.
+        """
+        grid = self.tick_table.grid(symbol)
+        prev = self.prev_ticks.get(symbol)
+        alerts = 0
+        for event_ts, open_price, high, low, close in candles:
+            if prev is None:
+                prev = grid.to_ticks(open_price)
+            alerts += self._check_touch(symbol, prev, grid.to_ticks(low), grid.to_ticks(high), event_ts=event_ts)
+            prev = grid.to_ticks(close)
+        return alerts
+
+    def check_extremes(self, symbol, low, high, tick_ts=None):
+        """Проверяет min/max сделок между проверками (trade_stream.py): касание уровня между тиками тикера."""
+        prev = self.prev_ticks.get(symbol)
+        if prev is None:
+            return 0
+        grid = self.tick_table.grid(symbol)
+        return self._check_touch(symbol, prev, grid.to_ticks(low), grid.to_ticks(high), tick_ts=tick_ts)
+
+    def _check_touch(self, symbol, prev, low, high, tick_ts=None, event_ts=None):
+        """Пересечение по экстремумам (все цены в тиках): LONG — с цены выше уровня low дошел до него, SHORT — зеркально."""
+        levels = self.level_ticks.get(symbol, {})
+        long_level = levels.get("long_level")
+        short_level = levels.get("short_level")
+        grid = self.tick_table.grid(symbol)
+        alerts = 0
+        if long_level is not None and not self.alerted[symbol]["long"] and prev > long_level and low <= long_level:
+            self._emit_alert(symbol, "LONG", grid.price(low), grid.price(long_level), tick_ts, event_ts)
+            alerts += 1
+        if short_level is not None and not self.alerted[symbol]["short"] and prev < short_level and high >= short_level:
+            self._emit_alert(symbol, "SHORT", grid.price(high), grid.price(short_level), tick_ts, event_ts)
+            alerts += 1
+        return alerts
+
+    def near_level_symbols(self, proximity):
+        """Символы не дальше proximity ATR от еще активного уровня, от ближайших к дальним."""
+        return self.proximity.nearest(proximity)
+
+    def active_levels(self, symbol):
+        """Уровни символа, по которым еще возможны оповещения."""
+        levels = self.levels.get(symbol, {})
+        return [
+            levels[key] for key, side in (("long_level", "long"), ("short_level", "short"))
+            if levels.get(key) is not None and not self.alerted[symbol][side]
+        ]
+
+    def symbols_to_watch(self, symbols):
+        """Символы с уровнями, по которым еще возможны оповещения."""
+        return [symbol for symbol in symbols if symbol in self.levels and self.active_levels(symbol)]
+
+    def _emit_alert(self, symbol, alert_type, price, level, tick_ts=None, event_ts=None):
+        """Создает оповещение; event_ts — время пересечения при доборе по свечам."""
+        alert_msg = f"Пересечение уровня {alert_type} для {symbol}: цена {price} {'<=' if alert_type == 'LONG' else '>='} {level}"
+        alert_time = datetime.fromtimestamp(event_ts) if event_ts else datetime.now()
+        alert = {
+            "symbol": symbol,
+            "type": alert_type,
+            "price": price,
+            "level": level,
+            "timestamp": alert_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "detected_at": time.time()
+        }
+        if event_ts:
+            alert["backfilled"] = True
+            alert_msg += f" (добор по свечам, {alert['timestamp']})"
+        self.logger.info(alert_msg)
+        print(alert_msg)
+        self.alerts_history.append(alert)
+        self._record_alert(alert_type, tick_ts)
+        self.alerted[symbol][alert_type.lower()] = True
+        # Логируем историю только при новом оповещении
+        self.logger.info(f"История оповещений: {self.alerts_history[-5:]}")
+        print(f"История оповещений: {self.alerts_history[-5:]}")
+
+    def _record_alert(self, alert_type, tick_ts):
+        ALERTS.inc(alert_type)
+        if tick_ts:
+            CROSSING_TO_ALERT_SECONDS.observe(max(time.time() - tick_ts, 0.0))
+
+    def on_feed_gap(self, symbols, gap_start, gap_end):
+        """Обработчик FeedSupervisor: добор выполняется в потоке мониторинга, а не в потоке надзора."""
+        self.pending_gaps.put((symbols, gap_start, gap_end, "feed"))
+
+    def recover_pending_gaps(self):
+        while not self.pending_gaps.empty():
+            symbols, gap_start, gap_end, source = self.pending_gaps.get_nowait()
+            try:
+                self.gap_recovery.recover(self, symbols, gap_start, gap_end, source)
+            except Exception as e:
+                self.logger.error(f"Ошибка добора разрыва {source}: {e}")
+                print(f"Ошибка добора разрыва {source}: {e}")
 
     def get_alerts_history(self):
         """Метод для получения истории оповещений."""
@@ -122,14 +235,34 @@ class PriceMonitor:
         fetcher_thread.start()
 
         try:
+            last_version = 0
+            last_pass = time.time()
             while self.running:
-                # Получаем текущие цены из PriceFetcher
-                current_prices = self.price_fetcher.get_current_prices()
+                # Пауза между проверками дольше GAP_RECOVERY_MIN_SECONDS — тоже разрыв, его добираем по свечам
+                now = time.time()
+                if now - last_pass > GAP_RECOVERY_MIN_SECONDS:
+                    self.pending_gaps.put((list(self.levels), last_pass, now, "monitor"))
+                last_pass = now
+                # Пропущенные пересечения обрабатываются раньше цен после разрыва
+                self.recover_pending_gaps()
+
+                # Берем из хранилища PriceFetcher только символы, цена которых изменилась с прошлой проверки
+                changes = self.price_fetcher.store.changed_since(last_version)
+                last_version = changes.version
+
+                # Экстремумы сделок между проверками: касания, которые тикер мог не показать
+                if self.trade_watcher is not None:
+                    for symbol, (low, high, trade_ts) in self.trade_watcher.take().items():
+                        self.check_extremes(symbol, low, high, trade_ts)
+
+                # Проверяем уровни только у монет рядом с уровнями или сдвинувшихся к ним
+                for symbol, price, tick_ts in self.proximity.select(changes).items():
+                    if price > 0:
+                        self.check_levels(symbol, price, tick_ts)
+                        self.proximity.update(symbol, price, self.active_levels(symbol))
 
-                # Проверяем уровни для каждой монеты
-                for symbol, price in current_prices.items():
-                    if price > 0:  # Проверяем, что цена обновилась
-                        self.check_levels(symbol, price)
+                if self.trade_watcher is not None:
+                    self.trade_watcher.update_selection(self.near_level_symbols(TRADE_STREAM_PROXIMITY))
 
                 time.sleep(10)  # Проверяем каждые 10 секунд
         except KeyboardInterrupt:
@@ -142,6 +275,9 @@ class PriceMonitor:
             print(f"Неожиданная ошибка в цикле: {e}")
             self.running = False
             self.price_fetcher.running = False
+        finally:
+            if self.trade_watcher is not None:
+                self.trade_watcher.stop()
 
 if __name__ == "__main__":
     monitor = PriceMonitor()
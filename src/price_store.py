@@ -0,0 +1,117 @@
+import threading
+import numpy as np
+
+class PriceSnapshot:
+    """Согласованный снимок хранилища на версии version (только символы, по которым были тики)."""
+
+    def __init__(self, version, symbols, prices, times, seqs, ids=None):
+        self.version = version
+        self.symbols = symbols
+        self.ids = ids  # ID символов в хранилище, в том же порядке
+        self.prices = prices
+        self.times = times
+        self.seqs = seqs
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def subset(self, mask):
+        """Снимок той же версии только с символами, отмеченными булевой маской."""
+        positions = np.flatnonzero(mask).tolist()
+        return PriceSnapshot(self.version, [self.symbols[i] for i in positions], self.prices[mask],
+                             self.times[mask], self.seqs[mask], None if self.ids is None else self.ids[mask])
+
+    def items(self):
+        """(symbol, price, exchange_ts) по всем символам снимка."""
+        return zip(self.symbols, self.prices.tolist(), self.times.tolist())
+
+    def as_dict(self):
+        return {symbol: price for symbol, price, _ in self.items()}
+
+class PriceStore:
+    """Последние цены символов в преаллоцированных массивах numpy с версионированием.
+
+    Символ получает целочисленный ID при регистрации; запись тика — O(1) независимо от числа символов:
+    поиск ID в словаре и запись цены, времени биржи и номера версии в массивы под коротким локом.
+    Читатели получают целостные снимки (snapshot) или изменения после версии N (changed_since).
+    """
+
+    def __init__(self, symbols=(), capacity=None):
+        self.ids = {}
+        self.symbols = []
+        self.version = 0
+        self.lock = threading.Lock()
+        capacity = max(capacity or len(symbols), 16)
+        self.prices = np.zeros(capacity, dtype=np.float64)
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.seqs = np.zeros(capacity, dtype=np.int64)  # Версия последней записи символа (0 — тиков не было)
+        for symbol in symbols:
+            self.add_symbol(symbol)
+
+    def add_symbol(self, symbol):
+        """Регистрирует символ и возвращает его ID; при заполнении массивы увеличиваются вдвое."""
+        with self.lock:
+            symbol_id = self.ids.get(symbol)
+            if symbol_id is not None:
+                return symbol_id
+            symbol_id = len(self.symbols)
+            if symbol_id >= len(self.prices):
+                size = len(self.prices) * 2
+                self.prices = np.resize(self.prices, size)
+                self.times = np.resize(self.times, size)
+                self.seqs = np.resize(self.seqs, size)
+                self.prices[symbol_id:] = self.times[symbol_id:] = self.seqs[symbol_id:] = 0
+            self.symbols.append(symbol)
+            self.ids[symbol] = symbol_id
+            return symbol_id
+
+    def id_of(self, symbol):
+        return self.ids.get(symbol)
+
+    def update(self, symbol_id, price, exchange_ts):
+        """Записывает тик по ID символа и возвращает новую версию хранилища."""
+        with self.lock:
+            self.version += 1
+            self.prices[symbol_id] = price
+            self.times[symbol_id] = exchange_ts
+            self.seqs[symbol_id] = self.version
+            return self.version
+
+    def update_symbol(self, symbol, price, exchange_ts):
+        """Записывает тик по имени символа; незарегистрированные символы пропускаются (None)."""
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is None:
+            return None
+        return self.update(symbol_id, price, exchange_ts)
+
+    def get(self, symbol):
+        """(price, exchange_ts) символа или None, если тиков еще не было."""
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is None:
+            return None
+        with self.lock:
+            if not self.seqs[symbol_id]:
+                return None
+            return float(self.prices[symbol_id]), float(self.times[symbol_id])
+
+    def _select(self, mask_seq):
+        # Вызывается под локом: копии массивов не меняются после выхода из него
+        count = len(self.symbols)
+        ids = np.flatnonzero(self.seqs[:count] > mask_seq)
+        return PriceSnapshot(self.version, [self.symbols[i] for i in ids.tolist()],
+                             self.prices[ids], self.times[ids], self.seqs[ids], ids)
+
+    def snapshot(self):
+        """Снимок всех символов, по которым были тики."""
+        with self.lock:
+            return self._select(0)
+
+    def changed_since(self, seq):
+        """Символы, обновленные после версии seq; новая точка отсчета — version снимка."""
+        with self.lock:
+            return self._select(seq)
+
+    def updated_count(self):
+        """Число символов, по которым был хотя бы один тик."""
+        with self.lock:
+            return int(np.count_nonzero(self.seqs[:len(self.symbols)]))
@@ -0,0 +1,175 @@
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from datetime import datetime
+from config import PROFILE_DIR, PROFILE_MAX_SECONDS
+
+# Профилирование по запросу: выборка стеков CPU, снимки tracemalloc и дамп потоков.
+# Пока профилирование не запущено, ничего не работает: нет потоков, хуков и трассировки памяти.
+
+logger = logging.getLogger(__name__)
+
+# Одновременно выполняется только одно профилирование в процессе
+_busy = threading.Lock()
+
+class ProfilingBusy(RuntimeError):
+    pass
+
+def _output_path(kind, extension):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{kind}_{os.getpid()}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.{extension}"
+    return os.path.join(PROFILE_DIR, name)
+
+def _clamp(seconds):
+    return min(max(float(seconds), 1.0), PROFILE_MAX_SECONDS)
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+class StackSampler:
+    """Выборка стеков всех потоков через sys._current_frames с заданным интервалом.
+
+    Сигнальный сэмплер (SIGPROF) в CPython видит только главный поток, а сервисы
+    работают в потоках WebSocket, мониторинга и Telegram, поэтому выборка идет из отдельного потока.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[tuple(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self, seconds):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.sample()
+            time.sleep(self.interval)
+
+    def top(self, count=15):
+        """Функции с наибольшим числом выборок на вершине стека (self) и в стеке (total)."""
+        own, total = collections.Counter(), collections.Counter()
+        for stack, hits in self.stacks.items():
+            own[stack[-1]] += hits
+            for name in set(stack[1:]):
+                total[name] += hits
+        return own.most_common(count), total.most_common(count)
+
+    def write_folded(self, path):
+        """Формат collapsed stacks для flamegraph.pl / speedscope."""
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, hits in self.stacks.most_common():
+                file.write(";".join(stack) + f" {hits}\n")
+
+def cpu_profile(seconds=30, top=15, interval=0.005):
+    """Снимает выборку стеков за seconds секунд, пишет файл .folded и возвращает текстовую сводку."""
+    if not _busy.acquire(blocking=False):
+        raise ProfilingBusy("Профилирование уже выполняется")
+    try:
+        seconds = _clamp(seconds)
+        logger.info(f"Профилирование CPU на {seconds:g} с")
+        sampler = StackSampler(interval)
+        sampler.run(seconds)
+        path = _output_path("cpu", "folded")
+        sampler.write_folded(path)
+    finally:
+        _busy.release()
+    own, total = sampler.top(top)
+    total_hits = sum(sampler.stacks.values()) or 1
+    # Выборка по реальному времени: потоки, ждущие сокет или sleep, тоже попадают в стеки
+    lines = [f"CPU: {sampler.samples} выборок за {seconds:g} с, файл {path}", "Вершина стека (self):"]
+    lines += [f"{hits / total_hits:6.1%}  {name}" for name, hits in own]
+    lines.append("В стеке (total):")
+    lines += [f"{hits / total_hits:6.1%}  {name}" for name, hits in total]
+    return "\n".join(lines)
+
+def heap_profile(seconds=30, top=15, frames=10):
+    """Снимки tracemalloc в начале и конце окна: крупнейшие места выделения и рост за окно."""
+    if not _busy.acquire(blocking=False):
+        raise ProfilingBusy("Профилирование уже выполняется")
+    started_here = not tracemalloc.is_tracing()
+    try:
+        seconds = _clamp(seconds)
+        logger.info(f"Профилирование памяти на {seconds:g} с")
+        if started_here:
+            tracemalloc.start(frames)
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        # Трассировка памяти замедляет все выделения, поэтому выключается сразу после снимка
+        if started_here:
+            tracemalloc.stop()
+        _busy.release()
+
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+    before, after = before.filter_traces(filters), after.filter_traces(filters)
+    largest = after.statistics("lineno")[:top]
+    growth = [stat for stat in after.compare_to(before, "lineno") if stat.size_diff > 0][:top]
+    path = _output_path("heap", "txt")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(f"traced current={current} peak={peak}\n\n# Крупнейшие по traceback\n")
+        for stat in after.statistics("traceback")[:top]:
+            file.write(f"{stat.size} B, {stat.count} блоков\n" + "\n".join(stat.traceback.format()) + "\n\n")
+        file.write("# Рост за окно\n")
+        file.write("\n".join(str(stat) for stat in growth) + "\n")
+
+    lines = [f"Память: отслежено {current / 1024:.0f} КиБ (пик {peak / 1024:.0f} КиБ) за {seconds:g} с, файл {path}",
+             "Крупнейшие:"]
+    lines += [f"{stat.size / 1024:8.1f} КиБ  {stat.traceback[0]}" for stat in largest]
+    lines.append("Рост за окно:")
+    lines += [f"{stat.size_diff / 1024:+8.1f} КиБ  {stat.traceback[0]}" for stat in growth] or ["нет"]
+    return "\n".join(lines)
+
+def thread_dump():
+    """Стеки всех потоков процесса; пишет файл и возвращает текст."""
+    names = {thread.ident: thread for thread in threading.enumerate()}
+    blocks = []
+    for ident, frame in sys._current_frames().items():
+        thread = names.get(ident)
+        title = f"{thread.name} (daemon)" if thread and thread.daemon else (thread.name if thread else str(ident))
+        blocks.append(f"Поток {title}:\n" + "".join(traceback.format_stack(frame)))
+    text = "\n".join(blocks)
+    path = _output_path("threads", "txt")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+    return f"Потоков: {len(blocks)}, файл {path}\n\n{text}"
+
+def handle_request(path, params):
+    """Команды управления по HTTP (сервер метрик): /debug/profile, /debug/heap, /debug/threads.
+
+    Возвращает (код ответа, текст).
+    """
+    try:
+        seconds = float(params.get("seconds", 30))
+        top = int(params.get("top", 15))
+        if path == "/debug/profile":
+            return 200, cpu_profile(seconds, top)
+        if path == "/debug/heap":
+            return 200, heap_profile(seconds, top)
+        if path == "/debug/threads":
+            return 200, thread_dump()
+    except ProfilingBusy as e:
+        return 409, str(e)
+    except ValueError as e:
+        return 400, f"Некорректные параметры: {e}"
+    return 404, f"Неизвестная команда {path}"
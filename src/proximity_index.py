@@ -0,0 +1,83 @@
+import threading
+import numpy as np
+from metrics import REGISTRY
+from config import PROXIMITY_BAND_ATR, PROXIMITY_DEFAULT_ATR_SHARE
+
+NEAR_SYMBOLS = REGISTRY.gauge("proximity_near_symbols", "Символов в полосе PROXIMITY_BAND_ATR от активного уровня")
+SKIPPED_CHECKS = REGISTRY.counter("proximity_skipped_checks_total", "Тиков, отсеянных пороговой проверкой далеких символов")
+
+class ProximityIndex:
+    """Расстояние от цены символа до ближайшего активного уровня в единицах ATR (лист database).
+
+    Символы делятся на две корзины. Ближние (не дальше band ATR) проверяются на каждом тике.
+    Для дальних запоминается цена последней оценки (anchor) и запас slack = расстояние − band·ATR:
+    пока |цена − anchor| < slack, ни один уровень недостижим и проверка пропускается. Пороговая
+    проверка выполняется одной векторной операцией по всем изменившимся символам (select), а символ,
+    вышедший за порог, проверяется полностью и заново оценивается (update).
+    Массивы индексируются ID символов PriceStore.
+    """
+
+    def __init__(self, store, atr=None, band=PROXIMITY_BAND_ATR, default_atr_share=PROXIMITY_DEFAULT_ATR_SHARE):
+        self.store = store
+        self.atr = dict(atr or {})
+        self.band = band
+        self.default_atr_share = default_atr_share
+        self.lock = threading.Lock()
+        self.near = set()
+        # Новый символ (anchor=NaN) всегда проходит порог: первая проверка его и оценивает
+        self.anchor = np.full(0, np.nan)
+        self.slack = np.zeros(0)
+        self.distance = np.full(0, np.inf)  # Расстояние до ближайшего активного уровня, ATR
+
+    def _ensure(self, size):
+        if size <= len(self.anchor):
+            return
+        size = max(size, len(self.anchor) * 2, 16)
+        old = len(self.anchor)
+        self.anchor = np.concatenate([self.anchor, np.full(size - old, np.nan)])
+        self.slack = np.concatenate([self.slack, np.zeros(size - old)])
+        self.distance = np.concatenate([self.distance, np.full(size - old, np.inf)])
+
+    def select(self, changes):
+        """Из снимка PriceStore оставляет символы, которым нужна полная проверка уровней."""
+        if not len(changes):
+            return changes
+        with self.lock:
+            self._ensure(int(changes.ids.max()) + 1)
+            far = np.abs(changes.prices - self.anchor[changes.ids]) < self.slack[changes.ids]
+        skipped = int(np.count_nonzero(far))
+        if skipped:
+            SKIPPED_CHECKS.inc(amount=skipped)
+        return changes.subset(~far)
+
+    def update(self, symbol, price, levels):
+        """Оценивает символ по цене и списку его активных уровней; возвращает расстояние в ATR."""
+        symbol_id = self.store.id_of(symbol)
+        if symbol_id is None or not price:
+            return None
+        with self.lock:
+            self._ensure(symbol_id + 1)
+            self.anchor[symbol_id] = price
+            if not levels:
+                # Активных уровней нет: символ больше не проверяется
+                self.slack[symbol_id] = self.distance[symbol_id] = np.inf
+                self.near.discard(symbol)
+            else:
+                atr = self.atr.get(symbol) or abs(price) * self.default_atr_share
+                gap = min(abs(price - level) for level in levels)
+                self.distance[symbol_id] = gap / atr
+                if gap <= self.band * atr:
+                    self.slack[symbol_id] = 0.0
+                    self.near.add(symbol)
+                else:
+                    self.slack[symbol_id] = gap - self.band * atr
+                    self.near.discard(symbol)
+            NEAR_SYMBOLS.set(value=len(self.near))
+            return float(self.distance[symbol_id])
+
+    def nearest(self, band=None):
+        """Ближние символы (не дальше band ATR, по умолчанию — вся полоса) от ближайших к дальним."""
+        band = self.band if band is None else band
+        with self.lock:
+            ranked = [(float(self.distance[self.store.id_of(symbol)]), symbol) for symbol in self.near]
+        return [symbol for distance, symbol in sorted(ranked) if distance <= band]
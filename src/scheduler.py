@@ -0,0 +1,201 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from google_sheets import GoogleSheetsClient
+from bybit_api import BybitAPI
+from storage import create_storage, SheetsSync
+from populate_static_data import populate_static_data
+from populate_historical_data import populate_historical_data
+from metrics import start_from_config
+from log_setup import setup_logger
+from config import GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID, BYBIT_API_KEY, BYBIT_API_SECRET
+from config import STATIC_SCHEDULE, HISTORICAL_SCHEDULE, SCHEDULER_RUN_ON_START
+
+# Создаем директорию для логов
+log_dir = "logs"
+if not os.path.exists(log_dir):
+    os.makedirs(log_dir)
+
+# Создаем логгер для scheduler (запись в файл и консоль выполняется в фоновом потоке)
+logger = setup_logger("scheduler", os.path.join(log_dir, "scheduler.log"))
+
+class CronSchedule:
+    """Расписание в формате cron из 5 полей (минута, час, день месяца, месяц, день недели), время UTC.
+
+    Поддерживаются *, числа, диапазоны a-b, списки через запятую и шаг /n.
+    """
+
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Ожидалось 5 полей cron, получено {len(fields)}: '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.RANGES)
+        )
+        # Как в cron: если ограничены и день месяца, и день недели, достаточно совпадения любого
+        self.days_restricted = fields[2] != "*"
+        self.weekdays_restricted = fields[4] != "*"
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for part in field.split(","):
+            value_range, _, step = part.partition("/")
+            step = int(step) if step else 1
+            if value_range == "*":
+                start, end = low, high
+            elif "-" in value_range:
+                start, end = (int(value) for value in value_range.split("-"))
+            else:
+                start = int(value_range)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"Значение '{part}' вне диапазона {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment):
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays  # cron: 0 — воскресенье
+        if self.days_restricted and self.weekdays_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment):
+        """Возвращает ближайший момент срабатывания строго после moment (datetime с tzinfo UTC)."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months or not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+            return candidate
+        raise ValueError(f"Расписание '{self.expression}' никогда не срабатывает")
+
+class ScheduledJob:
+    def __init__(self, name, schedule, func, group=None):
+        self.name = name
+        self.schedule = CronSchedule(schedule)
+        self.func = func
+        self.group = group
+        self.running = threading.Lock()  # Не допускает пересекающихся запусков одной задачи
+        self.next_run = None
+        self.last_duration = None
+
+class JobScheduler:
+    """Долгоживущий планировщик задач обновления листа "database".
+
+    Клиенты Google Sheets, Bybit, хранилище и фоновая выгрузка в Google Sheets (SheetsSync) создаются
+    один раз и переиспользуются между запусками.
+    Задачи одной группы выполняются по очереди; запуск задачи, которая еще выполняется, пропускается.
+    """
+
+    def __init__(self, sheets_client=None, bybit_api=None, storage=None):
+        self.logger = logging.getLogger("scheduler")
+        self.logger.info("Инициализация JobScheduler")
+        print("Инициализация JobScheduler...")
+
+        self.sheets_client = sheets_client or GoogleSheetsClient(GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID)
+        self.bybit_api = bybit_api or BybitAPI(api_key=BYBIT_API_KEY, api_secret=BYBIT_API_SECRET)
+        self.storage = storage or create_storage()
+        self.sheets_client.storage = self.sheets_client.storage or self.storage
+        # Задачи сохраняют данные в хранилище и ставят запись листа в очередь, не дожидаясь Google Sheets
+        self.sync = SheetsSync(self.sheets_client)
+        self.jobs = []
+        self.group_locks = {}
+        self.running = True
+
+    def add_job(self, name, schedule, func, group=None):
+        job = ScheduledJob(name, schedule, func, group)
+        job.next_run = job.schedule.next_after(datetime.now(timezone.utc))
+        if group is not None:
+            self.group_locks.setdefault(group, threading.Lock())
+        self.jobs.append(job)
+        self.logger.info(f"Задача {name} добавлена: '{schedule}' (UTC), следующий запуск {job.next_run}")
+        print(f"Задача {name} добавлена: '{schedule}' (UTC), следующий запуск {job.next_run}")
+        return job
+
+    def trigger(self, job):
+        """Запускает задачу в отдельном потоке, если она еще не выполняется."""
+        if not job.running.acquire(blocking=False):
+            self.logger.warning(f"Задача {job.name} еще выполняется, запуск пропущен")
+            print(f"Задача {job.name} еще выполняется, запуск пропущен")
+            return False
+        threading.Thread(target=self._execute, args=(job,), daemon=True, name=f"job-{job.name}").start()
+        return True
+
+    def run_in_order(self, jobs):
+        """Выполняет задачи последовательно в текущем потоке; выполняющаяся задача пропускается."""
+        for job in jobs:
+            if not job.running.acquire(blocking=False):
+                self.logger.warning(f"Задача {job.name} еще выполняется, запуск пропущен")
+                print(f"Задача {job.name} еще выполняется, запуск пропущен")
+                continue
+            self._execute(job)
+
+    def _execute(self, job):
+        group_lock = self.group_locks.get(job.group)
+        try:
+            if group_lock:
+                group_lock.acquire()
+            started = time.monotonic()
+            self.logger.info(f"Запуск задачи {job.name}")
+            print(f"Запуск задачи {job.name}")
+            job.func(sheets_client=self.sheets_client, bybit_api=self.bybit_api, storage=self.storage, sync=self.sync)
+            job.last_duration = time.monotonic() - started
+            self.logger.info(f"Задача {job.name} завершена за {job.last_duration:.1f} с")
+            print(f"Задача {job.name} завершена за {job.last_duration:.1f} с")
+        except Exception as e:
+            self.logger.error(f"Ошибка при выполнении задачи {job.name}: {e}")
+            print(f"Ошибка при выполнении задачи {job.name}: {e}")
+        finally:
+            if group_lock:
+                group_lock.release()
+            job.running.release()
+
+    def run(self, run_on_start=False):
+        """Основной цикл: проверяет расписание раз в секунду."""
+        self.logger.info("Запуск JobScheduler...")
+        print("Запуск JobScheduler...")
+        if run_on_start:
+            # Задачи при старте идут по очереди в порядке добавления: историческому обновлению
+            # нужен свежий каталог инструментов из статичного
+            threading.Thread(target=self.run_in_order, args=(list(self.jobs),), daemon=True, name="jobs-on-start").start()
+
+        try:
+            while self.running:
+                now = datetime.now(timezone.utc)
+                for job in self.jobs:
+                    if now >= job.next_run:
+                        self.trigger(job)
+                        job.next_run = job.schedule.next_after(now)
+                        self.logger.info(f"Следующий запуск {job.name}: {job.next_run}")
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.logger.info("Остановлено пользователем")
+            print("Остановлено пользователем")
+            self.running = False
+
+def build_scheduler(sheets_client=None, bybit_api=None, storage=None):
+    """Создает планировщик со статичным и историческим обновлением листа "database"."""
+    scheduler = JobScheduler(sheets_client, bybit_api, storage)
+    # Обе задачи пишут в лист database, поэтому выполняются по очереди (группа "database")
+    scheduler.add_job("populate_static_data", STATIC_SCHEDULE, populate_static_data, group="database")
+    scheduler.add_job("populate_historical_data", HISTORICAL_SCHEDULE, populate_historical_data, group="database")
+    return scheduler
+
+if __name__ == "__main__":
+    start_from_config()
+    scheduler = build_scheduler()
+    scheduler.run(run_on_start=SCHEDULER_RUN_ON_START)
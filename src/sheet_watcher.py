@@ -0,0 +1,57 @@
+import logging
+import time
+
+class SheetChangeDetector:
+    """Опрашивает дешевый отпечаток листов и разрешает полное чтение только при его изменении.
+
+    Интервал опроса растет в backoff раз при каждом опросе без изменений (до max_interval)
+    и сбрасывается до min_interval после изменения или найденной активности. Отпечаток считается
+    учтенным только после успешного полного чтения (mark_read): при ошибке чтения изменение
+    не теряется и чтение повторяется на следующем опросе.
+    """
+
+    def __init__(self, fetch_fingerprint, min_interval=3, max_interval=60, backoff=2.0, full_refresh_interval=300):
+        self.logger = logging.getLogger(__name__)
+        self.fetch_fingerprint = fetch_fingerprint
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.full_refresh_interval = full_refresh_interval
+        self.interval = min_interval
+        self.last_fingerprint = None
+        self.last_full_read = None
+        self.pending_fingerprint = None  # Отпечаток, для которого разрешено полное чтение
+
+    def should_read(self, now=None):
+        """Возвращает True, если отпечаток изменился или пора сделать контрольное полное чтение."""
+        now = time.monotonic() if now is None else now
+        try:
+            fingerprint = self.fetch_fingerprint()
+        except Exception as e:
+            self.logger.error(f"Ошибка при получении отпечатка листов: {e}")
+            self._slow_down()
+            return False
+
+        changed = fingerprint != self.last_fingerprint
+        refresh_due = self.last_full_read is None or now - self.last_full_read >= self.full_refresh_interval
+        if changed or refresh_due:
+            if changed:
+                self.logger.info(f"Отпечаток листов изменился: {fingerprint}")
+            self.pending_fingerprint = fingerprint
+            self.mark_active()
+            return True
+
+        self._slow_down()
+        return False
+
+    def mark_read(self, now=None):
+        """Полное чтение после should_read прошло успешно: его отпечаток и время запоминаются."""
+        self.last_fingerprint = self.pending_fingerprint
+        self.last_full_read = time.monotonic() if now is None else now
+
+    def mark_active(self):
+        """Возвращает частый опрос после активности (изменение листа или найденные сделки)."""
+        self.interval = self.min_interval
+
+    def _slow_down(self):
+        self.interval = min(self.interval * self.backoff, self.max_interval)
@@ -0,0 +1,306 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from config import STORAGE_BACKEND, STORAGE_PATH
+
+# Поля таблиц локального хранилища
+INSTRUMENT_FIELDS = [
+    "symbol", "tick_size", "min_order_qty", "qty_step", "max_order_qty",
+    "min_price", "max_price", "taker_fee", "maker_fee"
+]
+HISTORICAL_FIELDS = ["symbol", "low_day1", "history", "atr", "volume", "atr_14", "atr_30"]
+LEVEL_FIELDS = ["coin", "long_level", "short_level"]
+
+# Количество столбцов листа "database" (A–V)
+DATABASE_COLUMNS = 22
+# Пауза перед повтором неудачной выгрузки SheetsSync (с): удваивается до максимума
+SYNC_RETRY_MIN_DELAY = 1.0
+SYNC_RETRY_MAX_DELAY = 60.0
+
+class Storage(ABC):
+    """Интерфейс хранилища данных листов "database" и "analitics".
+
+    instruments — статичные данные инструментов (тик, лоты, комиссии),
+    historical — исторические данные (Low День 1, C–O, ATR, объём, ATR за 14 и 30 дней),
+    levels — уровни LONG/SHORT монет, отмеченных для торговли.
+    """
+
+    @abstractmethod
+    def upsert_instruments(self, instruments):
+        """Добавляет или обновляет инструменты (словари с полями INSTRUMENT_FIELDS)."""
+
+    @abstractmethod
+    def delete_instruments(self, symbols):
+        """Удаляет инструменты и их исторические данные."""
+
+    @abstractmethod
+    def get_instruments(self):
+        """Возвращает словарь {symbol: instrument} в порядке добавления."""
+
+    @abstractmethod
+    def upsert_historical(self, rows):
+        """Добавляет или обновляет исторические данные (словари с полями HISTORICAL_FIELDS)."""
+
+    @abstractmethod
+    def get_historical(self):
+        """Возвращает словарь {symbol: historical_row}."""
+
+    @abstractmethod
+    def replace_levels(self, levels):
+        """Заменяет уровни всех монет новым списком."""
+
+    @abstractmethod
+    def get_levels(self):
+        """Возвращает уровни в формате get_trading_coins."""
+
+    def close(self):
+        pass
+
+class InMemoryStorage(Storage):
+    """Хранилище в памяти процесса для тестов и бенчмарков без сети и диска."""
+
+    def __init__(self):
+        self.instruments = {}
+        self.historical = {}
+        self.levels = []
+
+    def upsert_instruments(self, instruments):
+        for instrument in instruments:
+            self.instruments[instrument["symbol"]] = {field: instrument.get(field) for field in INSTRUMENT_FIELDS}
+
+    def delete_instruments(self, symbols):
+        for symbol in symbols:
+            self.instruments.pop(symbol, None)
+            self.historical.pop(symbol, None)
+
+    def get_instruments(self):
+        return {symbol: dict(instrument) for symbol, instrument in self.instruments.items()}
+
+    def upsert_historical(self, rows):
+        for row in rows:
+            self.historical[row["symbol"]] = {field: row.get(field) for field in HISTORICAL_FIELDS}
+
+    def get_historical(self):
+        return {symbol: dict(row) for symbol, row in self.historical.items()}
+
+    def replace_levels(self, levels):
+        self.levels = [{field: level.get(field) for field in LEVEL_FIELDS} for level in levels]
+
+    def get_levels(self):
+        return [dict(level) for level in self.levels]
+
+class SQLiteStorage(Storage):
+    """Локальное хранилище в SQLite (WAL), доступное нескольким процессам на одной машине."""
+
+    def __init__(self, path):
+        self.logger = logging.getLogger(__name__)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS instruments ("
+                "symbol TEXT PRIMARY KEY, tick_size REAL, min_order_qty REAL, qty_step REAL, "
+                "max_order_qty REAL, min_price REAL, max_price REAL, taker_fee REAL, maker_fee REAL, "
+                "updated_at REAL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS historical ("
+                "symbol TEXT PRIMARY KEY, low_day1 REAL, history TEXT, atr REAL, volume REAL, updated_at REAL)"
+            )
+            self._ensure_column("historical", "atr_14", "REAL")
+            self._ensure_column("historical", "atr_30", "REAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS levels ("
+                "coin TEXT PRIMARY KEY, long_level REAL, short_level REAL, updated_at REAL)"
+            )
+        self.logger.info(f"SQLite хранилище открыто: {path}")
+
+    def _ensure_column(self, table, column, column_type):
+        """Добавляет столбец в существующую таблицу, созданную более ранней версией схемы."""
+        columns = {row["name"] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def _upsert(self, table, fields, rows):
+        placeholders = ", ".join("?" for _ in fields)
+        updates = ", ".join(f"{field}=excluded.{field}" for field in fields[1:])
+        sql = (
+            f"INSERT INTO {table} ({', '.join(fields)}, updated_at) VALUES ({placeholders}, ?) "
+            f"ON CONFLICT({fields[0]}) DO UPDATE SET {updates}, updated_at=excluded.updated_at"
+        )
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(sql, [tuple(row) + (now,) for row in rows])
+
+    def _select(self, table, fields):
+        with self.lock:
+            cursor = self.conn.execute(f"SELECT {', '.join(fields)} FROM {table} ORDER BY rowid")
+            return [dict(row) for row in cursor.fetchall()]
+
+    def upsert_instruments(self, instruments):
+        rows = [[instrument.get(field) for field in INSTRUMENT_FIELDS] for instrument in instruments]
+        self._upsert("instruments", INSTRUMENT_FIELDS, rows)
+
+    def delete_instruments(self, symbols):
+        params = [(symbol,) for symbol in symbols]
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM instruments WHERE symbol = ?", params)
+            self.conn.executemany("DELETE FROM historical WHERE symbol = ?", params)
+
+    def get_instruments(self):
+        return {row["symbol"]: row for row in self._select("instruments", INSTRUMENT_FIELDS)}
+
+    def upsert_historical(self, rows):
+        values = [
+            [row["symbol"], _nullable(row.get("low_day1")), json.dumps(row.get("history") or []),
+             _nullable(row.get("atr")), _nullable(row.get("volume")), row.get("atr_14"), row.get("atr_30")]
+            for row in rows
+        ]
+        self._upsert("historical", HISTORICAL_FIELDS, values)
+
+    def get_historical(self):
+        result = {}
+        for row in self._select("historical", HISTORICAL_FIELDS):
+            row["history"] = json.loads(row["history"]) if row["history"] else []
+            result[row["symbol"]] = row
+        return result
+
+    def replace_levels(self, levels):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM levels")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO levels (coin, long_level, short_level, updated_at) VALUES (?, ?, ?, ?)",
+                [(level["coin"], level.get("long_level"), level.get("short_level"), now) for level in levels]
+            )
+
+    def get_levels(self):
+        return self._select("levels", LEVEL_FIELDS)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def _nullable(value):
+    return None if value == '' else value
+
+def create_storage(backend=None, path=None):
+    """Создает хранилище по настройкам STORAGE_BACKEND ("sqlite" или "memory") и STORAGE_PATH."""
+    backend = (backend or STORAGE_BACKEND).lower()
+    if backend == "memory":
+        return InMemoryStorage()
+    if backend == "sqlite":
+        return SQLiteStorage(path or STORAGE_PATH)
+    raise ValueError(f"Неизвестный тип хранилища: {backend}")
+
+class SheetsSync:
+    """Фоновая пакетная выгрузка в Google Sheets, общая для задач планировщика.
+
+    Задача ставит в очередь функцию обновления листа update(rows) -> new_rows и не ждет записи.
+    Фоновый поток читает лист один раз, применяет по порядку все накопившиеся для него обновления
+    и записывает только изменившиеся ячейки (write_diff). При ошибке обновления возвращаются в очередь
+    и выгрузка повторяется с растущей паузой; ошибка листа видна в errors и по результату flush().
+    Экземпляр живет все время работы планировщика.
+    """
+
+    def __init__(self, sheets_client):
+        self.logger = logging.getLogger(__name__)
+        self.sheets_client = sheets_client
+        self.pending = {}  # Лист -> (ширина в столбцах, [(update, on_written)])
+        self.errors = {}  # Лист -> ошибка последней неудачной выгрузки, пока она не повторена успешно
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="sheets-sync")
+        self.thread.start()
+
+    def push(self, sheet_name, update, width, on_written=None):
+        """Ставит обновление первых width столбцов листа sheet_name в очередь выгрузки.
+
+        on_written() вызывается фоновым потоком после успешной записи листа с этим обновлением.
+        """
+        with self.lock:
+            first = sheet_name not in self.pending
+            _, updates = self.pending.get(sheet_name, (width, []))
+            updates.append((update, on_written))
+            self.pending[sheet_name] = (width, updates)
+        if first:
+            self.queue.put(sheet_name)
+
+    def flush(self, timeout=None):
+        """Ждет отправки всех поставленных в очередь выгрузок.
+
+        Возвращает True, если все записано; False по таймауту или если выгрузка какого-то листа
+        не удалась (ее обновления остаются в очереди и повторяются в фоне).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if self.errors:
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return not self.errors
+
+    def _run(self):
+        while True:
+            sheet_name = self.queue.get()
+            try:
+                self._sync(sheet_name)
+            finally:
+                self.queue.task_done()
+
+    def _sync(self, sheet_name):
+        delay = SYNC_RETRY_MIN_DELAY
+        while True:
+            with self.lock:
+                width, updates = self.pending.pop(sheet_name, (None, None))
+            if updates is None:
+                return  # Обновления уже записаны при повторе по предыдущей записи очереди
+            try:
+                self._write(sheet_name, width, updates)
+            except Exception as e:
+                with self.lock:
+                    # Неудачные обновления возвращаются перед поставленными за время записи
+                    _, newer = self.pending.get(sheet_name, (width, []))
+                    self.pending[sheet_name] = (width, updates + newer)
+                    self.errors[sheet_name] = str(e)
+                self.logger.error(f"Ошибка выгрузки листа {sheet_name} в Google Sheets: {e}, повтор через {delay:g} с")
+                time.sleep(delay)
+                delay = min(delay * 2, SYNC_RETRY_MAX_DELAY)
+                continue
+            with self.lock:
+                self.errors.pop(sheet_name, None)
+            for _, on_written in updates:
+                if on_written is not None:
+                    try:
+                        on_written()
+                    except Exception as e:
+                        self.logger.error(f"Ошибка обработки выгрузки листа {sheet_name}: {e}")
+            return
+
+    def _write(self, sheet_name, width, updates):
+        sheet = self.sheets_client.get_sheet(sheet_name)
+        if not sheet:
+            raise RuntimeError(f"не удалось получить лист {sheet_name}")
+        # Неформатированные значения: числа сравниваются с новыми без учета формата ячеек
+        old_rows = [row[:width] for row in sheet.get_all_values(value_render_option="UNFORMATTED_VALUE")]
+        new_rows = old_rows
+        for update, _ in updates:
+            new_rows = update(new_rows)
+        written_cells = self.sheets_client.write_diff(sheet, old_rows, new_rows)
+        if written_cells is None:
+            raise RuntimeError("количество записанных ячеек не совпадает с подготовленными изменениями")
+        self.logger.info(f"Лист {sheet_name} выгружен: обновлений {len(updates)}, записано {written_cells} ячеек, строк {len(new_rows)}")
@@ -1,12 +1,42 @@
+import logging
 import requests
 from config import TELEGRAM_TOKEN, CHAT_ID
 
+class TelegramSender:
+    """Отправка сообщений в Telegram через общий пул HTTP-соединений."""
+
+    def __init__(self, token=TELEGRAM_TOKEN, chat_id=CHAT_ID):
+        self.logger = logging.getLogger(__name__)
+        self.token = token
+        self.chat_id = chat_id
+        self.http = requests.Session()
+
+    def send(self, text, reply_markup=None, parse_mode=None):
+        """Отправляет сообщение и возвращает его message_id (None при ошибке)."""
+        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
+        payload = {"chat_id": self.chat_id, "text": text}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
+        try:
+            response = self.http.post(url, json=payload)
+            response.raise_for_status()
+            print(f"Сообщение отправлено в Telegram: {text}")
+            return response.json().get("result", {}).get("message_id")
+        except Exception as e:
+            print(f"Ошибка отправки в Telegram: {e}")
+            self.logger.error(f"Ошибка отправки в Telegram: {e}")
+            return None
+
+_default_sender = None
+
+def get_default_sender():
+    """Возвращает общий для процесса TelegramSender с токеном и чатом из конфигурации."""
+    global _default_sender
+    if _default_sender is None:
+        _default_sender = TelegramSender()
+    return _default_sender
+
 def send_telegram_message(text):
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-    payload = {"chat_id": CHAT_ID, "text": text}
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        print(f"Сообщение отправлено в Telegram: {text}")
-    except Exception as e:
-        print(f"Ошибка отправки в Telegram: {e}")
\ No newline at end of file
+    get_default_sender().send(text)
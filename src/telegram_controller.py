@@ -1,7 +1,13 @@
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
+import asyncio
 import subprocess
 import os
+import requests
+from urllib.parse import urlsplit
+from metrics import REGISTRY
+import profiling
+from config import METRICS_URLS, PROFILE_MAX_SECONDS
 
 # Функции для управления сервисами
 async def start_service(update: Update, context: ContextTypes.DEFAULT_TYPE, service_name: str):
@@ -43,6 +49,105 @@ async def get_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     result = subprocess.run(["docker-compose", "logs", "--tail=50", service_name], capture_output=True, text=True)
     await update.message.reply_text(f"Логи {service_name}:\n{result.stdout}")
 
+def format_remote_metrics(url):
+    """Загружает /metrics сервиса и оставляет строки без HELP/TYPE и корзин гистограмм."""
+    try:
+        response = requests.get(url, timeout=5)
+        response.raise_for_status()
+    except Exception as e:
+        return f"{url}: ошибка {e}"
+    lines = [
+        line for line in response.text.splitlines()
+        if line and not line.startswith("#") and "_bucket{" not in line
+    ]
+    return f"{url}:\n" + "\n".join(lines)
+
+async def get_metrics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if str(update.message.chat_id) != os.getenv("CHAT_ID"):
+        await update.message.reply_text("У вас нет доступа к управлению ботом.")
+        return
+    # Сервисы в отдельных контейнерах опрашиваются по METRICS_URLS, в orchestrator.py — общий реестр процесса
+    if METRICS_URLS:
+        text = "\n\n".join(format_remote_metrics(url) for url in METRICS_URLS)
+    else:
+        text = REGISTRY.summary() or "Метрик пока нет"
+    await reply_long(update, text)
+
+async def reply_long(update: Update, text: str):
+    # Ограничение Telegram — 4096 символов на сообщение
+    for start in range(0, len(text), 4000):
+        await update.message.reply_text(text[start:start + 4000])
+
+def debug_url(service_name, command):
+    """Адрес /debug/<command> сервиса: хост и порт берутся из его адреса в METRICS_URLS."""
+    for url in METRICS_URLS:
+        parts = urlsplit(url)
+        if parts.hostname == service_name:
+            return f"{parts.scheme}://{parts.netloc}/debug/{command}"
+    return None
+
+def run_debug_command(service_name, command, seconds, top):
+    """Выполняет профилирование в сервисе по HTTP или, без METRICS_URLS, в текущем процессе."""
+    if not METRICS_URLS:
+        params = {"seconds": seconds, "top": top}
+        return profiling.handle_request(f"/debug/{command}", params)[1]
+    url = debug_url(service_name, command)
+    if url is None:
+        services = ", ".join(urlsplit(url).hostname for url in METRICS_URLS)
+        return f"Сервис {service_name} не найден в METRICS_URLS ({services})"
+    try:
+        response = requests.get(url, params={"seconds": seconds, "top": top}, timeout=min(seconds, PROFILE_MAX_SECONDS) + 30)
+    except Exception as e:
+        return f"{url}: ошибка {e}"
+    return f"{service_name}: {response.text}"
+
+def parse_debug_args(args):
+    """Аргументы /profile, /heap и /threads: [сервис] [секунды] [top] -> (сервис, секунды, top).
+
+    Первый аргумент — имя сервиса, если это не число. ValueError при некорректных значениях.
+    """
+    args = list(args or [])
+    service_name = "trading_engine"
+    if args:
+        try:
+            float(args[0])
+        except ValueError:
+            service_name = args.pop(0)
+    if len(args) > 2:
+        raise ValueError("лишние аргументы")
+    try:
+        seconds = float(args[0]) if args else 30.0
+        top = int(args[1]) if len(args) > 1 else 15
+    except ValueError:
+        raise ValueError("секунды — число, top — целое число")
+    if not 0 < seconds < float("inf") or top <= 0:
+        raise ValueError("секунды и top должны быть положительными")
+    return service_name, seconds, top
+
+async def debug_command(update: Update, context: ContextTypes.DEFAULT_TYPE, command: str):
+    if str(update.message.chat_id) != os.getenv("CHAT_ID"):
+        await update.message.reply_text("У вас нет доступа к управлению ботом.")
+        return
+    try:
+        service_name, seconds, top = parse_debug_args(context.args)
+    except ValueError as e:
+        await update.message.reply_text(f"Некорректные аргументы ({e}). Использование: /{command} [сервис] [секунды] [top]")
+        return
+    if command != "threads":
+        await update.message.reply_text(f"Профилирование {command} в {service_name} на {seconds:g} с...")
+    # Профилирование блокирует на время окна, поэтому выполняется вне цикла событий бота
+    text = await asyncio.to_thread(run_debug_command, service_name, command, seconds, top)
+    await reply_long(update, text)
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await debug_command(update, context, "profile")
+
+async def heap(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await debug_command(update, context, "heap")
+
+async def threads(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await debug_command(update, context, "threads")
+
 # Команды для каждого модуля
 async def start_historical(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await start_service(update, context, "populate_historical_data")
@@ -68,8 +173,19 @@ async def start_trading_engine(update: Update, context: ContextTypes.DEFAULT_TYP
 async def stop_trading_engine(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await stop_service(update, context, "trading_engine")
 
-def main():
-    app = Application.builder().token(os.getenv("TELEGRAM_TOKEN")).build()
+def register_handlers(app, read_only=False):
+    """Регистрирует команды управления в приложении Telegram (своем или общем, см. orchestrator.py).
+
+    read_only=True — только команды чтения (метрики, логи, профилирование): в общем процессе
+    orchestrator.py команды docker-compose запустили бы из контейнера дубликаты сервисов.
+    """
+    app.add_handler(CommandHandler("logs", get_logs))
+    app.add_handler(CommandHandler("metrics", get_metrics))
+    app.add_handler(CommandHandler("profile", profile))
+    app.add_handler(CommandHandler("heap", heap))
+    app.add_handler(CommandHandler("threads", threads))
+    if read_only:
+        return
     app.add_handler(CommandHandler("start_historical", start_historical))
     app.add_handler(CommandHandler("stop_historical", stop_historical))
     app.add_handler(CommandHandler("start_static", start_static))
@@ -80,7 +196,10 @@ def main():
     app.add_handler(CommandHandler("stop_trading_engine", stop_trading_engine))
     app.add_handler(CommandHandler("status", status))
     app.add_handler(CommandHandler("update", update_code))
-    app.add_handler(CommandHandler("logs", get_logs))
+
+def main(read_only=False):
+    app = Application.builder().token(os.getenv("TELEGRAM_TOKEN")).build()
+    register_handlers(app, read_only)
     app.run_polling()
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+import logging
+import math
+
+# Цены как целое число тиков символа (tickSize из каталога инструментов Bybit).
+# Сравнения цен с уровнями в тиках точные, а цена ордера из тиков всегда лежит на сетке биржи.
+
+NEAREST, FLOOR, CEIL = "nearest", "floor", "ceil"
+# Сетка для символов, которых нет в каталоге: мельче любого tickSize Bybit
+DEFAULT_TICK_SIZE = "0.00000001"
+
+def _decimal_text(value):
+    """Десятичная запись числа без экспоненты: repr float — кратчайшая точная запись."""
+    text = value.strip() if isinstance(value, str) else repr(float(value))
+    if "e" in text or "E" in text:
+        text = f"{float(text):.12f}"
+    return text
+
+class TickGrid:
+    """Сетка цен одного символа: перевод строки/числа в тики и обратно без ошибок float."""
+
+    __slots__ = ("tick_size", "decimals", "units", "scale", "ratio")
+
+    def __init__(self, tick_size):
+        text = _decimal_text(tick_size)
+        whole, _, fraction = text.partition(".")
+        fraction = fraction.rstrip("0")
+        self.tick_size = text
+        self.decimals = len(fraction)
+        self.units = int(whole + fraction)  # Тик в единицах 10^-decimals
+        if self.units <= 0:
+            raise ValueError(f"Некорректный размер тика: {tick_size}")
+        self.scale = 10 ** self.decimals
+        self.ratio = self.scale / self.units  # Тиков в единице цены
+
+    def parse(self, text, rounding=NEAREST):
+        """Строка цены биржи или листа -> тики (точно, целочисленной арифметикой)."""
+        text = text.strip()
+        negative = text.startswith("-")
+        whole, _, fraction = text.lstrip("+-").partition(".")
+        numerator = int((whole or "0") + fraction) * self.scale
+        denominator = 10 ** len(fraction) * self.units
+        if negative:
+            numerator = -numerator
+        if rounding == FLOOR:
+            return numerator // denominator
+        if rounding == CEIL:
+            return -(-numerator // denominator)
+        return (2 * numerator + denominator) // (2 * denominator)
+
+    def to_ticks(self, value, rounding=NEAREST):
+        """Цена (строка или число) -> тики.
+
+        Число, полученное float() из строки биржи, переводится умножением: ошибка float на порядки
+        меньше половины тика. Половина тика округляется вверх, как и для строк. Для округления
+        вниз/вверх и для значений у самой половины тика число разбирается по десятичной записи.
+        """
+        if isinstance(value, str) or rounding != NEAREST:
+            return self.parse(_decimal_text(value), rounding)
+        scaled = value * self.ratio
+        # У половины тика ошибка float решает направление округления: разбираем точно, как строку
+        if abs(scaled - math.floor(scaled) - 0.5) < 1e-6:
+            return self.parse(_decimal_text(value), rounding)
+        return math.floor(scaled + 0.5)
+
+    def price(self, ticks):
+        """Тики -> float (ближайшее к десятичной цене число)."""
+        return ticks * self.units / self.scale
+
+    def format(self, ticks):
+        """Тики -> строка цены для API: ровно decimals знаков после точки."""
+        value = ticks * self.units
+        sign = "-" if value < 0 else ""
+        whole, fraction = divmod(abs(value), self.scale)
+        return f"{sign}{whole}.{fraction:0{self.decimals}d}" if self.decimals else f"{sign}{whole}"
+
+    def align(self, value, rounding=NEAREST):
+        """Цена, выровненная на сетку, как float."""
+        return self.price(self.to_ticks(value, rounding))
+
+class TickTable:
+    """Сетки цен по символам; для неизвестных символов — мелкая сетка DEFAULT_TICK_SIZE."""
+
+    def __init__(self, tick_sizes=None):
+        self.grids = {}
+        self.default = TickGrid(DEFAULT_TICK_SIZE)
+        for symbol, tick_size in (tick_sizes or {}).items():
+            try:
+                self.grids[symbol] = TickGrid(tick_size)
+            except ValueError as e:
+                logging.warning(f"{symbol}: {e}")
+
+    def __len__(self):
+        return len(self.grids)
+
+    def __contains__(self, symbol):
+        return symbol in self.grids
+
+    def grid(self, symbol):
+        return self.grids.get(symbol, self.default)
+
+    @classmethod
+    def from_instruments_info(cls, instruments):
+        """Из ответа instruments-info (tickSize — строка, без потери точности)."""
+        return cls({
+            info["symbol"]: info["priceFilter"]["tickSize"]
+            for info in instruments or []
+            if info.get("priceFilter", {}).get("tickSize")
+        })
+
+    @classmethod
+    def load(cls, bybit_api):
+        """Каталог сеток с биржи; при ошибке — пустая таблица (все символы на DEFAULT_TICK_SIZE)."""
+        try:
+            table = cls.from_instruments_info(bybit_api.get_futures_instruments_info())
+        except Exception as e:
+            logging.error(f"Не удалось загрузить размеры тиков: {e}")
+            table = cls()
+        if not len(table):
+            logging.warning(f"Размеры тиков недоступны, используется сетка {DEFAULT_TICK_SIZE}")
+        return table
@@ -3,12 +3,21 @@ import os
 import time
 import threading
 import asyncio
-import requests
 from telegram.ext import Application, MessageHandler, CallbackQueryHandler, filters
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from bybit_api import BybitAPI
 from google_sheets import GoogleSheetsClient
+from telegram_bot import TelegramSender
+from sheet_watcher import SheetChangeDetector
+from order_validator import OrderValidator
+from accounts import AccountPool, load_profiles
+import price_bus
+from log_setup import setup_logger
+from metrics import REGISTRY, start_from_config
 from config import GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID  # Добавляем импорт
+from config import TRADE_POLL_MIN_SECONDS, TRADE_POLL_MAX_SECONDS, TRADE_FULL_REFRESH_SECONDS
+from config import PRICE_BUS_NAME, PRICE_BUS_MAX_AGE_SECONDS, ENTRY_PRICE_MAX_DEVIATION
+from config import ORDER_BOOK_WAIT_SECONDS, ORDER_MAX_SLIPPAGE
 
 # Настройка логирования
 project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
@@ -16,28 +25,46 @@ log_dir = os.path.join(project_dir, "Logs")
 os.makedirs(log_dir, exist_ok=True)
 log_file = os.path.join(log_dir, "trade_manager.log")
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file, mode='a', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+# Корневой логгер пишет в консоль и файл из фонового потока; уровень задает LOG_LEVEL (по умолчанию INFO)
+setup_logger(None, log_file)
+
+CONFIRMATION_TO_ACK_SECONDS = REGISTRY.histogram(
+    "trade_manager_confirmation_to_order_ack_seconds", "От подтверждения сделки до ответа Bybit на ордер, с"
 )
+TRADES = REGISTRY.counter("trade_manager_trades_total", "Сделок по результату", ("result",))
 
 class TradeManager:
-    def __init__(self, api_key, api_secret, telegram_token, chat_id):
+    def __init__(self, api_key, api_secret, telegram_token, chat_id, bybit=None, sheets=None, telegram=None, price_reader=None,
+                 accounts=None, price_store=None):
         self.logger = logging.getLogger(__name__)
         self.logger.info("Инициализация TradeManager")
         print("Инициализация TradeManager")
 
-        self.bybit = BybitAPI(api_key, api_secret)
-        self.sheets = GoogleSheetsClient(GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID)  # Обновляем вызов
+        # Клиенты можно передать извне (общие для всех сервисов в orchestrator.py)
+        self.bybit = bybit or BybitAPI(api_key, api_secret)
+        self.sheets = sheets or GoogleSheetsClient(GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID)
+        self.telegram = telegram or TelegramSender(telegram_token, chat_id)
         self.telegram_token = telegram_token
         self.chat_id = chat_id
         self.pending_confirmation = {}
-        self.max_trades = 5
+        # Аккаунты, на которых исполняется каждая подтвержденная сделка (по умолчанию из BYBIT_ACCOUNTS)
+        self.accounts = AccountPool(accounts or load_profiles(primary_bybit=self.bybit))
+        self.logger.info(f"Аккаунты исполнения: {self.accounts.profiles}")
         self.running = True
+        self.change_detector = SheetChangeDetector(
+            self.sheets.get_trade_fingerprint,
+            min_interval=TRADE_POLL_MIN_SECONDS,
+            max_interval=TRADE_POLL_MAX_SECONDS,
+            full_refresh_interval=TRADE_FULL_REFRESH_SECONDS
+        )
+        # Текущие цены из шины trading_engine (подключение откладывается, пока писатель не запущен)
+        self.price_reader = price_reader
+        # PriceStore PriceMonitor в том же процессе (orchestrator.py): цены читаются напрямую, без шины
+        self.price_store = price_store
+        # Локальная проверка ордеров по каталогу инструментов до отправки на биржу
+        self.order_validator = OrderValidator(self.bybit, storage=self.sheets.storage)
+        # Быстрый путь TradingEngine в том же процессе (orchestrator.py): кнопки "fast:..." передаются ему
+        self.fast_path = None
 
         try:
             self.app = Application.builder().token(telegram_token).build()
@@ -64,18 +91,18 @@ class TradeManager:
             await update.message.reply_text("Пожалуйста, ответьте 'да' или 'нет'.")
             return
 
-        key = (chat_id, message_id)
-        if key in self.pending_confirmation:
-            trade_data = self.pending_confirmation[key]
+        # Запрос снимается до исполнения: повторный ответ на то же сообщение не отправит ордер второй раз
+        trade_data = self.pending_confirmation.pop((chat_id, message_id), None)
+        if trade_data is not None:
+            # Исполнение ждет стакан и ответы биржи по всем аккаунтам, поэтому идет вне цикла событий бота
             if message == "да":
                 self.logger.info(f"Сделка подтверждена пользователем: {trade_data['trade']['coin']}")
-                self.execute_trade(trade_data)
+                await asyncio.to_thread(self.execute_trade, trade_data)
                 await update.message.reply_text("Сделка подтверждена и выполнена.")
             else:
                 self.logger.info(f"Сделка отменена пользователем: {trade_data['trade']['coin']}")
-                self.cancel_trade(trade_data, "отменено: пользователь отказался")
+                await asyncio.to_thread(self.cancel_trade, trade_data, "отменено: пользователь отказался")
                 await update.message.reply_text("Сделка отменена.")
-            del self.pending_confirmation[key]
         else:
             self.logger.warning("Нет ожидающих сделок для подтверждения")
             await update.message.reply_text("Нет ожидающих сделок для подтверждения.")
@@ -88,30 +115,29 @@ class TradeManager:
         message_id = query.message.message_id
         action = query.data
 
-        key = (chat_id, message_id)
-        if key in self.pending_confirmation:
-            trade_data = self.pending_confirmation[key]
+        if action.startswith("fast:"):
+            if self.fast_path is None:
+                await query.message.reply_text("Быстрый путь входа не запущен в этом процессе.")
+                return
+            await query.message.reply_text(await asyncio.to_thread(self.fast_path.handle_callback, action))
+            return
+
+        trade_data = self.pending_confirmation.pop((chat_id, message_id), None) if action in ("yes", "no") else None
+        if trade_data is not None:
             if action == "yes":
                 self.logger.info(f"Сделка подтверждена пользователем (кнопка): {trade_data['trade']['coin']}")
-                self.execute_trade(trade_data)
+                await asyncio.to_thread(self.execute_trade, trade_data)
                 await query.message.reply_text("Сделка подтверждена и выполнена.")
-            elif action == "no":
+            else:
                 self.logger.info(f"Сделка отменена пользователем (кнопка): {trade_data['trade']['coin']}")
-                self.cancel_trade(trade_data, "отменено: пользователь отказался")
+                await asyncio.to_thread(self.cancel_trade, trade_data, "отменено: пользователь отказался")
                 await query.message.reply_text("Сделка отменена.")
-            del self.pending_confirmation[key]
         else:
             self.logger.warning("Нет ожидающих сделок для подтверждения")
             await query.message.reply_text("Нет ожидающих сделок для подтверждения.")
 
     def send_telegram_message(self, text, with_buttons=False):
-        url = f"https://api.telegram.org/bot{self.telegram_token}/sendMessage"
-        payload = {
-            "chat_id": self.chat_id,
-            "text": text,
-            "parse_mode": "HTML"
-        }
-
+        reply_markup = None
         if with_buttons:
             keyboard = [
                 [
@@ -119,28 +145,95 @@ class TradeManager:
                     InlineKeyboardButton("Нет", callback_data="no")
                 ]
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            payload["reply_markup"] = reply_markup.to_dict()
+            reply_markup = InlineKeyboardMarkup(keyboard).to_dict()
             self.logger.debug(f"Кнопки добавлены: {keyboard}")
 
-        self.logger.debug(f"Отправка сообщения в Telegram: URL={url}, Payload={payload}")
-        try:
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
+        message_id = self.telegram.send(text, reply_markup=reply_markup, parse_mode="HTML")
+        if message_id:
             self.logger.info(f"Сообщение отправлено в Telegram: {text}")
-            message_id = response.json().get("result", {}).get("message_id")
-            return message_id
-        except Exception as e:
-            self.logger.error(f"Ошибка при отправке сообщения в Telegram: {e}")
+        return message_id
+
+    def get_market_price(self, symbol):
+        """Возвращает (price, age_seconds) из PriceStore процесса или шины цен; None, если свежей цены нет."""
+        if self.price_store is not None:
+            value = self.price_store.get(symbol)
+            if value is None:
+                return None
+            price, exchange_ts = value
+            age = time.time() - exchange_ts
+            if age > PRICE_BUS_MAX_AGE_SECONDS:
+                self.logger.warning(f"Цена {symbol} устарела: {age:.0f} с")
+                return None
+            return price, age
+        if self.price_reader is None:
+            self.price_reader = price_bus.open_reader(PRICE_BUS_NAME)
+            if self.price_reader is None:
+                return None
+        value = self.price_reader.read(symbol)
+        if value is None:
+            return None
+        price, exchange_ts = value
+        age = time.time() - exchange_ts
+        if age > PRICE_BUS_MAX_AGE_SECONDS:
+            # После перезапуска писателя сегмент создается заново: переподключаемся при следующем запросе
+            self.logger.warning(f"Цена {symbol} в шине устарела: {age:.0f} с")
+            self.price_reader.close()
+            self.price_reader = None
             return None
+        return price, age
+
+    def validate_order(self, trade):
+        """Проверяет и выравнивает поля ордера локально (order_validator.OrderValidator)."""
+        market = self.get_market_price(trade["coin"])
+        return self.order_validator.validate(trade, market[0] if market else None)
+
+    def estimate_entry(self, trade):
+        """Оценка входа по локальному стакану: (строка для запроса подтверждения, причина отказа или None).
+
+        Объем — суммарный по всем аккаунтам: все ордера забирают один и тот же стакан.
+        """
+        book = self.bybit.order_books.get(trade["coin"], wait=ORDER_BOOK_WAIT_SECONDS)
+        qty = trade["qty"] * sum(profile.size_multiplier for profile in self.accounts.profiles)
+        estimate = book.estimate_fill(trade["side"], qty, trade["entry_price"]) if book else None
+        if estimate is None:
+            return "Стакан: нет данных\n", None
+        bid, ask, spread = book.spread()
+        line = f"Стакан: бид {bid}, аск {ask}, спред {spread} тиков\n"
+        if not estimate.filled_qty:
+            return line + "Немедленного исполнения нет: ордер встанет в стакан\n", None
+        line += (f"Ожидаемое исполнение {estimate.filled_qty:g} из {qty:g} по {estimate.avg_price:.10g} "
+                 f"(проскальзывание от середины спреда {estimate.slippage:+.2%})\n")
+        if ORDER_MAX_SLIPPAGE and estimate.slippage > ORDER_MAX_SLIPPAGE:
+            self.logger.warning(f"Проскальзывание входа {trade['coin']} {estimate.slippage:.2%} больше {ORDER_MAX_SLIPPAGE:.2%}")
+            return line, f"проскальзывание {estimate.slippage:.2%} больше {ORDER_MAX_SLIPPAGE:.2%}"
+        return line, None
+
+    def describe_entry_price(self, trade):
+        """Строка для запроса подтверждения: рыночная цена и отклонение от нее цены входа."""
+        market = self.get_market_price(trade["coin"])
+        if market is None:
+            return "Рыночная цена: нет данных\n"
+        price, age = market
+        deviation = (trade["entry_price"] - price) / price if price else 0.0
+        line = f"Рыночная цена: {price} (цена входа отличается на {deviation:+.2%}, данные {age:.0f} с назад)\n"
+        if abs(deviation) > ENTRY_PRICE_MAX_DEVIATION:
+            self.logger.warning(f"Цена входа {trade['coin']} {trade['entry_price']} отличается от рыночной {price} на {deviation:+.2%}")
+            line += f"⚠️ Отклонение больше {ENTRY_PRICE_MAX_DEVIATION:.0%}, проверьте цену входа\n"
+        return line
 
     def process_pending_trades(self, trades):
-        open_positions = self.bybit.get_open_positions()
+        # Локальные стаканы символов сделок: к запросу подтверждения уже приходит первый снимок
+        try:
+            self.bybit.order_books.track([trade["coin"] for trade in trades])
+        except Exception as e:
+            self.logger.error(f"Не удалось подписаться на стаканы: {e}")
+
+        open_positions = self.accounts.open_positions()
         self.logger.info(f"Открытых позиций: {open_positions}")
         print(f"Открытых позиций: {open_positions}")
 
-        if open_positions >= self.max_trades:
-            self.logger.warning(f"Достигнут лимит открытых сделок ({self.max_trades})")
+        if all(open_positions[profile.name] >= profile.max_trades for profile in self.accounts.profiles):
+            self.logger.warning("Достигнут лимит открытых сделок на всех аккаунтах")
             for trade in trades:
                 self.cancel_trade(
                     {
@@ -169,12 +262,26 @@ class TradeManager:
             trade_key = (trade["sheet"], trade["row"])
             already_pending = any(
                 data["trade"]["sheet"] == trade["sheet"] and data["trade"]["row"] == trade["row"]
-                for data in self.pending_confirmation.values()
+                for data in list(self.pending_confirmation.values())
             )
             if already_pending:
                 self.logger.debug(f"Сделка {trade['coin']} уже ожидает подтверждения, пропускаем")
                 continue
 
+            # Ордер, который биржа отклонит, отменяется сразу, без запроса подтверждения
+            validation = self.validate_order(trade)
+            if validation.retry:
+                # Каталог недоступен: строка не меняется и проверяется снова при следующем чтении листа
+                self.logger.warning(f"Сделка {trade['coin']} отложена: {validation.error}")
+                continue
+            if validation.error:
+                self.cancel_trade({"trade": trade, "sheet": sheet, "sheet_name": sheet_name}, f"отменено: {validation.error}")
+                continue
+            book_line, slippage_error = self.estimate_entry(trade)
+            if slippage_error:
+                self.cancel_trade({"trade": trade, "sheet": sheet, "sheet_name": sheet_name}, f"отменено: {slippage_error}")
+                continue
+
             row_idx = trade["row"]
             self.sheets.update_trade_status(sheet_name, row_idx, "вход, ожидание")
 
@@ -185,7 +292,11 @@ class TradeManager:
                 f"Количество: {trade['qty']}\n"
                 f"Тейк-профит: {trade['take_profit'] if trade['take_profit'] else 'не установлен'}\n"
                 f"Стоп-лосс: {trade['stop_loss']}\n"
+                f"{self.describe_entry_price(trade)}"
+                f"{book_line}"
             )
+            if validation.repairs:
+                message += "Исправлено перед отправкой: " + "; ".join(validation.repairs) + "\n"
             self.logger.info(f"Отправка запроса на подтверждение: {trade['coin']}")
             message_id = self.send_telegram_message(message, with_buttons=True)
             if message_id:
@@ -199,41 +310,72 @@ class TradeManager:
                 self.logger.error(f"Не удалось получить message_id для сделки {trade['coin']}")
 
     def execute_trade(self, trade_data):
+        confirmed_at = time.monotonic()
         trade = trade_data["trade"]
         sheet = trade_data["sheet"]
         sheet_name = trade_data["sheet_name"]
 
-        open_positions = self.bybit.get_open_positions()
-        if open_positions >= self.max_trades:
-            self.logger.warning(f"Достигнут лимит открытых сделок ({self.max_trades}) при выполнении")
-            self.cancel_trade(trade_data, "отменено: лимит сделок")
+        # Все аккаунты параллельно: лимит сделок, объем с множителем, повторная проверка ордера
+        # по свежей рыночной цене (между запросом и подтверждением цена могла уйти) и размещение
+        _, slippage_error = self.estimate_entry(trade)
+        if slippage_error:
+            self.cancel_trade(trade_data, f"отменено: {slippage_error}")
             return
+        if self.validate_order(trade).retry:
+            # Ордер нельзя проверить, но и отклонять его не за что: статус очищается, и сделка
+            # снова попадет в запрос подтверждения при следующем чтении листа (флаг TRUE остается)
+            self.logger.warning(f"Вход в сделку {trade['coin']} отложен: каталог инструментов недоступен")
+            self.sheets.update_trade_status(sheet_name, trade["row"], "")
+            self.send_telegram_message(f"Сделка для {trade['coin']} отложена: каталог инструментов недоступен, запрос подтверждения будет повторен.")
+            return
+        market = self.get_market_price(trade["coin"])
+        results = self.accounts.place(trade, self.order_validator, market[0] if market else None)
+        CONFIRMATION_TO_ACK_SECONDS.observe(time.monotonic() - confirmed_at)
+
+        executed = [result for result in results if result.order_id]
+        if not executed and all(result.rejected for result in results):
+            # Ни один ордер не отправлялся: сделка отменяется с причиной, как и раньше
+            reasons = {result.error for result in results}
+            reason = reasons.pop() if len(reasons) == 1 else "; ".join(f"{result.account}: {result.error}" for result in results)
+            self.cancel_trade(trade_data, f"отменено: {reason}")
+            return
+        TRADES.inc("executed" if executed else "failed")
 
-        order_id = self.bybit.place_limit_order(
-            symbol=trade["coin"],
-            side=trade["side"],
-            qty=trade["qty"],
-            price=trade["entry_price"],
-            take_profit=trade["take_profit"],
-            stop_loss=trade["stop_loss"]
-        )
-
+        if len(executed) == len(results):
+            status = "вход выполнен"
+        elif executed:
+            status = f"вход выполнен: {len(executed)} из {len(results)}"
+        else:
+            status = "ошибка входа"
         row_idx = trade["row"]
-        if order_id:
-            self.sheets.update_trade_status(sheet_name, row_idx, "вход выполнен")
-            self.sheets.update_cell(sheet, row_idx, 6, "FALSE")  # Сбрасываем флаг TRUE
-            self.send_telegram_message(f"Сделка для {trade['coin']} ({sheet_name}) выполнена. Order ID: {order_id}")
-            self.send_telegram_message("Стоп-лосс установлен")
+        self.sheets.update_trade_status(sheet_name, row_idx, status)
+        self.sheets.update_cell(sheet, row_idx, 6, "FALSE")  # Сбрасываем флаг TRUE
+        self.send_telegram_message(self.describe_results(trade, sheet_name, results))
+
+    def describe_results(self, trade, sheet_name, results):
+        """Итог исполнения сделки по всем аккаунтам одним сообщением."""
+        executed = sum(1 for result in results if result.order_id)
+        if len(results) == 1:
+            header = (f"Сделка для {trade['coin']} ({sheet_name}) выполнена." if executed
+                      else f"Ошибка входа в сделку для {trade['coin']} ({sheet_name}).")
         else:
-            self.sheets.update_cell(sheet, row_idx, 6, "FALSE")  # Сбрасываем флаг TRUE
-            self.sheets.update_trade_status(sheet_name, row_idx, "ошибка входа")
-            self.send_telegram_message(f"Ошибка входа в сделку для {trade['coin']} ({sheet_name}).")
+            header = f"Сделка для {trade['coin']} ({sheet_name}): выполнена на {executed} из {len(results)} аккаунтов."
+        lines = [header]
+        for result in results:
+            if result.order_id:
+                lines.append(f"{result.account}: Order ID: {result.order_id}, количество {result.qty}")
+            else:
+                lines.append(f"{result.account}: не выполнена — {result.error}")
+        if executed:
+            lines.append("Стоп-лосс установлен")
+        return "\n".join(lines)
 
     def cancel_trade(self, trade_data, reason):
         trade = trade_data["trade"]
         sheet = trade_data["sheet"]
         sheet_name = trade_data["sheet_name"]
         row_idx = trade["row"]
+        TRADES.inc("cancelled")
         self.sheets.cancel_trade(sheet_name, row_idx)
         self.sheets.update_trade_status(sheet_name, row_idx, reason)
         self.sheets.update_cell(sheet, row_idx, 6, "FALSE")  # Сбрасываем флаг TRUE
@@ -243,18 +385,26 @@ class TradeManager:
         try:
             while self.running:
                 try:
-                    trades = self.sheets.get_pending_trades()
-                    if trades:
-                        self.logger.info(f"Найдено {len(trades)} ожидающих сделок")
-                        print(f"Найдено {len(trades)} ожидающих сделок")
-                        self.process_pending_trades(trades)
-                    else:
-                        self.logger.debug("Ожидающие сделки не найдены")
-                        print("Ожидающие сделки не найдены")
+                    # Полное чтение столбцов сделок только при изменении отпечатка столбца F
+                    if self.change_detector.should_read():
+                        trades = self.sheets.get_pending_trades()
+                        if trades is None:
+                            # Отпечаток не запоминается: чтение повторится на следующем опросе
+                            self.logger.error("Не удалось прочитать листы сделок")
+                        elif trades:
+                            self.change_detector.mark_read()
+                            self.logger.info(f"Найдено {len(trades)} ожидающих сделок")
+                            print(f"Найдено {len(trades)} ожидающих сделок")
+                            self.change_detector.mark_active()
+                            self.process_pending_trades(trades)
+                        else:
+                            self.change_detector.mark_read()
+                            self.logger.debug("Ожидающие сделки не найдены")
+                            print("Ожидающие сделки не найдены")
                 except Exception as e:
                     self.logger.error(f"Ошибка при получении ожидающих сделок: {e}")
                     print(f"Ошибка при получении ожидающих сделок: {e}")
-                time.sleep(60)
+                time.sleep(self.change_detector.interval)
         except KeyboardInterrupt:
             self.logger.info("Остановлено пользователем")
             print("Остановлено пользователем")
@@ -282,6 +432,7 @@ class TradeManager:
 if __name__ == "__main__":
     from config import BYBIT_API_KEY, BYBIT_API_SECRET, TELEGRAM_TOKEN, CHAT_ID
 
+    start_from_config()
     trade_manager = TradeManager(
         api_key=BYBIT_API_KEY,
         api_secret=BYBIT_API_SECRET,
@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from metrics import REGISTRY
+from config import (TRADE_STREAM_SYMBOLS_PER_CONNECTION, TRADE_STREAM_MAX_CONNECTIONS,
+                    TRADE_STREAM_RESELECT_SECONDS)
+
+WATCHED_SYMBOLS = REGISTRY.gauge("trade_stream_symbols", "Символов с подпиской на publicTrade")
+TRADE_MESSAGES = REGISTRY.counter("trade_stream_messages_total", "Сообщений publicTrade")
+RESUBSCRIBES = REGISTRY.counter("trade_stream_connection_rebuilds_total", "Пересозданий соединений publicTrade при смене набора символов")
+
+class TradeConnection:
+    def __init__(self, ws):
+        self.ws = ws
+        self.symbols = []
+
+class TradeWatcher:
+    """Поток сделок publicTrade для символов рядом с уровнями: min/max цен сделок между проверками.
+
+    Тикер отдает lastPrice выборочно, и прокол уровня между двумя сообщениями тикера не виден.
+    Подписка ограничена бюджетом: не больше TRADE_STREAM_SYMBOLS_PER_CONNECTION символов на соединение
+    и TRADE_STREAM_MAX_CONNECTIONS соединений. pybit не умеет отписываться, поэтому соединение,
+    из которого ушел символ, пересоздается; новые символы дописываются в соединения со свободными местами.
+    """
+
+    def __init__(self, bybit_api, per_connection=TRADE_STREAM_SYMBOLS_PER_CONNECTION,
+                 max_connections=TRADE_STREAM_MAX_CONNECTIONS, reselect_seconds=TRADE_STREAM_RESELECT_SECONDS):
+        self.logger = logging.getLogger(__name__)
+        self.bybit_api = bybit_api
+        self.per_connection = max(per_connection, 1)
+        self.max_connections = max(max_connections, 1)
+        self.reselect_seconds = reselect_seconds
+        self.connections = []
+        self.extremes = {}  # symbol -> [low, high, ts последней сделки]
+        self.lock = threading.Lock()
+        self.last_selection = 0.0
+
+    @property
+    def budget(self):
+        return self.per_connection * self.max_connections
+
+    @property
+    def symbols(self):
+        return [symbol for connection in self.connections for symbol in connection.symbols]
+
+    def on_trades(self, symbol, low, high, trade_ts):
+        """Колбэк BybitAPI.subscribe_to_trades: расширяет min/max символа с прошлой проверки."""
+        TRADE_MESSAGES.inc()
+        with self.lock:
+            extremes = self.extremes.get(symbol)
+            if extremes is None:
+                self.extremes[symbol] = [low, high, trade_ts]
+            else:
+                if low < extremes[0]:
+                    extremes[0] = low
+                if high > extremes[1]:
+                    extremes[1] = high
+                extremes[2] = trade_ts
+
+    def take(self):
+        """Забирает накопленные min/max: {symbol: (low, high, ts)}; следующее окно начинается заново."""
+        with self.lock:
+            extremes, self.extremes = self.extremes, {}
+        return {symbol: tuple(values) for symbol, values in extremes.items()}
+
+    def update_selection(self, candidates, now=None):
+        """Подписывает первые по близости к уровню символы в пределах бюджета (не чаще reselect_seconds)."""
+        now = now or time.time()
+        selected = candidates[:self.budget]
+        if set(selected) == set(self.symbols) or (self.connections and now - self.last_selection < self.reselect_seconds):
+            return
+        self.last_selection = now
+        wanted = set(selected)
+
+        # Соединения, из которых ушли символы, пересоздаются с оставшимися
+        pending = [symbol for symbol in selected if symbol not in set(self.symbols)]
+        for connection in list(self.connections):
+            if set(connection.symbols) - wanted:
+                pending = [symbol for symbol in connection.symbols if symbol in wanted] + pending
+                self._close(connection)
+                RESUBSCRIBES.inc()
+
+        # Новые символы — в соединения со свободными местами, затем в новые соединения
+        for connection in self.connections:
+            free = self.per_connection - len(connection.symbols)
+            if free > 0 and pending:
+                self._subscribe(connection, pending[:free])
+                pending = pending[free:]
+        while pending and len(self.connections) < self.max_connections:
+            try:
+                connection = TradeConnection(self.bybit_api.create_websocket())
+            except Exception as e:
+                self.logger.error(f"Не удалось открыть соединение publicTrade: {e}")
+                break
+            self.connections.append(connection)
+            self._subscribe(connection, pending[:self.per_connection])
+            pending = pending[self.per_connection:]
+
+        with self.lock:
+            for symbol in set(self.extremes) - wanted:
+                del self.extremes[symbol]
+        WATCHED_SYMBOLS.set(value=len(self.symbols))
+        self.logger.info(f"publicTrade: {len(self.symbols)} символов в {len(self.connections)} соединениях")
+
+    def _subscribe(self, connection, symbols):
+        try:
+            self.bybit_api.subscribe_to_trades(symbols, self.on_trades, ws=connection.ws)
+            connection.symbols.extend(symbols)
+        except Exception as e:
+            self.logger.error(f"Ошибка подписки publicTrade на {symbols}: {e}")
+
+    def _close(self, connection):
+        self.connections.remove(connection)
+        try:
+            connection.ws.exit()
+        except Exception as e:
+            self.logger.debug(f"Ошибка закрытия соединения publicTrade: {e}")
+
+    def stop(self):
+        for connection in list(self.connections):
+            self._close(connection)
+        WATCHED_SYMBOLS.set(value=0)
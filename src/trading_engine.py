@@ -3,9 +3,13 @@ import time
 import os
 from datetime import datetime
 from price_monitor import PriceMonitor
-from telegram_bot import send_telegram_message
+from bybit_api import BybitAPI
+from telegram_bot import send_telegram_message, get_default_sender
+from fast_path import build_fast_path
 import threading
-from config import ALERT_TIMEOUT_MINUTES
+from log_setup import setup_logger
+from metrics import REGISTRY, start_from_config
+from config import ALERT_TIMEOUT_MINUTES, FAST_PATH_MODE, BYBIT_API_KEY, BYBIT_API_SECRET
 
 # Создаем директорию для логов
 log_dir = "logs"
@@ -16,32 +20,30 @@ if not os.path.exists(log_dir):
 current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 log_file = os.path.join(log_dir, f"trading_engine_{current_time}.log")
 
-# Создаем логгер для trading_engine
-logger = logging.getLogger("trading_engine")
-logger.setLevel(logging.INFO)
+# Создаем логгер для trading_engine (запись в файл и консоль выполняется в фоновом потоке)
+setup_logger("trading_engine", log_file, mode='w')
 
-# Создаем файловый обработчик
-file_handler = logging.FileHandler(log_file, mode='w', encoding='utf-8')
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(file_handler)
-
-# Добавляем консольный обработчик
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(console_handler)
+ALERT_TO_TELEGRAM_SECONDS = REGISTRY.histogram(
+    "trading_engine_alert_to_telegram_seconds", "От оповещения PriceMonitor до отправки в Telegram, с"
+)
+SIGNALS = REGISTRY.counter("trading_engine_signals_total", "Сигналов входа и отмены сценария", ("signal",))
 
 class TradingEngine:
-    def __init__(self, price_monitor):
+    def __init__(self, price_monitor, send_message=None, fast_path=None):
         self.logger = logging.getLogger("trading_engine")
         self.logger.info("Инициализация TradingEngine")
         print("Инициализация TradingEngine...")
 
         self.price_monitor = price_monitor
+        # Функция отправки сообщений в Telegram (в orchestrator.py — общий TelegramSender)
+        self.send_message = send_message or send_telegram_message
         self.last_alert_count = 0  # Для отслеживания новых оповещений
         self.long_alerts = {}  # Словарь: {symbol: [timestamps]}
         self.short_alerts = {}  # Словарь: {symbol: [timestamps]}
         self.long_window_start = None  # Начало окна для LONG после первых 3 оповещений
         self.short_window_start = None  # Начало окна для SHORT после первых 3 оповещений
+        # Быстрый путь входа (fast_path.FastPath): ордера готовятся при открытии окна, отправляются по решению о входе
+        self.fast_path = fast_path
         self.running = True
 
     def process_new_alerts(self):
@@ -61,10 +63,14 @@ class TradingEngine:
 
                 # Формируем сообщение о пересечении
                 alert_msg = f"Пересечение уровня {alert_type} для {symbol}: цена {price} {'<=' if alert_type == 'LONG' else '>='} {level}"
+                if alert.get("backfilled"):
+                    alert_msg += f" (пропущено при разрыве потока, {alert['timestamp']})"
                 self.logger.info(f"Обработка нового оповещения: {alert}")
                 print(f"Обработка нового оповещения: {alert}")
                 # Отправляем сообщение в Telegram
-                send_telegram_message(alert_msg)
+                self.send_message(alert_msg)
+                if "detected_at" in alert:
+                    ALERT_TO_TELEGRAM_SECONDS.observe(time.time() - alert["detected_at"])
 
                 # Обновляем счетчики
                 if alert_type == "LONG":
@@ -84,6 +90,13 @@ class TradingEngine:
 
             self.last_alert_count = current_alert_count
 
+            # Монеты открытого окна: быстрый путь готовит их ордера заранее
+            if self.fast_path:
+                if self.long_window_start:
+                    self.fast_path.arm("LONG", self.long_alerts)
+                if self.short_window_start:
+                    self.fast_path.arm("SHORT", self.short_alerts)
+
             # Проверяем условия для "Входа" и "Отмены"
             self.check_entry_conditions()
             self.check_cancellation_conditions()
@@ -97,7 +110,10 @@ class TradingEngine:
             long_count = len(self.long_alerts)
             time_diff = (current_time - self.long_window_start).total_seconds() / 60
             if long_count >= 3 and time_diff >= ALERT_TIMEOUT_MINUTES:
-                send_telegram_message("Вход в сделку LONG")
+                if self.fast_path:
+                    self.fast_path.fire("LONG")  # До сообщения: отправка ордеров не ждет Telegram
+                self.send_message("Вход в сделку LONG")
+                SIGNALS.inc("entry_long")
                 self.logger.info("Отправлено оповещение: Вход в сделку LONG")
                 print("Отправлено оповещение: Вход в сделку LONG")
                 # Сбрасываем счетчики после входа
@@ -109,7 +125,10 @@ class TradingEngine:
             short_count = len(self.short_alerts)
             time_diff = (current_time - self.short_window_start).total_seconds() / 60
             if short_count >= 3 and time_diff >= ALERT_TIMEOUT_MINUTES:
-                send_telegram_message("Вход в сделку SHORT")
+                if self.fast_path:
+                    self.fast_path.fire("SHORT")  # До сообщения: отправка ордеров не ждет Telegram
+                self.send_message("Вход в сделку SHORT")
+                SIGNALS.inc("entry_short")
                 self.logger.info("Отправлено оповещение: Вход в сделку SHORT")
                 print("Отправлено оповещение: Вход в сделку SHORT")
                 # Сбрасываем счетчики после входа
@@ -129,7 +148,10 @@ class TradingEngine:
                     # Первые 3 монеты — это базовые, остальные — "другие"
                     other_long_count = len(self.long_alerts) - 3
                     if other_long_count >= 5:
-                        send_telegram_message("Отмена сценария LONG")
+                        self.send_message("Отмена сценария LONG")
+                        if self.fast_path:
+                            self.fast_path.disarm("LONG")
+                        SIGNALS.inc("cancel_long")
                         self.logger.info("Отправлено оповещение: Отмена сценария LONG")
                         print("Отправлено оповещение: Отмена сценария LONG")
                         # Сбрасываем счетчики
@@ -145,7 +167,10 @@ class TradingEngine:
                     # Первые 3 монеты — это базовые, остальные — "другие"
                     other_short_count = len(self.short_alerts) - 3
                     if other_short_count >= 5:
-                        send_telegram_message("Отмена сценария SHORT")
+                        self.send_message("Отмена сценария SHORT")
+                        if self.fast_path:
+                            self.fast_path.disarm("SHORT")
+                        SIGNALS.inc("cancel_short")
                         self.logger.info("Отправлено оповещение: Отмена сценария SHORT")
                         print("Отправлено оповещение: Отмена сценария SHORT")
                         # Сбрасываем счетчики
@@ -160,6 +185,8 @@ class TradingEngine:
         try:
             while self.running:
                 self.process_new_alerts()
+                if self.fast_path:
+                    self.fast_path.refresh()
                 time.sleep(5)  # Проверяем новые оповещения каждые 5 секунд
         except KeyboardInterrupt:
             self.logger.info("Остановлено пользователем")
@@ -173,11 +200,22 @@ class TradingEngine:
             self.price_monitor.running = False
 
 if __name__ == "__main__":
+    start_from_config()
+
     # Инициализируем PriceMonitor
     price_monitor = PriceMonitor()
 
+    # Быстрый путь входа: в отдельном контейнере только режим "auto" — кнопки обрабатывает
+    # Telegram-приложение TradeManager, которое работает в этом же процессе только в orchestrator.py
+    fast_path = None
+    if FAST_PATH_MODE == "confirm":
+        logging.getLogger("trading_engine").warning("FAST_PATH_MODE=confirm работает только в orchestrator.py с trade_manager, быстрый путь выключен")
+    elif FAST_PATH_MODE == "auto":
+        fast_path = build_fast_path(price_monitor.google_sheets, BybitAPI(BYBIT_API_KEY, BYBIT_API_SECRET),
+                                    get_default_sender(), price_store=price_monitor.price_fetcher.store)
+
     # Инициализируем TradingEngine
-    trading_engine = TradingEngine(price_monitor)
+    trading_engine = TradingEngine(price_monitor, fast_path=fast_path)
 
     # Запускаем PriceMonitor в отдельном потоке
     monitor_thread = threading.Thread(target=price_monitor.run)
@@ -3,6 +3,7 @@ import threading
 import time
 from google_sheets import GoogleSheetsClient
 from bybit_api import BybitAPI
+from storage import create_storage
 from config import GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID
 
 # Настройка логирования с поддержкой UTF-8
@@ -21,6 +22,7 @@ def update_prices():
     # Инициализация клиентов
     sheets_client = GoogleSheetsClient(GOOGLE_SHEETS_CREDENTIALS, GOOGLE_SHEETS_ID)
     bybit_api = BybitAPI()
+    storage = create_storage()
 
     # Запуск WebSocket в отдельном потоке для получения текущих цен
     threading.Thread(target=bybit_api.start_websocket, daemon=True).start()
@@ -39,14 +41,11 @@ def update_prices():
     # Бесконечный цикл для обновления цен
     logger.info("Начало цикла обновления текущих цен")
     while True:
-        # Получение всех данных таблицы для извлечения символов
-        all_data = sheet.get_all_values()
-        if len(all_data) < 2:  # Проверяем, есть ли данные (учитывая заголовок)
-            logger.error("В листе database отсутствуют монеты, сначала запустите populate_static_data.py")
+        # Символы берем из локального хранилища (порядок совпадает со строками листа database)
+        symbols = list(storage.get_instruments())
+        if not symbols:
+            logger.error("В хранилище отсутствуют монеты, сначала запустите populate_static_data.py")
             return
-
-        # Извлекаем символы из колонки A (пропускаем заголовок)
-        symbols = [row[0] for row in all_data[1:] if row[0]]
         logger.info(f"Получено {len(symbols)} символов для обновления цен")
 
         # Обновление текущей цены для каждой монеты
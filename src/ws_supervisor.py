@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+import numpy as np
+from metrics import REGISTRY
+from config import (WS_SHARD_SIZE, WS_STALE_CONNECTION_SECONDS, WS_STALE_SYMBOL_SECONDS,
+                    WS_RECONNECT_MAX_SECONDS, WS_WATCHDOG_INTERVAL_SECONDS)
+
+SHARD_UP = REGISTRY.gauge("ws_shard_up", "Шард WebSocket подключен и получает тики (1/0)", ("shard",))
+RECONNECTS = REGISTRY.counter("ws_reconnects_total", "Переподключений шардов WebSocket", ("reason",))
+DOWNTIME_SECONDS = REGISTRY.histogram("ws_downtime_seconds", "Разрыв потока шарда: от последнего тика до первого после восстановления, с")
+STALE_SYMBOLS = REGISTRY.gauge("ws_stale_symbols", "Символов без тиков дольше WS_STALE_SYMBOL_SECONDS")
+
+class FeedShard:
+    """Группа символов на одном WebSocket-соединении."""
+
+    def __init__(self, index, symbols, symbol_ids):
+        self.index = index
+        self.symbols = list(symbols)
+        self.symbol_ids = np.array(symbol_ids, dtype=np.int64)
+        self.ws = None
+        self.connected_at = 0.0
+        self.last_message = 0.0  # Локальное время последнего тика шарда
+        self.down_since = None  # Время обнаружения разрыва (None — шард работает)
+        self.gap_start = None  # Последний тик перед разрывом
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.stale_symbols = set()  # Символы, по которым шард уже перезапускался в текущем эпизоде
+
+class FeedSupervisor:
+    """Следит за WebSocket-потоком тикеров и восстанавливает его по шардам.
+
+    Символы делятся на шарды по WS_SHARD_SIZE, у каждого шарда свое соединение pybit без
+    встроенного переподключения. Фоновый поток раз в WS_WATCHDOG_INTERVAL_SECONDS проверяет
+    шарды: соединение разорвано, нет тиков дольше WS_STALE_CONNECTION_SECONDS или символ молчит
+    дольше WS_STALE_SYMBOL_SECONDS — тогда переподключается только этот шард с экспоненциальной
+    задержкой, подписки восстанавливаются из сохраненного списка символов без проверки через REST.
+    После восстановления вызываются gap_listeners(symbols, gap_start, gap_end) — для добора
+    пропущенных пересечений.
+    """
+
+    def __init__(self, bybit_api, store, symbols, callback, notify=None, shard_size=WS_SHARD_SIZE):
+        self.logger = logging.getLogger(__name__)
+        self.bybit_api = bybit_api
+        self.store = store
+        self.callback = callback
+        self.notify = notify
+        self.gap_listeners = []
+        self.running = False
+        self.thread = None
+        symbols = list(symbols)
+        shard_size = max(shard_size, 1)
+        self.shards = [
+            FeedShard(index, symbols[start:start + shard_size], [store.add_symbol(s) for s in symbols[start:start + shard_size]])
+            for index, start in enumerate(range(0, len(symbols), shard_size))
+        ]
+
+    def start(self):
+        """Подключает все шарды и запускает сторожевой поток."""
+        self.running = True
+        for shard in self.shards:
+            SHARD_UP.set(str(shard.index), value=int(self._connect(shard, time.time())))
+        self.thread = threading.Thread(target=self.run, daemon=True, name="ws-supervisor")
+        self.thread.start()
+        self.logger.info(f"Поток тикеров: {sum(len(s.symbols) for s in self.shards)} символов в {len(self.shards)} шардах")
+        return self
+
+    def stop(self):
+        self.running = False
+        for shard in self.shards:
+            self._close(shard)
+
+    def run(self):
+        while self.running:
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error(f"Ошибка проверки потока тикеров: {e}")
+            time.sleep(WS_WATCHDOG_INTERVAL_SECONDS)
+
+    def _handler(self, shard):
+        # Горячий путь: только отметка времени шарда и передача тика дальше
+        def on_tick(symbol, last_price, exchange_ts):
+            shard.last_message = time.time()
+            self.callback(symbol, last_price, exchange_ts)
+        return on_tick
+
+    def _close(self, shard):
+        if shard.ws is not None:
+            try:
+                shard.ws.exit()
+            except Exception as e:
+                self.logger.debug(f"Ошибка закрытия шарда {shard.index}: {e}")
+            shard.ws = None
+
+    def _connect(self, shard, now):
+        self._close(shard)
+        try:
+            shard.ws = self.bybit_api.create_websocket(restart_on_error=False)
+            self.bybit_api.subscribe_to_ticker(shard.symbols, self._handler(shard), ws=shard.ws)
+        except Exception as e:
+            self.logger.error(f"Не удалось подключить шард {shard.index}: {e}")
+            self._close(shard)
+            return False
+        shard.connected_at = time.time()
+        self.logger.info(f"Шард {shard.index} подключен: {len(shard.symbols)} символов")
+        return True
+
+    def _problem(self, shard, now):
+        """Причина перезапуска шарда или None."""
+        if shard.ws is None or not shard.ws.is_connected():
+            return "disconnected"
+        last = max(shard.last_message, shard.connected_at)
+        if now - last > WS_STALE_CONNECTION_SECONDS:
+            return "stale_connection"
+        # Символ, который раньше тикал, а теперь молчит: перезапуск шарда один раз за эпизод
+        times = self.store.times[shard.symbol_ids]
+        stale = {shard.symbols[i] for i in np.flatnonzero((times > 0) & (now - times > WS_STALE_SYMBOL_SECONDS)).tolist()}
+        shard.stale_symbols &= stale
+        if stale - shard.stale_symbols:
+            shard.stale_symbols |= stale
+            return "stale_symbol"
+        return None
+
+    def check(self, now=None):
+        now = now or time.time()
+        for shard in self.shards:
+            if shard.down_since is not None:
+                if shard.ws is not None and shard.last_message > shard.connected_at:
+                    self._recovered(shard)
+                elif now >= shard.next_attempt:
+                    self._attempt(shard, now)
+                continue
+            reason = self._problem(shard, now)
+            if reason:
+                self._down(shard, reason, now)
+        STALE_SYMBOLS.set(value=sum(len(shard.stale_symbols) for shard in self.shards))
+
+    def restart_all(self, reason="manual"):
+        """Переподключает все шарды (например, по команде), не проверяя символы заново."""
+        now = time.time()
+        for shard in self.shards:
+            if shard.down_since is None:
+                self._down(shard, reason, now)
+
+    def _down(self, shard, reason, now):
+        shard.down_since = now
+        shard.gap_start = shard.last_message or shard.connected_at
+        shard.failures = 0
+        RECONNECTS.inc(reason)
+        SHARD_UP.set(str(shard.index), value=0)
+        message = f"Поток цен: шард {shard.index} ({len(shard.symbols)} символов) — {reason}, переподключение"
+        if reason == "stale_symbol":
+            message += f"; без тиков: {', '.join(sorted(shard.stale_symbols)[:10])}"
+        self.logger.warning(message)
+        self._notify(message)
+        self._attempt(shard, now)
+
+    def _attempt(self, shard, now):
+        """Попытка переподключения; следующая — через 1, 2, 4... с (до WS_RECONNECT_MAX_SECONDS), если тики не пойдут."""
+        self._connect(shard, now)
+        shard.failures += 1
+        shard.next_attempt = now + min(2 ** shard.failures, WS_RECONNECT_MAX_SECONDS)
+
+    def _recovered(self, shard):
+        gap_end = shard.last_message
+        downtime = max(gap_end - shard.gap_start, 0.0)
+        DOWNTIME_SECONDS.observe(downtime)
+        SHARD_UP.set(str(shard.index), value=1)
+        shard.down_since = None
+        shard.failures = 0
+        message = f"Поток цен: шард {shard.index} восстановлен, разрыв {downtime:.1f} с"
+        self.logger.info(message)
+        self._notify(message)
+        for listener in self.gap_listeners:
+            try:
+                listener(list(shard.symbols), shard.gap_start, gap_end)
+            except Exception as e:
+                self.logger.error(f"Ошибка обработчика разрыва потока: {e}")
+
+    def _notify(self, message):
+        if self.notify is not None:
+            try:
+                self.notify(message)
+            except Exception as e:
+                self.logger.error(f"Не удалось отправить уведомление о потоке цен: {e}")